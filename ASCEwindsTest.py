@@ -0,0 +1,176 @@
+# Comparing the ASCE 7 wind lookups with the legacy code, on the IFFpackage data
+#   ASCE7Table (ASCEwinds_table.py) against readASCE7winds() of FailureAnalyses.py, at every bus, line vertex and plant
+#   ASCE7Grids (ASCEwinds_interp.py) against the grid nodes of ASCEwinds_get_*.dat
+#   ASCE7Fetcher (ASCEwinds_fetch.py) with a stub transport instead of windspeed.atcouncil.org
+# Run from the repository directory: python ASCEwindsTest.py
+
+import os
+import socket
+import tempfile
+import shutil
+import numpy as np
+import shapefile
+
+from TestReport import check, report
+from ASCEwinds_table import ASCE7Table, readASCE7file
+from ASCEwinds_interp import ASCE7Grids
+from ASCEwinds_fetch import ASCE7Fetcher, ASCE7Cache, buildASCE7query
+
+# Legacy lookup of FailureAnalyses.py: scans the file for the text of the coordinates
+def readASCE7winds(which_ASCE7_file,ilon,ilat):
+    asce_705_mph =float('nan')     # Default value
+    asce_710_RCiii_mph = float('nan')  # Default value
+    f = open(which_ASCE7_file, 'r')  #Open file for reading only
+    for ii in range(6):
+        line = f.readline() # Header lines
+    for line in f.readlines():
+        splitted_line = line.split('    ')
+        lat_buff = splitted_line[0]
+        lon_buff = splitted_line[1]
+        asce_705_buff = splitted_line[2]
+        asce_710_RCiii_buff= splitted_line[3]
+        if (lat_buff == str(ilat)) and (lon_buff == str(ilon)):
+            asce_705_mph = int(asce_705_buff)
+            asce_710_RCiii_mph = int(asce_710_RCiii_buff)
+            break  # Terminate the for loop ==> stop reading lines
+    f.close()
+    return (asce_705_mph, asce_710_RCiii_mph)
+
+def sameWinds(a, b):
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    return np.array_equal(np.isnan(a), np.isnan(b)) and np.array_equal(a[~np.isnan(a)], b[~np.isnan(b)])
+
+# Every site of the layer, plus sites moved off the listed coordinates (not in the file)
+def testTable(which_ASCE7_file, layer):
+    lons = np.array([lon for shape in layer.shapes() for lon, lat in shape.points])
+    lats = np.array([lat for shape in layer.shapes() for lon, lat in shape.points])
+    lons = np.concatenate((lons, lons[:5] + 0.001))
+    lats = np.concatenate((lats, lats[:5]))
+    # as Python floats, as read from the shapefile: the legacy code matches the text of str(float)
+    legacy = np.array([readASCE7winds(which_ASCE7_file, lon, lat) for lon, lat in zip(lons.tolist(), lats.tolist())])
+    table = ASCE7Table(which_ASCE7_file)
+    asce_705_mph, asce_710_RCiii_mph = table.lookup(lons, lats)
+    check('ASCE7Table vs readASCE7winds, ' + os.path.basename(which_ASCE7_file),
+          sameWinds(legacy[:, 0], asce_705_mph) and sameWinds(legacy[:, 1], asce_710_RCiii_mph),
+          '(%d sites, %d found)' % (len(lons), np.isfinite(asce_705_mph).sum()))
+    check('ASCE7Table.lookupOne vs readASCE7winds, ' + os.path.basename(which_ASCE7_file),
+          sameWinds(legacy[0], table.lookupOne(float(lons[0]), float(lats[0]))) and
+          sameWinds(legacy[-1], table.lookupOne(float(lons[-1]), float(lats[-1]))))
+
+# At the grid nodes the interpolation returns the node values (NaN over water and in Special Wind Regions),
+# and half-way between 4 nodes over land their mean
+def testGrids(which_ASCE7_files):
+    grids = ASCE7Grids(which_ASCE7_files)
+    for which_ASCE7_file in which_ASCE7_files:
+        lats, lons, asce_705, asce_710_RCiii, special, names = readASCE7file(which_ASCE7_file)
+        # nodes of a coarser grid inside a finer one are interpolated from the finer one
+        fine = [grid for grid in grids.grids if grid.filename == which_ASCE7_file][0]
+        own = np.ones(len(lats), dtype=bool)
+        for grid in grids.grids[:grids.grids.index(fine)]:
+            own &= ~grid.covers(lons, lats)
+        lats, lons, asce_705, asce_710_RCiii, special = lats[own], lons[own], asce_705[own], asce_710_RCiii[own], special[own]
+        asce_705_mph, asce_710_RCiii_mph = grids.lookup(lons, lats)
+        asce_705[special] = np.nan
+        asce_710_RCiii[special] = np.nan
+        check('ASCE7Grids at the nodes of ' + which_ASCE7_file,
+              sameWinds(asce_705, asce_705_mph) and sameWinds(asce_710_RCiii, asce_710_RCiii_mph),
+              '(%d nodes, %d over land)' % (len(lats), np.isfinite(asce_705_mph).sum()))
+        check('ASCE7Grids.specialRegion at the nodes of ' + which_ASCE7_file, np.array_equal(grids.specialRegion(lons, lats), special),
+              '(%d special)' % special.sum())
+
+        if (fine is not grids.grids[0]):
+            continue
+        i = np.arange(len(fine.lats) - 1)[:, None]
+        j = np.arange(len(fine.lons) - 1)[None, :]
+        mean = 0.25 * (fine.asce_705_mph[i, j] + fine.asce_705_mph[i + 1, j] + fine.asce_705_mph[i, j + 1] + fine.asce_705_mph[i + 1, j + 1])
+        mean[(fine.special[i, j] | fine.special[i + 1, j] | fine.special[i, j + 1] | fine.special[i + 1, j + 1])] = np.nan
+        midLats = np.broadcast_to(0.5 * (fine.lats[:-1] + fine.lats[1:])[:, None], mean.shape)
+        midLons = np.broadcast_to(0.5 * (fine.lons[:-1] + fine.lons[1:])[None, :], mean.shape)
+        asce_705_mph, asce_710_RCiii_mph = grids.lookup(midLons.ravel(), midLats.ravel())
+        check('ASCE7Grids half-way between the nodes of ' + which_ASCE7_file,
+              np.array_equal(np.isnan(mean.ravel()), np.isnan(asce_705_mph)) and
+              np.allclose(mean.ravel()[~np.isnan(mean.ravel())], asce_705_mph[~np.isnan(asce_705_mph)]))
+
+# Answers the way the website does: redirected to a url holding the winds, here made up from the coordinates
+class StubTransport(object):
+    def __init__(self, failures=0, error=socket.error):
+        self.requests = []
+        self.failures = failures    # first requests that fail
+        self.error = error
+    def get(self, full_url):
+        self.requests.append(full_url)
+        if (len(self.requests) <= self.failures):
+            raise self.error('stub failure')
+        return full_url + '&asce_705=%d&risk_category_iii=%d' % (len(full_url), len(full_url) + 20)
+
+def testFetcher(sites):
+    directory = tempfile.mkdtemp()
+    try:
+        checkpoint = os.path.join(directory, 'ASCEwinds_get.dat.checkpoint')
+        transport = StubTransport(failures=2)
+        fetcher = ASCE7Fetcher(transport=transport, workers=4, requests_per_second=1000.0, backoff_s=0.001,
+                               checkpoint=checkpoint, verbose=False)
+        winds = fetcher.fetch(sites)
+        expected = dict(((ilon, ilat), (str(len(buildASCE7query(fetcher.url, ilon, ilat))),
+                                        str(len(buildASCE7query(fetcher.url, ilon, ilat)) + 20))) for ilon, ilat in sites)
+        distinct = len(set(sites))
+        check('ASCE7Fetcher winds from the stub transport', winds == expected,
+              '(%d sites, %d distinct, %d requests)' % (len(sites), distinct, len(transport.requests)))
+        check('ASCE7Fetcher requests each distinct site once, plus retries', len(transport.requests) == distinct + 2)
+        check('ASCE7Fetcher checkpoint holds every distinct site', len(fetcher.readCheckpoint()) == distinct)
+
+        transport = StubTransport()
+        fetcher = ASCE7Fetcher(transport=transport, requests_per_second=1000.0, checkpoint=checkpoint, verbose=False)
+        check('ASCE7Fetcher resumes from the checkpoint without requests', fetcher.fetch(sites) == expected and len(transport.requests) == 0)
+        fetcher.clearCheckpoint()
+
+        # the cache is filled by one run and answers the next, whatever the checkpoint
+        cache = ASCE7Cache(os.path.join(directory, 'ASCEwinds_cache.sqlite'))
+        fetcher = ASCE7Fetcher(transport=StubTransport(), requests_per_second=1000.0, cache=cache, verbose=False)
+        fetcher.fetch(sites)
+        check('ASCE7Cache holds every distinct site', len(cache) == distinct)
+        cache.close()
+        cache = ASCE7Cache(os.path.join(directory, 'ASCEwinds_cache.sqlite'))
+        transport = StubTransport()
+        fetcher = ASCE7Fetcher(transport=transport, requests_per_second=1000.0, cache=cache, verbose=False)
+        check('ASCE7Fetcher answers from the cache without requests', fetcher.fetch(sites) == expected and len(transport.requests) == 0)
+        check('ASCE7Cache finds a site given with rounding noise', cache.get(sites[0][0] + 1e-9, sites[0][1] - 1e-9) == expected[sites[0]])
+        cache.close()
+
+        transport = StubTransport(failures=len(sites))
+        fetcher = ASCE7Fetcher(transport=transport, requests_per_second=1000.0, retries=1, backoff_s=0.001,
+                               checkpoint=checkpoint, verbose=False)
+        try:
+            fetcher.fetch(sites[:3])
+            check('ASCE7Fetcher raises IOError when sites cannot be retrieved', False)
+        except IOError:
+            check('ASCE7Fetcher raises IOError when sites cannot be retrieved', True)
+        fetcher.clearCheckpoint()
+
+        # an error that is not a network failure is not retried, and the single worker goes on with the other sites
+        transport = StubTransport(failures=1, error=ValueError)
+        fetcher = ASCE7Fetcher(transport=transport, requests_per_second=1000.0, checkpoint=checkpoint, verbose=False)
+        try:
+            fetcher.fetch(sites[:3])
+            check('ASCE7Fetcher raises IOError after any other error', False)
+        except IOError:
+            check('ASCE7Fetcher raises IOError after any other error', len(transport.requests) == len(set(sites[:3])),
+                  '(%d requests)' % len(transport.requests))
+    finally:
+        shutil.rmtree(directory)
+
+# Test data files
+datadir = 'IFFpackage'
+buses = shapefile.Reader(datadir + '/buses')
+lines = shapefile.Reader(datadir + '/lines')
+plants = shapefile.Reader(datadir + '/ngpp_draft_FL')
+
+# Run tests
+testTable(datadir + '/ASCEwinds_getatAssets_epbusesFL.dat', buses)
+testTable(datadir + '/ASCEwinds_getatAssets_eplinesFL.dat', lines)
+testTable(datadir + '/ASCEwinds_getatAssets_ngppFL.dat', plants)
+testGrids(['ASCEwinds_get_20150730.dat', 'ASCEwinds_get_20150803.dat'])
+testFetcher([(lon, lat) for shape in lines.shapes() for lon, lat in shape.points])
+
+report()
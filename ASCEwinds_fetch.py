@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This code retrieves the ASCE 7-05 and ASCE 7-10 design winds from http://windspeed.atcouncil.org
+for many sites at once. It is used by ASCEwinds_get.py and ASCEwinds_getatAssets.py.
+
+- Several requests may be in flight at the same time (workers), so the website latency is overlapped.
+- A token bucket limits the number of requests per second sent to the website, to avoid overloading it.
+  By default this is one request every 6 seconds, as with the former fixed delay after each request,
+  whatever the number of workers; a faster rate must be asked for explicitly.
+- Failed requests are retried, waiting a bit longer after each failure (exponential backoff).
+- Each answer is appended to a checkpoint file as soon as it arrives. If the job is interrupted,
+  running it again with the same checkpoint file only requests the sites that are still missing.
+- The transport (what sends a request and returns the redirected url) can be replaced,
+  e.g., by one pointing at a local stub HTTP server for testing.
+- An optional SQLite cache (ASCE7Cache) keeps every answer ever received, keyed by the quantized site coordinates,
+  and is checked before any request. Layers that share sites (e.g., line vertices, or overlapping asset layers)
+  then only request the sites that were never retrieved before.
+
+Usage:
+fetcher = ASCE7Fetcher(checkpoint='./ASCEwinds_get.dat.checkpoint', cache=ASCE7Cache('./ASCEwinds_cache.sqlite'))
+winds = fetcher.fetch([(ilon, ilat), ...])   # {(ilon, ilat): (asce_705_mph, asce_710_RCiii_mph)}, values as text, 'NaN' over water
+
+Dependencies: threading, Queue, sqlite3, socket, httplib, urllib2, and urllib
+"""
+
+###### DEPENDENCIES ##########################################################################################
+import os
+import time
+import random
+import threading
+import Queue
+import sqlite3
+import socket
+import httplib
+import urllib2
+import urllib
+
+# CONSTANTS
+which_url = 'http://windspeed.atcouncil.org/domains/atcwindspeed/process/'
+default_requests_per_second = 1.0 / 6  # One request every 6 seconds, for all workers together, to avoid website overload
+# Failures of a request that are worth retrying (urllib2.HTTPError is a URLError, socket.timeout a socket.error)
+# Any other exception is not retried, but still makes the site count as not retrieved
+request_errors = (urllib2.URLError, httplib.HTTPException, socket.error, socket.timeout)
+
+
+##### INTERNAL FUNCTIONS/METHODS ##########################################################################################
+
+# URL THAT ASKS THE WEBSITE FOR THE WINDS AT ONE SITE
+def buildASCE7query(url, ilon, ilat):
+    requests = {}  # Define list with website access parameters
+    requests['dec'] ='1'   # This allows display of Lat and Lon values in html file of specified url
+    requests['zoom'] = '4' # This determines the size of the Google map in specified url
+    requests['latt'] = str(ilat)  # '41.7152'
+    requests['longt'] = str(ilon) # '-87.9835'
+    url_values = urllib.urlencode(requests)
+    return url + '?' + url_values
+
+
+# READ THE WINDS FROM THE URL THE WEBSITE REDIRECTS TO
+def parseASCE7url(output_url_string):
+    asce_705_mph = 'NaN'        # Not-a-Number value because the point is not over land
+    asce_710_RCiii_mph = 'NaN'
+    output_url_list = output_url_string.split('&')
+    for item in output_url_list:
+        if (item.find("asce_705") != -1) and (len(item) > 9):
+            asce_705_mph = item[9:]  # Wind Design Load according to ASCE 7-05 (90-years Mean Recurrence Interval) construction code, in miles per hour
+        elif (item.find("risk_category_iii") != -1) and (len(item) > 18):
+            asce_710_RCiii_mph = item[18:] # Wind Design Load according to ASCE 7-10 (Risk Category III-IV) construction code, in miles per hour
+    return asce_705_mph, asce_710_RCiii_mph
+
+
+# DEFAULT TRANSPORT: SENDS THE REQUEST WITH urllib2 AND RETURNS THE REDIRECTED URL
+# Any object with a get(full_url) method returning the redirected url can be used instead
+class Urllib2Transport(object):
+
+    def __init__(self, timeout_s=60):
+        self.timeout_s = timeout_s
+
+    def get(self, full_url):
+        response = urllib2.urlopen(full_url, timeout=self.timeout_s)
+        output_url_string = response.geturl()
+        response.close()
+        return output_url_string
+
+
+# TOKEN BUCKET RATE LIMIT, SHARED BY ALL WORKERS
+# Up to 'burst' requests may be sent at once, and on average no more than 'rate' requests per second
+class TokenBucket(object):
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    # Wait until a token is available, and take it
+    def acquire(self):
+        while True:
+            self.lock.acquire()
+            try:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait_s = (1.0 - self.tokens) / self.rate
+            finally:
+                self.lock.release()
+            time.sleep(wait_s)
+
+
+# PERSISTENT CACHE OF ASCE7 WINDS, SHARED BY ALL LAYERS AND RUNS
+# Sites are keyed by their coordinates rounded to quantum_deg degrees (1e-6 deg is about 0.1 m),
+# so the same vertex read from different shapefiles maps to the same entry.
+class ASCE7Cache(object):
+
+    def __init__(self, filename, quantum_deg=1e-6):
+        self.filename = filename
+        self.quantum_deg = quantum_deg
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)   # shared by the workers, under self.lock
+        self.connection.execute('CREATE TABLE IF NOT EXISTS asce7winds (qlat INTEGER, qlon INTEGER, '
+                                'asce_705_mph TEXT, asce_710_RCiii_mph TEXT, PRIMARY KEY (qlat, qlon))')
+        self.connection.commit()
+
+    def quantize(self, ilon, ilat):
+        return (int(round(float(ilat) / self.quantum_deg)), int(round(float(ilon) / self.quantum_deg)))
+
+    # (asce_705_mph, asce_710_RCiii_mph) as text, or None if the site was never retrieved
+    def get(self, ilon, ilat):
+        self.lock.acquire()
+        try:
+            row = self.connection.execute('SELECT asce_705_mph, asce_710_RCiii_mph FROM asce7winds WHERE qlat=? AND qlon=?',
+                                          self.quantize(ilon, ilat)).fetchone()
+            if row == None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return (str(row[0]), str(row[1]))
+        finally:
+            self.lock.release()
+
+    def put(self, ilon, ilat, winds):
+        self.lock.acquire()
+        try:
+            self.connection.execute('INSERT OR REPLACE INTO asce7winds VALUES (?, ?, ?, ?)',
+                                    self.quantize(ilon, ilat) + (winds[0], winds[1]))
+            self.connection.commit()
+        finally:
+            self.lock.release()
+
+    def __len__(self):
+        self.lock.acquire()
+        try:
+            return self.connection.execute('SELECT COUNT(*) FROM asce7winds').fetchone()[0]
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.connection.close()
+
+
+# CONCURRENT, RATE-LIMITED, RESUMABLE RETRIEVAL OF ASCE7 WINDS
+class ASCE7Fetcher(object):
+
+    def __init__(self, url=which_url, transport=None, workers=1, requests_per_second=default_requests_per_second, burst=1,
+                 retries=4, backoff_s=5.0, checkpoint=None, cache=None, verbose=True):
+        self.url = url
+        if transport == None:
+            transport = Urllib2Transport()
+        self.transport = transport
+        self.workers = workers
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self.retries = retries        # attempts after the first one
+        self.backoff_s = backoff_s    # wait after the first failure, doubled after each further failure
+        self.checkpoint = checkpoint  # file name, None for no checkpoint
+        self.cache = cache            # ASCE7Cache, None for no cache
+        self.verbose = verbose
+        self.lock = threading.Lock()
+
+    # Sites are identified by the exact value of their coordinates
+    def siteKey(self, ilon, ilat):
+        return (repr(float(ilon)), repr(float(ilat)))
+
+    # Answers already in the checkpoint file
+    def readCheckpoint(self):
+        done = {}
+        if self.checkpoint == None or not os.path.exists(self.checkpoint):
+            return done
+        f = open(self.checkpoint, 'r')
+        for line in f:
+            splitted_line = line.rstrip('\r\n').split(',')
+            if len(splitted_line) != 4:
+                continue   # Line cut by an interruption
+            done[(splitted_line[0], splitted_line[1])] = (splitted_line[2], splitted_line[3])
+        f.close()
+        return done
+
+    # Winds at one site, from the cache or else from the website
+    def fetchOne(self, ilon, ilat):
+        if self.cache != None:
+            winds = self.cache.get(ilon, ilat)
+            if winds != None:
+                return winds
+        return self.request(ilon, ilat)
+
+    # Ask the website for the winds at one site, retrying after failures
+    def request(self, ilon, ilat):
+        full_url = buildASCE7query(self.url, ilon, ilat)
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                winds = parseASCE7url(self.transport.get(full_url))
+                if self.cache != None:
+                    self.cache.put(ilon, ilat, winds)
+                return winds
+            except request_errors, error:
+                if attempt >= self.retries:
+                    raise
+                wait_s = self.backoff_s * 2 ** attempt * (0.5 + random.random())
+                if self.verbose:
+                    print 'Request for', ilon, ilat, 'failed (', error, '), retrying in', round(wait_s, 1), 's'
+                time.sleep(wait_s)
+                attempt += 1
+
+    def worker(self, pending, winds, failed, checkpoint_file):
+        while True:
+            try:
+                key, ilon, ilat = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                result = self.request(ilon, ilat)   # the cache was checked when queueing
+                self.lock.acquire()
+                try:
+                    winds[key] = result
+                    if checkpoint_file != None:
+                        checkpoint_file.write(key[0]+','+key[1]+','+result[0]+','+result[1]+'\n')
+                        checkpoint_file.flush()
+                    if self.verbose:
+                        print ilon, ilat, result[0], result[1]
+                finally:
+                    self.lock.release()
+            except Exception, error:   # e.g. a cache or checkpoint write error: only this site fails, the worker goes on
+                self.lock.acquire()
+                failed.append((ilon, ilat, error))
+                self.lock.release()
+
+    # Winds (as text, 'NaN' where the site is not over land) at each (ilon, ilat) site
+    # Raises IOError if some sites could not be retrieved; the others are kept in the checkpoint file.
+    def fetch(self, sites):
+        winds = self.readCheckpoint()
+        pending = Queue.Queue()
+        queued = set()
+        for ilon, ilat in sites:
+            key = self.siteKey(ilon, ilat)
+            if key in winds or key in queued:
+                continue   # Already retrieved, or listed more than once
+            if self.cache != None:
+                cached = self.cache.get(ilon, ilat)
+                if cached != None:
+                    winds[key] = cached
+                    continue
+            queued.add(key)
+            pending.put((key, ilon, ilat))
+        if self.verbose:
+            print len(queued), 'sites to retrieve,', len(winds), 'already in checkpoint or cache'
+
+        checkpoint_file = None
+        if self.checkpoint != None and len(queued) > 0:
+            checkpoint_file = open(self.checkpoint, 'a')
+        failed = []
+        threads = [threading.Thread(target=self.worker, args=(pending, winds, failed, checkpoint_file))
+                   for ii in xrange(min(self.workers, len(queued)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1.0)   # join with a timeout, so that Ctrl-C still stops the job
+        if checkpoint_file != None:
+            checkpoint_file.close()
+
+        if len(failed) > 0:
+            ilon, ilat, error = failed[0]
+            raise IOError('%d sites could not be retrieved from %s (first: %s %s, %s: %s); run again to resume'
+                          % (len(failed), self.url, ilon, ilat, type(error).__name__, error))
+        return dict(((ilon, ilat), winds[self.siteKey(ilon, ilat)]) for ilon, ilat in sites)
+
+    # Remove the checkpoint file, once its contents have been written to the output file
+    def clearCheckpoint(self):
+        if self.checkpoint != None and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+
+'''
+******************************************************************************
+                         ***LICENSE NOTICE***
+******************************************************************************
+Copyright (c) 2015: Open Source Software Distribution MIT License
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+******************************************************************************
+'''
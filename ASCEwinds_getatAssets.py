@@ -10,7 +10,7 @@ Inputs: Shapefiles for critical infrastructures (e.g., Electric Power grid, Natu
 
 References: http://windspeed.atcouncil.org
 
-Dependencies: shapefile, numpy, time, urllib2, and urllib 
+Dependencies: shapefile, numpy, time, ASCEwinds_fetch.py (urllib2 and urllib)
 
 Issues: None
 
@@ -32,6 +32,11 @@ elif which_inputfile == 2:
 elif which_inputfile == 3:
     inputfile = '/Users/edwincampos/Documents/Argonne_Projects/2015_LDRD_Infrastructures/fromRobinson_NGPP/fl_ngpp/ngpp_draft_FL'  # Natural Gas Processing Plant in Florida: Shapefiles WITHOUT file extension
     
+checkpointfile = outputfile + '.checkpoint'  # Answers received so far; rerunning after an interruption resumes from here
+workers = 1                  # Number of requests in flight at the same time
+requests_per_second = 1.0/6  # Rate limit for all workers together (one request every 6 seconds), to avoid website overload
+cachefile = './ASCEwinds_cache.sqlite'  # Answers of all previous runs (any layer, and ASCEwinds_get.py); sites found here are not requested again
+
 # CONSTANT 
 which_url = 'http://windspeed.atcouncil.org/domains/atcwindspeed/process/'
 
@@ -41,52 +46,7 @@ which_url = 'http://windspeed.atcouncil.org/domains/atcwindspeed/process/'
 import shapefile  #http://gis.humboldt.edu/OLM/GSP_318/09_3_ShapefilePY.html or https://code.google.com/p/pyshp/wiki/PyShpDocs
 import numpy as np
 import time
-import urllib2
-import urllib
-
-
-##### INTERNAL FUNCTIONS/METHODS ##########################################################################################
-
-# INTERNAL FUNCTION TO INTERROGATE URL 
-def getASCE7winds(url,ilon,ilat):       
-        # Input values: Desired lat, Lon
-        requests = {}  # Define list with website access parameters
-        requests['dec'] ='1'   # This allows display of Lat and Lon values in html file of specified url
-        requests['zoom'] = '4' # This determines the size of the Google map in specified url
-    
-        requests['latt'] = str(ilat)  # '41.7152'
-        requests['longt'] = str(ilon) # '-87.9835'
-        #requests['dec'] ='1'   # This allows display of Lat and Lon values in html file
-        #requests['zoom'] = '4' # This determines the size of the Google map
-
-        url_values = urllib.urlencode(requests)
-        #print url_values  # The order may differ. 
-        #url = 'http://windspeed.atcouncil.org/domains/atcwindspeed/process/'
-        full_url = url + '?' + url_values
-        #print full_url
-
-        response = urllib2.urlopen(full_url)
-        output_url_string = response.geturl()
-        #print output_url_string
-        ##print response.read()  # This will print the entire htlm code in the file.
-
-        output_url_list = output_url_string.split('&')
-        #which_string = ['asce_705', 'risk_category_iii']
-        for item in output_url_list:
-            if (item.find("asce_705") != -1) and (len(item) <= 9):
-                #print '1:'+item
-                asce_705_mph = 'NaN' #float('NaN')     # Not-a-Number value because the point is not over land
-            elif (item.find("asce_705") != -1) and (len(item) > 9):
-                #print '2:'+item
-                asce_705_mph = item[9:] #float(item[9:])  # Wind Design Load according to ASCE 7-05 (90-years Mean Recurrence Interval) construction code, in miles per hour
-            elif (item.find("risk_category_iii") != -1) and (len(item) <= 18): 
-                #print '3:'+item
-                asce_710_RCiii_mph = 'NaN'     # Not-a-Number value because the point is not over land
-            elif (item.find("risk_category_iii") != -1) and (len(item) > 18):
-                #print '4:'+item
-                asce_710_RCiii_mph = item[18:] # Wind Design Load according to ASCE 7-10 (Risk Category III-IV) construction code, in miles per hour
-            else: continue
-        return asce_705_mph, asce_710_RCiii_mph
+from ASCEwinds_fetch import ASCE7Fetcher, ASCE7Cache
 
 
 ##### INGEST SHAPE FILES ##########################################################################################
@@ -108,20 +68,11 @@ records= sf.records() # Records: dbf file with contents
 
 ##### INTERROGATE WEBSITE AND GENERATE OUTPUTS ##########################################################################################
 
-# OPEN OUTPUT FILE AND START WRITING
-f = open(outputfile, 'w')  #Open output file for writing
-# Write Header lines in output file
-f.write( "Data downloaded from 'http://windspeed.atcouncil.org' on "+ time.strftime("%c %Z")+', where each column corresponds to...\n' )  
-f.write( 'Latitude(degrees, positive north)\n' )
-f.write( 'Longitude(degrees, positive east)\n' )
-f.write( 'ASCE 7-05 Wind speeds (50-years mean recurrence interval for 3-seconds peak gust, in miles-per-hour)\n' )
-f.write( 'ASCE 7-10 Wind speeds (Risk Category III-IV: >1700-years mean recurrence interval for 3-seconds peak gust, in miles-per-hour)\n' )
-f.write( 'Asset name\n')
-    
+# LIST THE SITES OF ALL ASSETS (SHAPES) IN THE SHAPEFILE, AS THEY WILL BE WRITTEN IN THE OUTPUT FILE
+rows = []  # (ilat, ilon, asset_name)
 for ii in xrange(len(shapes)):    #for shape,record in shapes,records:
     shape = shapes[ii]    
         
-    # RETRIEVE THE ASCE 7 WINDS CORRESPONDING TO EACH ASSET (SHAPE) IN THE SHAPEFILE   
     if len(shape.points) == 1:   # This is for cases where the shape correspond to a single lat,lon point
         [[lons,lats]] = shape.points  # Define latitudes and longitudes for a given shape
         if which_inputfile == 1 :        
@@ -129,77 +80,38 @@ for ii in xrange(len(shapes)):    #for shape,record in shapes,records:
         elif which_inputfile == 2:
             asset_name = records[ii][2]
         print(lons,lats,asset_name)
-        #f.write( str(ii)+'    '+str(lats)+'    '+str(lons)+'    '+asset_name+'\n')  # TEST: Write Data
-        
-        ilat = lats
-        ilon = lons
-        
-        # INTERROGATE URL        
-        asce_705_mph, asce_710_RCiii_mph = getASCE7winds(which_url,ilon,ilat)         
-        
-        ''' TO BE DELETED
-        # Input values: Desired lat, Lon
-        #requests = {}
-        requests['latt'] = str(ilat)  # '41.7152'
-        requests['longt'] = str(ilon) # '-87.9835'
-        #requests['dec'] ='1'   # This allows display of Lat and Lon values in html file
-        #requests['zoom'] = '4' # This determines the size of the Google map
-
-        url_values = urllib.urlencode(requests)
-        #print url_values  # The order may differ. 
-        #which_url = 'http://windspeed.atcouncil.org/domains/atcwindspeed/process/'
-        full_url = which_url + '?' + url_values
-        #print full_url
-
-        response = urllib2.urlopen(full_url)
-        output_url_string = response.geturl()
-        #print output_url_string
-        ##print response.read()  # This will print the entire htlm code in the file.
-
-        output_url_list = output_url_string.split('&')
-        #which_string = ['asce_705', 'risk_category_iii']
-        for item in output_url_list:
-            #print item
-            if (item.find("asce_705") != -1) and (len(item) <= 9):
-                #print item
-                asce_705_mph = 'NaN' #float('NaN')     # Not-a-Number value because the point is not over land
-            elif (item.find("asce_705") != -1) and (len(item) > 9):
-                #print item
-                asce_705_mph = item[9:] #float(item[9:])  # Wind Design Load according to ASCE 7-05 (90-years Mean Recurrence Interval) construction code, in miles per hour
-            elif (item.find("risk_category_iii") != -1) and (len(item) <= 18): 
-                #print item
-                asce_710_RCiii_mph = 'NaN'     # Not-a-Number value because the point is not over land
-            elif (item.find("risk_category_iii") != -1) and (len(item) > 18):
-                #print item
-                asce_710_RCiii_mph = item[18:] # Wind Design Load according to ASCE 7-10 (Risk Category III-IV) construction code, in miles per hour
-            else: continue
-        '''
-        
-        # OUTPUT VALUES INTO A FILE
-        f.write(str(ilat)+'    '+str(ilon)+'    '+asce_705_mph+'    '+asce_710_RCiii_mph+'    '+asset_name+'\n')  # Write Data in output file
-        #print "Current date & time " + time.strftime("%c")
-        time.sleep(6)  # Add a delay of 6 seconds to avoid website overload
+        rows.append((lats, lons, asset_name))
         
     else:  # This is for cases where the shape correspond to a line or a polygon
-      lons_lats_list = shape.points
-      lons_lats_array = np.array(lons_lats_list)
-      lons = lons_lats_array[:,0]
-      lats = lons_lats_array[:,1]
       if which_inputfile == 0 : asset_name = 'Line Shape # '+str(records[ii] [8])  # records[ii] [8] corresponds to fields[ii] [8] = ['Branch', 'N', 11, 0], which is the branch number, given as an integer
-      for ilat in lats:
-         for ilon in lons:
-            print(ilon,ilat,asset_name)
-            #f.write( str(ii)+'    '+str(ilat)+'    '+str(ilon)+'    '+asset_name+'\n')  # TEST: Write Data
-            
-            # INTERROGATE URL        
-            asce_705_mph, asce_710_RCiii_mph = getASCE7winds(which_url,ilon,ilat)
-            
-            # OUTPUT VALUES INTO A FILE
-            f.write(str(ilat)+'    '+str(ilon)+'    '+asce_705_mph+'    '+asce_710_RCiii_mph+'    '+asset_name+'\n')  # Write Data in output file
-            #print "Current date & time " + time.strftime("%c")
-            time.sleep(6)  # Add a delay of 6 seconds to avoid website overload
+      for ilon, ilat in shape.points:  # One site per vertex of the line or polygon
+         rows.append((ilat, ilon, asset_name))
+
+# RETRIEVE THE ASCE 7 WINDS CORRESPONDING TO EACH SITE
+# Requests run concurrently under a rate limit; each site is only requested once, and an interrupted run resumes from checkpointfile
+cache = ASCE7Cache(cachefile)
+fetcher = ASCE7Fetcher(which_url, workers=workers, requests_per_second=requests_per_second, checkpoint=checkpointfile,
+                       cache=cache)
+winds = fetcher.fetch([(ilon, ilat) for ilat, ilon, asset_name in rows])  # Raises IOError if some sites could not be retrieved; run again to resume
+cache.close()
+
+# OPEN OUTPUT FILE AND START WRITING
+f = open(outputfile, 'w')  #Open output file for writing
+# Write Header lines in output file
+f.write( "Data downloaded from 'http://windspeed.atcouncil.org' on "+ time.strftime("%c %Z")+', where each column corresponds to...\n' )  
+f.write( 'Latitude(degrees, positive north)\n' )
+f.write( 'Longitude(degrees, positive east)\n' )
+f.write( 'ASCE 7-05 Wind speeds (50-years mean recurrence interval for 3-seconds peak gust, in miles-per-hour)\n' )
+f.write( 'ASCE 7-10 Wind speeds (Risk Category III-IV: >1700-years mean recurrence interval for 3-seconds peak gust, in miles-per-hour)\n' )
+f.write( 'Asset name\n')
+
+for ilat, ilon, asset_name in rows:
+    asce_705_mph, asce_710_RCiii_mph = winds[(ilon, ilat)]
+    # OUTPUT VALUES INTO A FILE
+    f.write(str(ilat)+'    '+str(ilon)+'    '+asce_705_mph+'    '+asce_710_RCiii_mph+'    '+asset_name+'\n')  # Write Data in output file
             
 f.close()
+fetcher.clearCheckpoint()  # All answers are in the output file now
 
 '''
 ******************************************************************************
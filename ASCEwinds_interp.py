@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This code interpolates the ASCE 7-05 and ASCE 7-10 design winds at any site,
+from the regional grids previously downloaded by ASCEwinds_get.py
+(e.g., ASCEwinds_get_20150730.dat and ASCEwinds_get_20150803.dat).
+
+Each grid is read once into 2-D arrays, and the winds at arrays of sites are obtained by bilinear
+interpolation between the 4 surrounding grid nodes. This way a new asset layer can be analyzed
+right away, without downloading the winds at every asset with ASCEwinds_getatAssets.py.
+
+The result is NaN (masked) where any of the grid nodes used for a site is
+- over water (windspeed.atcouncil.org returns no value), or
+- in a Special Wind Region (the building code gives no value; a climate expert must be consulted), or
+- missing from the file (e.g., the download was interrupted).
+
+Usage:
+grids = ASCE7Grids(['ASCEwinds_get_20150730.dat', 'ASCEwinds_get_20150803.dat'])
+asce_705_mph, asce_710_RCiii_mph = grids.lookup(lons, lats)
+special = grids.specialRegion(lons, lats)    # True where a Special Wind Region was masked
+
+When several grids are given, the finest grid covering a site is used.
+
+Dependencies: numpy, ASCEwinds_table.py
+"""
+
+###### DEPENDENCIES ##########################################################################################
+import numpy as np
+from ASCEwinds_table import readASCE7file
+
+
+##### INTERNAL FUNCTIONS/METHODS ##########################################################################################
+
+# Sorted distinct coordinates of a grid axis, merging values that only differ by rounding
+def gridAxis(values, tolerance_deg=1e-7):
+    values = np.sort(values)
+    if len(values) == 0:
+        return values
+    distinct = np.concatenate(([True], np.diff(values) > tolerance_deg))
+    return values[distinct]
+
+
+# ASCE7 WINDGUST LOADS ON ONE REGULAR LATITUDE-LONGITUDE GRID
+class ASCE7Grid(object):
+
+    def __init__(self, which_ASCE7_file=None):
+        self.filename = which_ASCE7_file
+        self.lats = np.zeros(0)                 # grid latitudes, ascending
+        self.lons = np.zeros(0)                 # grid longitudes, ascending
+        self.asce_705_mph = np.zeros((0, 0))    # [latitude, longitude] nodes
+        self.asce_710_RCiii_mph = np.zeros((0, 0))
+        self.special = np.zeros((0, 0), dtype=bool)
+        if which_ASCE7_file != None:
+            self.load(which_ASCE7_file)
+
+    def load(self, which_ASCE7_file):
+        self.filename = which_ASCE7_file
+        lats, lons, asce_705, asce_710_RCiii, special, names = readASCE7file(which_ASCE7_file)
+        self.lats = gridAxis(lats)
+        self.lons = gridAxis(lons)
+
+        # nodes missing from the file stay NaN
+        shape = (len(self.lats), len(self.lons))
+        self.asce_705_mph = np.empty(shape)
+        self.asce_705_mph.fill(np.nan)
+        self.asce_710_RCiii_mph = self.asce_705_mph.copy()
+        self.special = np.zeros(shape, dtype=bool)
+        if len(lats) == 0:
+            return
+        ilat = self.nearestNode(self.lats, lats)
+        ilon = self.nearestNode(self.lons, lons)
+        self.asce_705_mph[ilat, ilon] = asce_705
+        self.asce_710_RCiii_mph[ilat, ilon] = asce_710_RCiii
+        self.special[ilat, ilon] = special
+
+    def nearestNode(self, axis, values):
+        upper = np.clip(np.searchsorted(axis, values), 1, max(1, len(axis) - 1))
+        lower = upper - 1
+        if len(axis) == 1:
+            return np.zeros(len(values), dtype=int)
+        return np.where(np.abs(axis[upper] - values) < np.abs(values - axis[lower]), upper, lower)
+
+    # Grid spacing (the smaller of the latitude and longitude spacing), used to rank grids
+    def resolution(self):
+        spacing = [np.min(np.diff(axis)) for axis in (self.lats, self.lons) if len(axis) > 1]
+        if len(spacing) == 0:
+            return np.inf
+        return min(spacing)
+
+    # Sites inside the grid
+    def covers(self, lons, lats):
+        if len(self.lats) < 2 or len(self.lons) < 2:
+            return np.zeros(np.shape(lons), dtype=bool)
+        return (lats >= self.lats[0]) & (lats <= self.lats[-1]) & (lons >= self.lons[0]) & (lons <= self.lons[-1])
+
+    # Bilinear interpolation at arrays of sites inside the grid
+    # Returns ASCE 7-05 winds, ASCE 7-10 winds, and the Special Wind Region flags
+    def interpolate(self, lons, lats):
+        lons = np.asarray(lons, dtype=float)
+        lats = np.asarray(lats, dtype=float)
+        i = np.clip(np.searchsorted(self.lats, lats, side='right') - 1, 0, len(self.lats) - 2)
+        j = np.clip(np.searchsorted(self.lons, lons, side='right') - 1, 0, len(self.lons) - 2)
+        fy = (lats - self.lats[i]) / (self.lats[i + 1] - self.lats[i])
+        fx = (lons - self.lons[j]) / (self.lons[j + 1] - self.lons[j])
+
+        asce_705_mph = np.zeros(lons.shape)
+        asce_710_RCiii_mph = np.zeros(lons.shape)
+        masked = np.zeros(lons.shape, dtype=bool)
+        special = np.zeros(lons.shape, dtype=bool)
+        for di, dj, weight in ((0, 0, (1 - fy) * (1 - fx)), (0, 1, (1 - fy) * fx),
+                               (1, 0, fy * (1 - fx)), (1, 1, fy * fx)):
+            used = weight > 0.0   # nodes with no weight (site on a grid line) do not mask the result
+            node_705 = self.asce_705_mph[i + di, j + dj]
+            node_710 = self.asce_710_RCiii_mph[i + di, j + dj]
+            node_special = self.special[i + di, j + dj]
+            masked |= used & (np.isnan(node_705) | np.isnan(node_710) | node_special)
+            special |= used & node_special
+            asce_705_mph += np.where(used, weight * np.nan_to_num(node_705), 0.0)
+            asce_710_RCiii_mph += np.where(used, weight * np.nan_to_num(node_710), 0.0)
+        asce_705_mph[masked] = np.nan
+        asce_710_RCiii_mph[masked] = np.nan
+        return asce_705_mph, asce_710_RCiii_mph, special
+
+
+# ASCE7 WINDGUST LOADS FROM ONE OR SEVERAL GRIDS
+class ASCE7Grids(object):
+
+    def __init__(self, which_ASCE7_files=[]):
+        self.grids = []
+        for which_ASCE7_file in which_ASCE7_files:
+            self.append(which_ASCE7_file)
+
+    def append(self, which_ASCE7_file):
+        self.grids.append(ASCE7Grid(which_ASCE7_file))
+        self.grids.sort(key=lambda grid: grid.resolution())   # finest first
+
+    def interpolate(self, lons, lats):
+        lons = np.atleast_1d(np.asarray(lons, dtype=float))
+        lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        asce_705_mph = np.empty(lons.shape)
+        asce_705_mph.fill(np.nan)
+        asce_710_RCiii_mph = asce_705_mph.copy()
+        special = np.zeros(lons.shape, dtype=bool)
+        pending = np.isfinite(lons) & np.isfinite(lats)
+        for grid in self.grids:
+            inside = pending & grid.covers(lons, lats)
+            if not inside.any():
+                continue
+            asce_705_mph[inside], asce_710_RCiii_mph[inside], special[inside] = grid.interpolate(lons[inside], lats[inside])
+            pending &= ~inside
+        return asce_705_mph, asce_710_RCiii_mph, special
+
+    # ASCE 7-05 and ASCE 7-10 winds (mph) at arrays of sites, NaN where masked or outside every grid
+    def lookup(self, lons, lats):
+        asce_705_mph, asce_710_RCiii_mph, special = self.interpolate(lons, lats)
+        return asce_705_mph, asce_710_RCiii_mph
+
+    # ASCE 7-05 and ASCE 7-10 winds (mph) at one site
+    def lookupOne(self, ilon, ilat):
+        asce_705_mph, asce_710_RCiii_mph = self.lookup([ilon], [ilat])
+        return (float(asce_705_mph[0]), float(asce_710_RCiii_mph[0]))
+
+    # True where the winds were masked because of a Special Wind Region
+    def specialRegion(self, lons, lats):
+        return self.interpolate(lons, lats)[2]
+
+
+# Grids already read, by list of file names, so that each file is only parsed once per run
+loaded_grids = {}
+
+def loadASCE7grids(which_ASCE7_files):
+    key = tuple(which_ASCE7_files)
+    if key not in loaded_grids:
+        loaded_grids[key] = ASCE7Grids(which_ASCE7_files)
+    return loaded_grids[key]
+
+
+'''
+******************************************************************************
+                         ***LICENSE NOTICE***
+******************************************************************************
+Copyright (c) 2015: Open Source Software Distribution MIT License
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+******************************************************************************
+'''
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This code loads the ASCE 7-05 and ASCE 7-10 design winds previously downloaded
+by ASCEwinds_getatAssets.py (or ASCEwinds_get.py) and looks them up for arrays of sites.
+
+Each file is read once, and its sites are put into a KD-tree, so that looking up
+thousands of assets (or transmission line vertices) does not re-read the file for every asset,
+and coordinates are matched within a tolerance instead of by their text representation.
+
+Usage:
+table = ASCE7Table('ASCEwinds_getatAssets_eplinesFL.dat')
+asce_705_mph, asce_710_RCiii_mph = table.lookup(lons, lats)      # arrays, NaN where the site is not in the file
+asce_705_mph, asce_710_RCiii_mph = table.lookupOne(ilon, ilat)   # a single site
+
+Inputs: ASCII files with 'latitude    longitude    ASCE7-05    ASCE7-10    asset name' lines (ASCEwinds_getatAssets.py),
+        or 'latitude,longitude,ASCE7-05,ASCE7-10' lines (ASCEwinds_get.py), after a few header lines
+Outputs: ASCE 7-05 and ASCE 7-10 (Risk Category III-IV) 3-second peak gusts, in miles per hour
+
+Dependencies: numpy, scipy
+"""
+
+###### DEPENDENCIES ##########################################################################################
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+##### INTERNAL FUNCTIONS/METHODS ##########################################################################################
+
+# Convert a downloaded wind value into a number
+# 'NaN' is returned by windspeed.atcouncil.org for sites that are not over land,
+# and 'Special%20Wind%20Region' where the code gives no value (a climate expert must be consulted)
+def parseASCE7value(text):
+    text = text.strip()
+    if text.find('Special') != -1:
+        return float('nan'), True
+    try:
+        return float(text), False
+    except ValueError:
+        return float('nan'), False
+
+
+# READ A FILE WITH ASCE7 WINDGUST LOADS
+# Header lines are skipped (any line whose latitude and longitude are not numbers).
+# Returns arrays of latitudes, longitudes, ASCE 7-05 winds, ASCE 7-10 winds, Special Wind Region flags, and asset names
+def readASCE7file(which_ASCE7_file):
+    lats = []
+    lons = []
+    asce_705 = []
+    asce_710_RCiii = []
+    special = []
+    names = []
+    f = open(which_ASCE7_file, 'r')  #Open file for reading only
+    for line in f:
+        line = line.rstrip('\r\n')
+        splitted_line = line.split('    ')   # ASCEwinds_getatAssets.py separates columns with 4 blank spaces
+        if len(splitted_line) < 4:
+            splitted_line = line.split(',')  # ASCEwinds_get.py separates columns with commas
+        if len(splitted_line) < 4:
+            continue
+        try:
+            lat = float(splitted_line[0])
+            lon = float(splitted_line[1])
+        except ValueError:
+            continue   # Header line
+        value_705, special_705 = parseASCE7value(splitted_line[2])
+        value_710, special_710 = parseASCE7value(splitted_line[3])
+        lats.append(lat)
+        lons.append(lon)
+        asce_705.append(value_705)
+        asce_710_RCiii.append(value_710)
+        special.append(special_705 or special_710)
+        if len(splitted_line) > 4:
+            names.append('    '.join(splitted_line[4:]))
+        else:
+            names.append('')
+    f.close()
+    return (np.array(lats, dtype=float), np.array(lons, dtype=float), np.array(asce_705, dtype=float),
+            np.array(asce_710_RCiii, dtype=float), np.array(special, dtype=bool), names)
+
+
+# ASCE7 WINDGUST LOADS OF ONE FILE, INDEXED BY COORDINATE
+# tolerance_deg is the largest distance (in degrees) between a requested site and a site in the file for them to match.
+# The default is well below the precision of the coordinates written by ASCEwinds_getatAssets.py,
+# so the matches are the same as comparing the coordinates as text.
+class ASCE7Table(object):
+
+    def __init__(self, which_ASCE7_file=None, tolerance_deg=1e-6):
+        self.filename = which_ASCE7_file
+        self.tolerance_deg = tolerance_deg
+        self.lats = np.zeros(0)
+        self.lons = np.zeros(0)
+        self.asce_705_mph = np.zeros(0)
+        self.asce_710_RCiii_mph = np.zeros(0)
+        self.special = np.zeros(0, dtype=bool)
+        self.names = []
+        self.tree = None
+        if which_ASCE7_file != None:
+            self.load(which_ASCE7_file)
+
+    def load(self, which_ASCE7_file):
+        self.filename = which_ASCE7_file
+        lats, lons, asce_705, asce_710_RCiii, special, names = readASCE7file(which_ASCE7_file)
+
+        # Lines share vertices, so the same site can be listed many times: keep its first line, as a text search would
+        first = {}
+        for ii in range(len(lats)):
+            first.setdefault((lats[ii], lons[ii]), ii)
+        keep = np.array(sorted(first.values()), dtype=int)
+
+        self.lats = lats[keep]
+        self.lons = lons[keep]
+        self.asce_705_mph = asce_705[keep]
+        self.asce_710_RCiii_mph = asce_710_RCiii[keep]
+        self.special = special[keep]
+        self.names = [names[ii] for ii in keep]
+        if len(keep) > 0:
+            self.tree = cKDTree(np.column_stack((self.lons, self.lats)))
+        else:
+            self.tree = None
+
+    # Position of each requested site in the table, -1 where there is no site within tolerance_deg
+    def find(self, lons, lats):
+        lons = np.atleast_1d(np.asarray(lons, dtype=float))
+        lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        rows = -np.ones(lons.shape, dtype=int)
+        if self.tree == None:
+            return rows
+        valid = np.isfinite(lons) & np.isfinite(lats)
+        distance, nearest = self.tree.query(np.column_stack((lons[valid], lats[valid])), k=1, distance_upper_bound=self.tolerance_deg)
+        rows[valid] = np.where(np.isfinite(distance), nearest, -1)
+        return rows
+
+    # ASCE 7-05 and ASCE 7-10 winds (mph) at arrays of sites, NaN where the site is not in the table
+    def lookup(self, lons, lats):
+        rows = self.find(lons, lats)
+        found = (rows >= 0)
+        asce_705_mph = np.empty(rows.shape)
+        asce_705_mph.fill(np.nan)
+        asce_710_RCiii_mph = asce_705_mph.copy()
+        asce_705_mph[found] = self.asce_705_mph[rows[found]]
+        asce_710_RCiii_mph[found] = self.asce_710_RCiii_mph[rows[found]]
+        return asce_705_mph, asce_710_RCiii_mph
+
+    # ASCE 7-05 and ASCE 7-10 winds (mph) at one site
+    def lookupOne(self, ilon, ilat):
+        asce_705_mph, asce_710_RCiii_mph = self.lookup([ilon], [ilat])
+        return (float(asce_705_mph[0]), float(asce_710_RCiii_mph[0]))
+
+
+# Tables already read, by file name, so that each file is only parsed once per run
+loaded_tables = {}
+
+def loadASCE7table(which_ASCE7_file):
+    if which_ASCE7_file not in loaded_tables:
+        loaded_tables[which_ASCE7_file] = ASCE7Table(which_ASCE7_file)
+    return loaded_tables[which_ASCE7_file]
+
+
+'''
+******************************************************************************
+                         ***LICENSE NOTICE***
+******************************************************************************
+Copyright (c) 2015: Open Source Software Distribution MIT License
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+******************************************************************************
+'''
@@ -3,9 +3,13 @@
 #   Asset classes
 #       Asset           the root class -- don't instantiate, it's basically abstract
 #       AssetList       contains potentially mixed list of any kind of Asset
+#       AssetTable      the same assets as typed columns (struct of arrays), with AssetRow views for code that wants objects
+#   readAssetColumns()  an asset text DB parsed into those columns, without building an Asset per entry
 
 import random
-from Fragility import FragilityList
+import numpy as np
+from Fragility import FragilityList, ThresholdCache
+from TextDB import loadTextDB, collectorPaused
 import matplotlib.pyplot as plt
 
 class name2obj(object):
@@ -22,6 +26,7 @@ class Asset(object):
         self.version = 'Penultimate 6.0beta'    # this version
         self.date = 'Manana'        # date this asset description created in db
         self.geometry = [0,0]       # [latitude,longitude]
+        self.Zo = 0.03              # terrain surface roughness around the asset (m), for wind fragilities
         self.destroyed = False
         #self.fragilities = dict()   # a list of fragility objects, each for a different disaster type
         self.fragilities = FragilityList()
@@ -52,6 +57,8 @@ class Asset(object):
                 self.geometry[1] = float(value)
             if (keyword == 'latlong'):
                 self.geometry = [float(s) for s in value.split(' ')]
+            if (keyword == 'roughness' or keyword == 'zo'):    # meters
+                self.Zo = float(value)
             if (keyword == 'fragility class'):
                 disasterfragilitypairs = [s for s in value.split(',')]
                 for pair in disasterfragilitypairs:
@@ -61,40 +68,69 @@ class Asset(object):
                     # self.fragilities[DisasterClassID] = name2obj()
                     # self.fragilities[DisasterClassID].name = df[1].strip()
                     # self.fragilities[DisasterClassID].obj = None
-                    self.fragilities.entries[fragilityType] = self.fragilities.fragilityTypeMappings[fragilityType]()
-                    self.fragilities.entries[fragilityType].DClassName = DisasterClassID
+                    self.addFragility(DisasterClassID, fragilityType)
+
+    def addFragility(self, DisasterClassID, fragilityType):
+        self.fragilities.entries[fragilityType] = self.fragilities.fragilityTypeMappings[fragilityType]()
+        self.fragilities.entries[fragilityType].DClassName = DisasterClassID
+
+    # What configureFromTextLines read, as a tuple of plain values (see assetRecords)
+    def toRecord(self):
+        fragilities = tuple([(getattr(f, 'DClassName', f.disasterType), fragilityType)
+                             for fragilityType, f in self.fragilities.entries.items()])
+        return (self.version, self.date, self.name, self.description, self.assetClassName,
+                tuple(self.geometry), self.Zo, fragilities)
+
+    def configureFromRecord(self, record):
+        (self.version, self.date, self.name, self.description, self.assetClassName,
+         geometry, self.Zo, fragilities) = record
+        self.geometry = list(geometry)
+        for DisasterClassID, fragilityType in fragilities:
+            self.addFragility(DisasterClassID, fragilityType)
 
     # TODO: looks incomplete...
-    def isDestroyed(self, criteria, mode = 'simpleThreshold'):
-
-        for f in self.fragilities.entries.values(): # for each fragility
-            # which hazard will destroy us?
-            intensity = f.disasterObj.getIntensity(self.geometry[0], self.geometry[1])
-            # print self.geometry, intensity, criteria
-            #probabilityOfAnnihilation = f.probability(criteria)
-            if (mode == 'simpleThreshold'):
-                threshold = None
-
-                # TODO: Need generalized
-                if (f.disasterType == 'Wind'):
-                    threshold = f.MPHfromZoLossRatio(0.03, criteria)
-                elif (f.disasterType == 'Flood'):
-                    threshold = 0.5
-                print 'intensity %f threshold %f' % (intensity, threshold)
-
-                if (intensity > threshold):
-                    self.destroyed = True
-                    break
-            elif (mode == 'stochastic'):
-                # TODO: Random number needs to be more carefully generated.
-                if (intensity > random.random()):
-                    self.destroyed = True
-                    break
-            elif (mode == 'everythingMustGo'):
-                self.destroyed = True
-                break
-
-        return self.destroyed        # logical OR of all of the above
+    # thresholds: the ThresholdCache of the scenario, shared by all assets (a private one if not given)
+    def isDestroyed(self, criteria, mode = 'simpleThreshold', thresholds = None):
+        return self.assess(criteria, mode, thresholds)[0]
+
+    # isDestroyed, with the intensity and threshold that decided it (see assessAsset)
+    def assess(self, criteria, mode = 'simpleThreshold', thresholds = None):
+        destroyed, intensity, threshold = assessAsset(self.fragilities, self.geometry[0], self.geometry[1], self.Zo, criteria, mode, thresholds)
+        if (destroyed):
+            self.destroyed = True
+        return self.destroyed, intensity, threshold        # logical OR of all of the above
+
+# Is an asset at (lat, lon), with terrain roughness Zo, destroyed by any of its fragilities?
+def destroyedBy(fragilities, lat, lon, Zo, criteria, mode = 'simpleThreshold', thresholds = None):
+    return assessAsset(fragilities, lat, lon, Zo, criteria, mode, thresholds)[0]
+
+# destroyedBy, also returning the intensity and threshold compared: those of the fragility that destroyed the asset,
+# or else of the last one tried (the random draw in 'stochastic' mode; NaN when nothing was compared)
+def assessAsset(fragilities, lat, lon, Zo, criteria, mode = 'simpleThreshold', thresholds = None):
+    if (thresholds == None):
+        thresholds = ThresholdCache()
+
+    intensity = float('nan')
+    threshold = float('nan')
+    for f in fragilities.entries.values():      # for each fragility
+        # which hazard will destroy us?
+        intensity = f.disasterObj.getIntensity(lat, lon)
+        # print self.geometry, intensity, criteria
+        #probabilityOfAnnihilation = f.probability(criteria)
+        if (mode == 'simpleThreshold'):
+            threshold = thresholds.threshold(f, Zo, criteria)
+
+            if (intensity > threshold):
+                return True, intensity, threshold
+        elif (mode == 'stochastic'):
+            # TODO: Random number needs to be more carefully generated.
+            threshold = random.random()
+            if (intensity > threshold):
+                return True, intensity, threshold
+        elif (mode == 'everythingMustGo'):
+            return True, intensity, float('nan')
+
+    return False, intensity, threshold
 
 #EXAMPLE# def isDestroyed(WFCinstance,Zo,mph,threshLoss):
 #EXAMPLE#     # thresh is building Loss Ratio
@@ -112,52 +148,46 @@ class AssetList:
         self.description = ''
         self.entries = dict()
 
+    # the text is only parsed when it changed since the last run (see TextDB)
     def appendAssetTypesFromFile(self, filename):            # should this be:    appendTypesFromFile()
-        assetFile = open(filename,'r')
-        linesoftext = assetFile.readlines()
-        
-        newestEntry = len(self.entries)
-        startLine = -1
-        endLine = -1
-        lineNumber = 0
-        createNewEntry = 0
-        while (lineNumber < len(linesoftext)):
-            keyvalue = linesoftext[lineNumber].split('=')
-            keyword = keyvalue[0].strip().lower()
-            if (len(keyvalue) > 1):
-                value = keyvalue[1].strip()
-            else:
-                value = ''
-
-            #DEBUG# print('read line: keyword = * %s *' % keyword)
-            # select lines that describe next entry
-            if (keyword == 'version'):              # begins entry configuration section
-                startLine = lineNumber
-            elif (keyword == 'name'):               # ends entry configuration section
-                name = keyvalue[1].strip().strip("'")  # key for asset dict
-            elif (keyword == 'end'):                # ends entry configuration section
-                endLine = lineNumber
-                createNewEntry = 1
-
-            if (createNewEntry == 1):
-                #DEBUG# print('createNewEntry\n')
-                # initialize new asset entry
-                # IMPORTANT -- replace with factory that uses "VERSION" (rename this)
-                #   to decide which subclass of Asset to instantiate here
-                ##2DICT## self.entries.append(Asset())
+        with collectorPaused():
+            for name, record in assetRecords(loadTextDB(filename, 'assets', readAssetColumns)):
                 self.entries[name] = Asset()
-                # fill the object with the data
-                ##2DICT## self.entries[newestEntry].configureFromTextLines(linesoftext,startLine,endLine)
-                self.entries[name].configureFromTextLines(linesoftext,startLine,endLine)
-                # createNewEntry housekeeping
-                createNewEntry = 0
-                startLine = -1
-                endLine = -1
-                newestEntry += 1
-
-            # while loop housekeeping
-            lineNumber += 1
-        assetFile.close()
+                self.entries[name].configureFromRecord(record)
+
+    # list of (name, Asset.toRecord()) described in a text DB
+    def readAssetTypesFromFile(self, filename):
+        return assetRecords(readAssetColumns(filename))
+
+    # Terrain surface roughness of every asset from a land-cover roughness layer
+    #   roughness(lons, lats) returns Zo (m) at arrays of sites, e.g. a lookup on a roughness raster
+    def assignRoughness(self, roughness):
+        names = sorted(self.entries)
+        lats = np.array([self.entries[name].geometry[0] for name in names], dtype=float)
+        lons = np.array([self.entries[name].geometry[1] for name in names], dtype=float)
+        Zo = np.asarray(roughness(lons, lats), dtype=float)
+        for name, z in zip(names, Zo):
+            self.entries[name].Zo = float(z)
+
+    # Threshold of wind fragility f at every asset, for its own Zo, interpolated for all assets at once
+    def windThresholds(self, f, criteria):
+        names = sorted(self.entries)
+        Zo = np.array([self.entries[name].Zo for name in names], dtype=float)
+        return dict(zip(names, np.atleast_1d(f.MPHfromZoLossRatio(Zo, criteria))))
+
+    def rows(self):
+        return self.entries.values()
+
+    # latitudes and longitudes of rows()
+    def coordinates(self):
+        rows = self.rows()
+        return (np.array([a.geometry[0] for a in rows], dtype=float),
+                np.array([a.geometry[1] for a in rows], dtype=float))
+
+    # the assets at positions indices of rows()
+    def rowsAt(self, indices):
+        rows = self.rows()
+        return [rows[i] for i in indices]
 
     def display(self, map = None):
 
@@ -185,6 +215,326 @@ class AssetList:
             plt.ylabel('Latitude')
             plt.savefig('Assets.eps', format='eps')
 
+# Columns of the entries of an asset text DB, in file order, read as Asset.configureFromTextLines would:
+#   'key' (the name without quotes, as used by AssetList and AssetTable), 'name', 'version', 'date', 'description',
+#   'assetClass', 'lat', 'lon', 'Zo', and 'fragilities': the 'Fragility Class' pairs of the entry, one per
+#   fragility type (the last one given wins), sorted and written back as 'Disaster:Type,Disaster:Type'
+def readAssetColumns(filename):
+    assetFile = open(filename,'r')
+    linesoftext = assetFile.readlines()
+    assetFile.close()
+
+    fields = ('key', 'name', 'version', 'date', 'description', 'assetClass', 'lat', 'lon', 'Zo', 'fragilities')
+    columns = dict([(field, []) for field in fields])
+    defaults = Asset()
+    key = ''
+    entry = None
+    for line in linesoftext:
+        keyvalue = line.split('=')
+        keyword = keyvalue[0].strip().lower()
+        if (len(keyvalue) > 1):
+            value = keyvalue[1].strip()
+        else:
+            value = ''
+
+        # select lines that describe next entry
+        if (keyword == 'version'):              # begins entry configuration section
+            entry = {'name': defaults.name, 'version': value, 'date': defaults.date,
+                     'description': defaults.description, 'assetClass': defaults.assetClassName,
+                     'lat': defaults.geometry[0], 'lon': defaults.geometry[1], 'Zo': defaults.Zo, 'fragilities': {}}
+        elif (keyword == 'end'):                # ends entry configuration section
+            if (entry != None):
+                entry['key'] = key
+                entry['fragilities'] = ','.join(['%s:%s' % pair for pair in
+                                                 sorted([(d, t) for t, d in entry['fragilities'].items()])])
+                for field in fields:
+                    columns[field].append(entry[field])
+            entry = None
+        elif (keyword == 'name'):
+            key = value.strip("'")              # key for asset dict
+            if (entry != None):
+                entry['name'] = value
+        elif (entry == None):
+            continue
+        elif (keyword == 'date'):
+            entry['date'] = value
+        elif (keyword == 'description'):
+            entry['description'] = value
+        elif (keyword == 'asset class'):
+            entry['assetClass'] = value
+        elif (keyword == 'latitude'):
+            entry['lat'] = float(value)
+        elif (keyword == 'longitude'):
+            entry['lon'] = float(value)
+        elif (keyword == 'latlong'):
+            entry['lat'], entry['lon'] = [float(s) for s in value.split()]
+        elif (keyword == 'roughness' or keyword == 'zo'):    # meters
+            entry['Zo'] = float(value)
+        elif (keyword == 'fragility class'):
+            for DisasterClassID, fragilityType in fragilityPairs(value):
+                entry['fragilities'][fragilityType] = DisasterClassID
+
+    for field in fields:
+        if (field in ('lat', 'lon', 'Zo')):
+            columns[field] = np.array(columns[field], dtype=float)
+        else:
+            columns[field] = np.array(columns[field], dtype=str)
+    return columns
+
+# (disaster class, fragility type) pairs of a 'Fragility Class' value, e.g. 'Wind:WindCurves, Flood:Threshold'
+def fragilityPairs(value):
+    pairs = []
+    for pair in value.split(','):
+        df = pair.split(':')
+        if (len(df) > 1):
+            pairs.append((df[0].strip(), df[1].strip()))
+    return tuple(pairs)
+
+# (key, Asset.toRecord()) of every row of readAssetColumns
+def assetRecords(columns):
+    return [(key, (version, date, name, description, assetClass, (lat, lon), Zo, fragilityPairs(fragilities)))
+            for key, version, date, name, description, assetClass, lat, lon, Zo, fragilities in
+            zip(columns['key'], columns['version'], columns['date'], columns['name'], columns['description'],
+                columns['assetClass'], columns['lat'].tolist(), columns['lon'].tolist(), columns['Zo'].tolist(),
+                columns['fragilities'])]
+
+# AssetTable -- assets as typed NumPy columns, one row per asset
+#   names, asset class codes, latitudes, longitudes, Zo, fragility class codes and destroyed flags.
+#   Asset class and fragility class strings are stored once, in classNames and fragilityClasses,
+#   and every row only keeps their index. All rows share one FragilityList (see CoupledContext.linkAssets2Fragilities),
+#   and a row is assessed with the fragilities of that list that its fragility class names (see fragilitiesOf).
+#   table[i] and table.row(name) return an AssetRow: a small view of one row, with the attributes and
+#   isDestroyed() of an Asset, that reads and writes the columns.
+class AssetTable(object):
+    def __init__(self):
+        self.description = ''
+        self.names = np.zeros(0, dtype='S1')
+        self.classCodes = np.zeros(0, dtype=np.int32)       # index in classNames
+        self.lats = np.zeros(0)
+        self.lons = np.zeros(0)
+        self.Zo = np.zeros(0)                               # terrain surface roughness (m)
+        self.fragilityCodes = np.zeros(0, dtype=np.int32)   # index in fragilityClasses
+        self.destroyed = np.zeros(0, dtype=bool)
+        self.classNames = []            # asset class names
+        self.fragilityClasses = []      # tuples of (disaster class, fragility type) pairs read for an asset
+        self.fragilities = FragilityList()
+        self.fragilitiesByCode = dict()     # fragilitiesOf each fragility class code, for fragilitiesLinked
+        self.fragilitiesLinked = None       # (list, number of entries) of the fragilities of fragilitiesByCode
+        self.rowOfName = dict()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        return AssetRow(self, i)
+
+    def __iter__(self):
+        for i in xrange(len(self.names)):
+            yield AssetRow(self, i)
+
+    def rows(self):
+        return [AssetRow(self, i) for i in xrange(len(self.names))]
+
+    def row(self, name):
+        return AssetRow(self, self.rowOfName[name])
+
+    def coordinates(self):
+        return self.lats, self.lons
+
+    def rowsAt(self, indices):
+        return [AssetRow(self, i) for i in indices]
+
+    # same text DB (and compiled cache) as AssetList.appendAssetTypesFromFile, without building Asset objects
+    def appendAssetTypesFromFile(self, filename):
+        self.appendColumns(loadTextDB(filename, 'assets', readAssetColumns))
+
+    def appendAssetList(self, assets):
+        self.appendRecords([(name, a.toRecord()) for name, a in assets.entries.items()])
+
+    # records: list of (name, Asset.toRecord())
+    def appendRecords(self, records):
+        fragilities = [','.join(['%s:%s' % pair for pair in sorted(record[7])]) for name, record in records]
+        self.appendColumns({'key': np.array([name for name, record in records], dtype=str),
+                            'assetClass': np.array([record[4] for name, record in records], dtype=str),
+                            'lat': np.array([record[5][0] for name, record in records], dtype=float),
+                            'lon': np.array([record[5][1] for name, record in records], dtype=float),
+                            'Zo': np.array([record[6] for name, record in records], dtype=float),
+                            'fragilities': np.array(fragilities, dtype=str)})
+
+    # columns: as returned by readAssetColumns. A name already in the table, or given again, replaces that row,
+    # as in AssetList: the row keeps its place and takes the values given last
+    def appendColumns(self, columns):
+        keys = columns['key'].tolist()
+        last = dict(zip(keys, xrange(len(keys))))      # row of columns given last for each name
+        newnames = []
+        taken = []                                      # row of columns of each new name
+        replaced = []
+        for name in keys:
+            if (name not in last):                      # given again, already placed
+                continue
+            if (name in self.rowOfName):
+                replaced.append((self.rowOfName[name], last.pop(name)))
+                continue
+            self.rowOfName[name] = len(self.names) + len(newnames)
+            newnames.append(name)
+            taken.append(last.pop(name))
+        taken = np.array(taken, dtype=int)
+        classCodes = self.codesOf(columns['assetClass'], self.classNames, lambda c: c)
+        fragilityCodes = self.codesOf(columns['fragilities'], self.fragilityClasses, fragilityPairs)
+        n = len(newnames)
+        self.names = np.concatenate((self.names, np.array(newnames, dtype=str)))
+        self.classCodes = np.concatenate((self.classCodes, classCodes[taken]))
+        self.lats = np.concatenate((self.lats, columns['lat'][taken]))
+        self.lons = np.concatenate((self.lons, columns['lon'][taken]))
+        self.Zo = np.concatenate((self.Zo, columns['Zo'][taken]))
+        self.fragilityCodes = np.concatenate((self.fragilityCodes, fragilityCodes[taken]))
+        self.destroyed = np.concatenate((self.destroyed, np.zeros(n, dtype=bool)))
+        for i, j in replaced:
+            self.classCodes[i], self.lats[i], self.lons[i] = classCodes[j], columns['lat'][j], columns['lon'][j]
+            self.Zo[i], self.fragilityCodes[i] = columns['Zo'][j], fragilityCodes[j]
+            self.destroyed[i] = False
+
+    # Index in names (extended with the values not in it yet, as key(value)) of every value of a text column
+    def codesOf(self, values, names, key):
+        distinct, inverse = np.unique(values, return_inverse=True)
+        code = dict([(name, c) for c, name in enumerate(names)])
+        codes = []
+        for value in distinct.tolist():
+            value = key(value)
+            if (value not in code):
+                code[value] = len(names)
+                names.append(value)
+            codes.append(code[value])
+        return np.array(codes, dtype=np.int32)[inverse]
+
+    # The FragilityList of the fragilities of the table named by fragility class code: for every
+    # (disaster class, name) pair, the fragility of that class if name is one, or else every fragility of
+    # that disaster type and of that fragility type (e.g. 'Wind:WindCurves'). Kept until fragilities changes.
+    # An asset without a Fragility Class line is assessed with every fragility of the table, as formerly;
+    # a name that is neither a fragility class nor a fragility type raises KeyError.
+    def fragilitiesOf(self, code):
+        linked = (self.fragilities, len(self.fragilities.entries))
+        if (self.fragilitiesLinked == None or self.fragilitiesLinked[0] is not linked[0]
+                or self.fragilitiesLinked[1] != linked[1]):
+            self.fragilitiesByCode = dict()
+            self.fragilitiesLinked = linked
+        if (code not in self.fragilitiesByCode):
+            fragilities = FragilityList()
+            if (len(self.fragilityClasses[code]) == 0):
+                fragilities.entries.update(self.fragilities.entries)
+            for DisasterClassID, name in self.fragilityClasses[code]:
+                if (name in self.fragilities.entries):
+                    fragilities.entries[name] = self.fragilities.entries[name]
+                    continue
+                if (name not in fragilities.fragilityTypeMappings):
+                    raise KeyError('%s:%s is neither a fragility class nor a fragility type' % (DisasterClassID, name))
+                ftype = fragilities.fragilityTypeMappings[name]
+                for fclass, f in self.fragilities.entries.items():
+                    if (getattr(f, 'disasterType', None) == DisasterClassID and isinstance(f, ftype)):
+                        fragilities.entries[fclass] = f
+            self.fragilitiesByCode[code] = fragilities
+        return self.fragilitiesByCode[code]
+
+    # asset class name of every row
+    def assetClasses(self):
+        return np.array(self.classNames, dtype=object)[self.classCodes]
+
+    # Terrain surface roughness of every asset from a land-cover roughness layer, see AssetList.assignRoughness
+    def assignRoughness(self, roughness):
+        self.Zo = np.asarray(roughness(self.lons, self.lats), dtype=float).reshape(len(self.names))
+
+    # Threshold of wind fragility f at every row, for its own Zo
+    def windThresholds(self, f, criteria):
+        return np.atleast_1d(f.MPHfromZoLossRatio(self.Zo, criteria))
+
+    def display(self, map = None):
+
+        if (map == None):
+            plt.figure()
+
+        for destroyed, MARKER, COLOR in ((False, 'o', 'b'), (True, 'x', 'r')):
+            which = (self.destroyed == destroyed)
+            x = self.lons[which]
+            y = self.lats[which]
+            if (map == None):
+                plt.scatter(x, y, marker=MARKER, c=COLOR)
+            else:
+                x, y = map(x, y)
+                map.scatter(x, y, marker=MARKER, c=COLOR)
+
+        if (map == None):
+            plt.title('Assets')
+            plt.xlabel('Longitude')
+            plt.ylabel('Latitude')
+            plt.savefig('Assets.eps', format='eps')
+
+# One row of an AssetTable, looking like an Asset
+class AssetRow(object):
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, AssetRow) and self.table is other.table and self.index == other.index
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((id(self.table), self.index))
+
+    @property
+    def name(self):
+        return str(self.table.names[self.index])
+
+    @property
+    def assetClassName(self):
+        return self.table.classNames[self.table.classCodes[self.index]]
+
+    @property
+    def geometry(self):
+        return [float(self.table.lats[self.index]), float(self.table.lons[self.index])]
+
+    @geometry.setter
+    def geometry(self, latlon):
+        self.table.lats[self.index], self.table.lons[self.index] = latlon[0], latlon[1]
+
+    @property
+    def Zo(self):
+        return float(self.table.Zo[self.index])
+
+    @Zo.setter
+    def Zo(self, value):
+        self.table.Zo[self.index] = value
+
+    @property
+    def fragilityClass(self):
+        return self.table.fragilityClasses[self.table.fragilityCodes[self.index]]
+
+    @property
+    def fragilities(self):
+        return self.table.fragilitiesOf(self.table.fragilityCodes[self.index])
+
+    @property
+    def destroyed(self):
+        return bool(self.table.destroyed[self.index])
+
+    @destroyed.setter
+    def destroyed(self, value):
+        self.table.destroyed[self.index] = value
+
+    def isDestroyed(self, criteria, mode = 'simpleThreshold', thresholds = None):
+        return self.assess(criteria, mode, thresholds)[0]
+
+    def assess(self, criteria, mode = 'simpleThreshold', thresholds = None):
+        lat, lon = self.geometry
+        destroyed, intensity, threshold = assessAsset(self.fragilities, lat, lon, self.Zo, criteria, mode, thresholds)
+        if (destroyed):
+            self.destroyed = True
+        return self.destroyed, intensity, threshold
+
 
 # usage
 # instantiate a list and load it with data from one or many files ('Hurricane...', 'Earthquake...', etc.)
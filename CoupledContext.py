@@ -2,8 +2,9 @@
 
 from DisasterLayer import DisasterList, Hurricane, Flood
 from Infrastructure import InfrastructureLayer, InfrastructureList
-from Fragility import FragilityList
-from Asset import AssetList
+from Fragility import FragilityList, ThresholdCache
+from Asset import AssetTable
+from ScenarioResults import ScenarioResults
 
 #   Context Classes
 #       Asset           the root class -- don't instantiate, it's basically abstract
@@ -17,8 +18,11 @@ class CoupledContext(object):
         self.date = 'Manana'        # date this asset description created in db
         self.disasters       = DisasterList()       # 
         self.infrastructures = InfrastructureList() #
-        self.assets          = AssetList()          # 
+        self.assets          = AssetTable()         # assets as columns; rows are AssetRow views
         self.fragilities     = FragilityList()      # 
+        self.thresholds      = ThresholdCache()     # fragility thresholds of this scenario, shared by all assets
+        self.linkDistance    = 0.1                  # infrastructure elements own the assets closer than this...
+        self.linkGeographic  = False                # ...in degrees, or in km along the Earth if True
 
         self.disasterLayerMappings = {
             'Wind':Hurricane,
@@ -37,18 +41,47 @@ class CoupledContext(object):
         self.linkFragilities2Disasters()  # tell each Fragility where to find its Disaster data
 
     # Execute the entire coupled problem to remove all destroyed assest from system
-    def generateFirstOrderConsequences(self, criteria):
+    # resultsfilename: also save a row (infrastructure, asset, intensity, threshold, destroyed) for every asset of the
+    # scenario (see ScenarioResults), uncompressed so that loadScenarioResults maps it; compressed=True for a smaller file
+    # that is read in instead
+    def generateFirstOrderConsequences(self, criteria, resultsfilename = None, compressed = False):
         # tuck criteria into it's safe place
         # implement the code on the first page of the Architecture diagram, looping over infrastructures and assets
         # save the appropriate data for use downstream by the iterative simulation code
+        self.fillThresholds(criteria)                       # every threshold the assets will ask for
+        results = ScenarioResults()
+        layers = self.assetLayers()
+        for a in self.assets:                               # each asset once, however many elements it is linked to
+            destroyed, intensity, threshold = a.assess(criteria, thresholds=self.thresholds)
+            results.addRow(layers[a.index], a.name, intensity, threshold, destroyed)
+            if (destroyed):                                 # see if it is destroyed
+                print "Asset (%s) is destroyed." % a.name
         for infra in self.infrastructures.entries.values(): # for each infrastructure
             for elem in infra.elements:                     # for each infrastructure element
-                for a in elem.assets:                       # for each of the assets
-                    if (a.isDestroyed(criteria)):           # see if it is destroyed
-                        print "Asset (%s) is destroyed." % a.name
-                        elem.removed = True                 # mark as destroyed
-                        break
+                if (any([a.destroyed for a in elem.assets])):   # with a destroyed asset
+                    elem.removed = True                     # mark as destroyed
             infra.save(infra.filename)                      # save resulting destroyed infrastructure
+        print 'Fragility thresholds: %d computed, %d reused' % (self.thresholds.misses, self.thresholds.hits)
+        if (resultsfilename != None):
+            results.save(resultsfilename, compressed)
+        return results
+
+    # Infrastructure of each asset row, for the results: that of the first element it is linked to, '' if none
+    def assetLayers(self):
+        layers = [''] * len(self.assets)
+        for infra in self.infrastructures.entries.values():
+            for elem in infra.elements:
+                for a in elem.assets:
+                    if (layers[a.index] == ''):
+                        layers[a.index] = infra.filename
+        return layers
+
+    # Compute once the threshold of each fragility at the Zo of every asset
+    def fillThresholds(self, criteria):
+        if (len(self.assets) == 0):
+            return
+        for f in self.fragilities.entries.values():
+            self.thresholds.fill(f, self.assets.Zo, criteria)
 
     def configureFromTextLines(self, lines, start, end):
         for lineNumber in range(start,end):
@@ -68,6 +101,10 @@ class CoupledContext(object):
                 self.name = value
             if (keyword == 'description'):          # scenario/experiment description
                 self.description = value
+            if (keyword == 'link distance'):        # e.g. 0.1 (degrees) or 10 km
+                tokens = value.strip('\'').split()
+                self.linkDistance = float(tokens[0])
+                self.linkGeographic = (len(tokens) > 1 and tokens[1].lower() == 'km')
             # for d in ['Earthquake', 'Wind', 'Flood', 'Drought', 'StockingRun', 'ZombieWar']:
             #     if (keyword == d.lower()):           # 
             #         self.disasters[d] = XXXXXX() # factory thingy?
@@ -84,7 +121,7 @@ class CoupledContext(object):
 
             # Append fragilities
             if (keyword == 'fragilities'):
-                self.fragilities.appendFragilityTypesFromFile(value.strip('\''))
+                self.fragilities.appendFragilityTypesFromFile(value.strip('\''))   # re-registered: their old thresholds are dropped
 
 ##EXAMPLE##            if (keyword == 'asset class'):
 ##EXAMPLE##                self.assetClassName = value
@@ -130,14 +167,13 @@ class CoupledContext(object):
     #   After this, InfrastructureElement has a set of assets based on geo-location.
     def linkInfrastructures2Assets(self):
         for infra in self.infrastructures.entries.values(): # for each infrastructure
-            for elem in infra.elements:                     # for each infrastructure element
-                elem.findAssets(self.assets)                # find assets of this element
+            infra.linkAssets(self.assets, self.linkDistance, self.linkGeographic)  # all elements at once
 
     # Link each asset to fragilities
     def linkAssets2Fragilities(self):
-        for a in self.assets.entries.values():           # for each asset
-            # TODO: Could this be enough?
-            a.fragilities = self.fragilities
+        # every row of the table shares the fragilities of the table
+        # TODO: Could this be enough?
+        self.assets.fragilities = self.fragilities
             # for f in a.fragilities.entries.values():     # for each fragility of the asset
             #     f.obj = self.fragilities.entries[f.name] # expects fragilitylist to be a dictionary
 
@@ -0,0 +1,117 @@
+# Running a scenario end to end (CoupledContext.generateFirstOrderConsequences), on the IFFpackage buses
+#   every asset is assessed once, as assessAsset assesses it alone: one result row per asset, in the order of the table
+#   the elements linked to a destroyed asset are removed, and saved as outaged in the output layer
+#   the results are saved uncompressed, and memory-mapped by loadScenarioResults
+# Run from the repository directory: python CoupledContextTest.py
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import shapefile
+
+import TextDB
+from TestReport import check, report
+from CoupledContext import CoupledContext
+from Asset import AssetTable, assessAsset
+from Fragility import ThresholdCache
+from Infrastructure import InfrastructureLayer
+from PointShapefile import stampAnalyzedLayer
+from ScenarioResults import loadScenarioResults, RESULT_COLUMNS
+
+# Gusts (mph) growing eastwards over the buses, in place of a hurricane swath
+class EastwardGusts(object):
+    def __init__(self, west, east):
+        self.west = west
+        self.east = east
+
+    def getIntensity(self, lat, long):
+        return 60.0 + 140.0 * (long - self.west) / (self.east - self.west)
+
+# A copy of a layer with an 'Outaged' field, and its stamped output layer, so that save() updates the outages in place
+def writeLayer(layername, directory):
+    reader = shapefile.Reader(layername)
+    source = os.path.join(directory, os.path.basename(layername))
+    writer = shapefile.Writer(source, shapeType=reader.shapeType)
+    writer.fields = [f for f in reader.fields if f[0] != 'DeletionFlag'] + [['Outaged', 'C', 60, 0]]
+    for shape, record in zip(reader.shapes(), reader.records()):
+        writer.shape(shape)
+        writer.record(*(list(record) + ['False']))
+    writer.close()
+    for extension in ('.shp', '.shx', '.dbf'):
+        shutil.copy(source + extension, source + '_analyzed' + extension)
+    stampAnalyzedLayer(source + '_analyzed', source)
+    return source
+
+# Three assets around each bus (not all of them close enough to be linked), and some far from any bus
+def testAssets(buses):
+    points = []
+    rng = np.random.RandomState(2015)
+    for shape in buses.shapes():
+        lon, lat = shape.points[0]
+        points.extend(zip(lat + rng.uniform(-0.15, 0.15, 3), lon + rng.uniform(-0.15, 0.15, 3)))
+    points.extend(zip(rng.uniform(24.0, 25.0, 5), rng.uniform(-80.0, -79.0, 5)))
+    assets = AssetTable()
+    assets.appendRecords([('asset%d' % n, ('Hereld_2015-07-27', '2015-08-24', 'asset%d' % n, '', 'Substation', (lat, lon), 0.03, ()))
+                          for n, (lat, lon) in enumerate(points)])
+    return assets
+
+def testScenario(layername, directory, criteria):
+    source = writeLayer(layername, directory)
+    context = CoupledContext()
+    context.fragilities.appendFragilityTypesFromFile('HurricaneFragilityDB.txt', 'WindCurves')
+    context.assets = testAssets(shapefile.Reader(layername))
+    layer = InfrastructureLayer()
+    layer.load(source)
+    lons = [element.location[1] for element in layer.elements]
+    context.disasters['Wind'] = EastwardGusts(min(lons), max(lons))
+    context.infrastructures.entries[source] = layer
+    context.linkInfrastructures2Assets()
+    context.linkAssets2Fragilities()
+    context.linkFragilities2Disasters()
+
+    resultsname = os.path.join(directory, 'scenario_results.npz')
+    results = context.generateFirstOrderConsequences(criteria, resultsname)
+    columns = results.columns()
+    assets = context.assets
+    check('one result row per asset, in the order of the table', columns['asset'].tolist() == assets.names.tolist(),
+          '(%d assets)' % len(assets))
+
+    legacy = [assessAsset(row.fragilities, row.geometry[0], row.geometry[1], row.Zo, criteria, thresholds=ThresholdCache())
+              for row in assets]
+    check('each asset assessed as assessAsset assesses it alone',
+          np.array_equal(columns['failed'], [destroyed for destroyed, intensity, threshold in legacy]) and
+          np.allclose(columns['intensity'], [intensity for destroyed, intensity, threshold in legacy]) and
+          np.allclose(columns['threshold'], [threshold for destroyed, intensity, threshold in legacy]) and
+          np.array_equal(assets.destroyed, columns['failed']), '(%d destroyed)' % columns['failed'].sum())
+
+    linked = np.zeros(len(assets), dtype=bool)
+    for element in layer.elements:
+        linked[[a.index for a in element.assets]] = True
+    check('result rows name the infrastructure of linked assets',
+          (columns['layer'][linked] == source).all() and (columns['layer'][~linked] == '').all(),
+          '(%d linked, %d not linked)' % (linked.sum(), (~linked).sum()))
+
+    removed = np.array([any([assets.destroyed[a.index] for a in element.assets]) for element in layer.elements])
+    saved = [r[-1] for r in shapefile.Reader(source + '_analyzed').records()]
+    check('elements with a destroyed asset removed and saved as outaged',
+          np.array_equal([element.removed for element in layer.elements], removed) and saved == [str(r) for r in removed],
+          '(%d of %d elements)' % (removed.sum(), len(removed)))
+
+    loaded = loadScenarioResults(resultsname)
+    check('scenario results saved uncompressed and memory-mapped',
+          all([isinstance(loaded[name], np.memmap) and np.array_equal(loaded[name], columns[name]) for name in RESULT_COLUMNS]))
+    del loaded
+
+# Test data files
+TextDB.cacheEnabled = False     # no cache left next to the DB of the repository
+datadir = 'IFFpackage'
+
+# Run tests
+directory = tempfile.mkdtemp()
+try:
+    testScenario(datadir + '/buses', directory, 0.1)
+finally:
+    shutil.rmtree(directory)
+
+report()
@@ -4,13 +4,18 @@
 #   modified on August 25, 2015 by Kibaek Kim
 #   last modified on August 27, 2015 by Kibaek Kim
 
+import os
+import sys
+import hashlib
+import zipfile
 import shapefile
 from mpl_toolkits.basemap import Basemap # This should be included before pyplot.
-from matplotlib.mlab import inside_poly, griddata
+from matplotlib.mlab import griddata
 from matplotlib.tri import Triangulation, LinearTriInterpolator
 import matplotlib.pyplot as plt
-from shapely.geometry.polygon import Polygon
 import numpy as np
+from Geometry import GeometryStore, PolygonHierarchy, PolygonRaster
+from TextDB import loadTextDB
 
 # This class is an abstract class to store data for disasters and to provide damage information at given locations.
 class DisasterLayer(object):
@@ -18,6 +23,7 @@ class DisasterLayer(object):
     def __init__(self):
         self.name = '' # disaster name
         self.data = '' # data content
+        self.store = None # geometry and attributes of data, decoded once (see Geometry.GeometryStore)
         self.unit = '' # unit of intensity value
 
     def open(self, filename, name):
@@ -25,6 +31,7 @@ class DisasterLayer(object):
         self.name = name
         # Read data file
         self.data = shapefile.Reader(filename)
+        self.store = GeometryStore().load(self.data)
 
     def configureFromTextFile(self, filename):
         # TODO: no name here...
@@ -39,24 +46,44 @@ class DisasterLayer(object):
 # Hurricane child class
 #   +open() reads shape files that contain geographic information and wind speed.
 #   +getIntensity() returns gust in MPH at given latitude and longitude.
+#   +getIntensities() returns gusts in MPH at arrays of latitudes and longitudes.
+# Setting rasterResolution (in degrees) before open() rasterizes the swath once, so that most
+# lookups become an array index; points near polygon edges still get the exact polygon test.
 # TODO: We might be able to do a better job if we can decode GRIB1...
 class Hurricane(DisasterLayer):
 
+    def __init__(self):
+        super(Hurricane, self).__init__()
+        self.rasterResolution = None # grid spacing in degrees, None for exact polygon tests only
+        self.raster = None
+
     def open(self, filename, name):
         super(Hurricane, self).open(filename, name)
         self.unit = 'gust_mph'
 
+        self.polygons = [self.store.points(i) for i in xrange(len(self.store))]
+        self.values = self.store.column(1).astype(float)
+        # isotachs are nested: sort them into a containment tree (with a bounding-box index over the
+        # outermost ones), so that each point is only tested against the contours it can be inside
+        self.hierarchy = PolygonHierarchy(self.polygons, self.values)
+        if (self.rasterResolution != None):
+            self.raster = PolygonRaster(self.polygons, self.values, self.rasterResolution)
+
     def getIntensity(self, lat, long):
+        return float(self.getIntensities([lat], [long])[0])
+
+    def getIntensities(self, lats, longs):
 
         # TODO: Test
-        long += 5.0
-        lat += 10.0
+        longs = np.asarray(longs, dtype=float) + 5.0
+        lats = np.asarray(lats, dtype=float) + 10.0
 
-        wind_kt = 0.0 # wind speed in knots
-        for i in xrange(self.data.numRecords):
-            if len(inside_poly([[long, lat]], self.data.shape(i).points)) > 0:
-                # Find the wind corresponding to the bus latutude and longitude
-                wind_kt =  max(wind_kt, float(self.data.record(i)[1]))
+        # Find the wind corresponding to each latitude and longitude
+        if (self.raster == None):
+            wind_kt = self.hierarchy.maxValue(longs, lats) # wind speed in knots
+        else:
+            wind_kt, exact = self.raster.lookup(longs, lats)
+            wind_kt[exact] = self.hierarchy.maxValue(longs[exact], lats[exact])
 
         # Converting from knott to mph (1 kt = 1.15077945 miles per hour)
         wind_mph = wind_kt * 1.15077945
@@ -70,10 +97,9 @@ class Hurricane(DisasterLayer):
         if (map == None):
             plt.figure()
 
-        for i in xrange(self.data.numRecords):
-            x, y = Polygon(self.data.shape(i).points).exterior.xy
-            x = [xi - 5.0 for xi in x]
-            y = [yi - 10.0 for yi in y]
+        for points in self.polygons:
+            x = points[:, 0] - 5.0
+            y = points[:, 1] - 10.0
             if (map == None):
                 plt.plot(x, y)
             else:
@@ -89,27 +115,68 @@ class Hurricane(DisasterLayer):
 # Flood child class
 #   +open() reads shape files that contain geographic information and probability of surge > x.
 #   +getIntensity() returns the probability of surge > x at given latitude and longitude.
+#   +getIntensities() returns the probabilities at arrays of latitudes and longitudes.
+# The Delaunay triangulation of the surge points is saved next to the shape file (<filename>_triangulation.npz),
+# together with a hash of the .shp contents, so that later runs on the same file skip the triangulation.
 # TODO: This does not return "intensity"...
 class Flood(DisasterLayer):
 
+    def __init__(self):
+        super(Flood, self).__init__()
+        self.cacheTriangulation = True # read/write the triangulation cache file
+
     def open(self, filename, name):
         super(Flood, self).open(filename, name)
 
-        self.lon = [self.data.shape(i).points[0][0] for i in xrange(self.data.numRecords)]
-        self.lat = [self.data.shape(i).points[0][1] for i in xrange(self.data.numRecords)]
-        self.val = [self.data.record(i)[1] for i in xrange(self.data.numRecords)]
+        first = self.store.firstPoints()
+        self.lon = first[:, 0]
+        self.lat = first[:, 1]
+        self.val = self.store.column(1).astype(float)
 
-        t = Triangulation(self.lon, self.lat)
+        t = self.triangulate(filename)
         self.interpolator = LinearTriInterpolator(t, self.val)
 
         self.unit = 'probability'
 
+    def triangulate(self, filename):
+
+        if (not self.cacheTriangulation):
+            return Triangulation(self.lon, self.lat)
+
+        shpname = filename if filename.lower().endswith('.shp') else filename + '.shp'
+        cachename = os.path.splitext(shpname)[0] + '_triangulation.npz'
+
+        # hash of the geometry, so that an edited shape file is never matched with an old triangulation
+        sha = hashlib.sha1()
+        shpfile = open(shpname, 'rb')
+        for chunk in iter(lambda: shpfile.read(1 << 20), b''):
+            sha.update(chunk)
+        shpfile.close()
+        digest = sha.hexdigest()
+
+        if (os.path.exists(cachename)):
+            try:
+                with np.load(cachename, allow_pickle=False) as cache:
+                    if (str(cache['digest']) == digest):
+                        return Triangulation(self.lon, self.lat, cache['triangles'])
+            except (IOError, OSError, EOFError, ValueError, KeyError, zipfile.BadZipfile) as error:
+                sys.stderr.write('Ignoring unreadable triangulation cache %s: %s\n' % (cachename, error))
+
+        t = Triangulation(self.lon, self.lat)
+        try:
+            np.savez(cachename, digest=np.array(digest), triangles=t.triangles)
+        except (IOError, OSError) as error:
+            sys.stderr.write('Could not write triangulation cache %s: %s\n' % (cachename, error))
+        return t
+
     def getIntensity(self, lat, long):
+        return float(self.getIntensities([lat], [long])[0])
 
-        surge = 0.0
-        maskedIntensity = self.interpolator(long, lat)
-        if maskedIntensity.mask == False:
-            surge = maskedIntensity.data
+    def getIntensities(self, lats, longs):
+
+        # points outside the triangulation have no surge
+        maskedIntensity = self.interpolator(np.asarray(longs, dtype=float), np.asarray(lats, dtype=float))
+        surge = np.ma.filled(maskedIntensity, 0.0)
 
         return surge
 
@@ -140,6 +207,8 @@ class Flood(DisasterLayer):
 
 # List of disaster classes
 #   +appendDisasterTypesFromFile()
+#   The entries of a <filename>.txt are only parsed when it changed since the last run (see TextDB);
+#   the shape files themselves are always opened.
 # TODO: We have similar classes...
 class DisasterList:
 
@@ -160,12 +229,28 @@ class DisasterList:
 
     def appendDisasterTypesFromFile(self, filename, dtype):
 
-        dfile = open(filename + '.txt', 'r')
+        columns = loadTextDB(filename + '.txt', 'disasters ' + dtype,
+                             lambda textname: disasterColumns(self.readDisasterTypesFromFile(textname, dtype)))
+        for dtype, rasterResolution in zip(columns['dtype'].tolist(), columns['rasterResolution'].tolist()):
+            if (np.isnan(rasterResolution)):
+                rasterResolution = None
+            # initialize new disaster entry
+            self.entries[dtype] = self.disasterTypeMappings[dtype]()
+            if (rasterResolution != None and hasattr(self.entries[dtype], 'rasterResolution')):
+                self.entries[dtype].rasterResolution = rasterResolution
+            # fill the object with the data
+            self.entries[dtype].open(filename, dtype)
+
+    # list of (disaster type, raster resolution) described in a text file
+    def readDisasterTypesFromFile(self, textname, dtype):
+
+        dfile = open(textname, 'r')
         linesoftext = dfile.readlines()
 
-        newestEntry = len(self.entries)
+        entries = []
         lineNumber = 0
         createNewEntry = 0
+        rasterResolution = None
         while (lineNumber < len(linesoftext)):
 
             # parse line
@@ -177,22 +262,28 @@ class DisasterList:
                 pass
             elif (keyword == 'type'):                  # ends entry configuration section
                 dtype = keyvalue[1].strip().strip("'") # key for disaster dict
+            elif (keyword == 'raster resolution'):     # optional grid spacing in degrees
+                rasterResolution = float(keyvalue[1].strip().strip("'"))
             elif (keyword == 'end'):                   # ends entry configuration section
                 createNewEntry = 1
 
             if (createNewEntry == 1):
-                # initialize new disaster entry
-                self.entries[dtype] = self.disasterTypeMappings[dtype]()
-                # fill the object with the data
-                self.entries[dtype].open(filename, dtype)
+                entries.append((dtype, rasterResolution))
                 # createNewEntry housekeeping
                 createNewEntry = 0
-                newestEntry += 1
+                rasterResolution = None                # the resolution given applies to this entry only
 
             # while loop housekeeping
             lineNumber += 1
         dfile.close()
+        return entries
 
     def display(self, map = None):
         for d in self.entries.values():
-            d.display(map)
\ No newline at end of file
+            d.display(map)
+
+# The compiled form of a disaster list (see TextDB): disaster types, and raster resolutions (NaN if not given)
+def disasterColumns(entries):
+    return {'dtype': np.array([dtype for dtype, rasterResolution in entries], dtype=str),
+            'rasterResolution': np.array([np.nan if (rasterResolution == None) else rasterResolution
+                                          for dtype, rasterResolution in entries], dtype=float)}
\ No newline at end of file
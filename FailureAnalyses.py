@@ -20,6 +20,9 @@ Outputs: GIS Shapefiles with additional 'Outaged' field, indicating infrastructu
 Dependencies: IIF_failure.py
 
 Issues: Add hurricane flood hazards (see lines 277, 369, and 410)
+Note: with want_lineContours = 1 (the default) a line also fails where a span between two vertices crosses hurricane winds
+stronger than the ASCE7 windgust at its ends, so the 'outage' field of the lines can differ from the former analysis,
+which only tested the line vertices. Set want_lineContours = 0 to reproduce the former outages.
 
 Last modification: 2015/Sep/2
 Author: Edwin Campos, ecampos@anl.gov, edwinfcampos@aol.com
@@ -31,6 +34,11 @@ start_time = time.time()
 import shapefile
 import numpy as np
 import IIF_failure as IIFf
+from ASCEwinds_table import loadASCE7table
+from ASCEwinds_interp import loadASCE7grids
+from Geometry import maxValueInPolygons, PolygonHierarchy, uniquePoints, polylineExposure
+from PointShapefile import PointShapefile, DBFTable, shapefileName, updateAnalyzedField, stampAnalyzedLayer
+from ScenarioResults import ScenarioResults
 
 
 ###### VARIABLE INPUTS TO BE MODIFIED BY USER ##########################################################################################
@@ -55,6 +63,13 @@ ng_datadir = '/Users/edwincampos/Documents/Argonne_Projects/2015_LDRD_Infrastruc
 ng_namehint = 'ngpp_east'
 ASCE7_ngpp_file = '/Users/edwincampos/Documents/Argonne_Projects/2015_LDRD_Infrastructures/codes/ASCEwinds_getatAssets_ngppEast.dat'
 
+# ASCE7 regional grids, obtained by running ASCEwinds_get.py
+ASCE7_grid_files = ['/Users/edwincampos/Documents/Argonne_Projects/2015_LDRD_Infrastructures/codes/ASCEwinds_get_20150730.dat',
+                    '/Users/edwincampos/Documents/Argonne_Projects/2015_LDRD_Infrastructures/codes/ASCEwinds_get_20150803.dat']
+want_lineContours = 1  # 1 --> Will also test the hurricane wind contours crossed by the lines between their vertices (see Geometry.polylineExposure); 0 --> Only at the line vertices, as formerly
+results_file = tc_datadir+'/'+tc_namehint+'_results.npz'  # Columnar results of this run, one row per asset (see ScenarioResults.py); None --> Will not be written
+want_ASCE7grids = 0  # 1 --> Will interpolate the ASCE7 winds from ASCE7_grid_files (see ASCEwinds_interp.py), instead of reading the ASCE7_*_file of each asset layer
+
 
 want2printFailures  = 1  # 1 --> Will print in console the failure status for each asset; 2 --> Will print only basic information of program run
 
@@ -72,84 +87,70 @@ outputplotname = 'FailureAnalyses'
 
 # READ THE ASCE7 WINDGUST LOAD FROM A PREDETERMINED FILE
 # The predetermined file 'which_ASCE7_file' was obtained by running ASCEwinds_getatAssets.py, with the same 'inputfile' there as in 'ng_datadir+/+ng_namehint' here
+# The file is only read the first time, and kept as an ASCEwinds_table.ASCE7Table indexed by coordinate
 def readASCE7winds(which_ASCE7_file,ilon,ilat):
-    asce_705_mph =float('nan')     # Default value
-    asce_710_RCiii_mph = float('nan')  # Default value
-    f = open(which_ASCE7_file, 'r')  #Open file for reading only
-    # Read Header lines in file
-    line = f.readline() # "Data downloaded from 'http://windspeed.atcouncil.org' on "+ time.strftime("%c %Z")+', where each column corresponds to...\n'   
-    line = f.readline() # 'Latitude(degrees, positive north)\n' 
-    line = f.readline() # 'Longitude(degrees, positive east)\n' 
-    line = f.readline() # 'ASCE 7-05 Wind speeds (50-years mean recurrence interval for 3-seconds peak gust, in miles-per-hour)\n' 
-    line = f.readline() # 'ASCE 7-10 Wind speeds (Risk Category III-IV: >1700-years mean recurrence interval for 3-seconds peak gust, in miles-per-hour)\n' 
-    line = f.readline() # 'Asset name\n'    
-    # Read the rest of the file
-    for line in f.readlines():  
-        #print line   # This line is used for TEST only
-        #lat_buff, lon_buff, asce_705_buff, asce_710_RCiii_buff, name_buff = line.split('    ')  # This line does not work when the name is given as blank spaces
-        splitted_line = line.split('    ')
-        lat_buff = splitted_line[0]
-        lon_buff = splitted_line[1]
-        asce_705_buff = splitted_line[2]
-        asce_710_RCiii_buff= splitted_line[3]
-        #name_buff = splitted_line[4]
-        if (lat_buff == str(ilat)) and (lon_buff == str(ilon)): 
-            #print lat_buff, lon_buff, asce_705_buff, asce_710_RCiii_buff, name_buff
-            asce_705_mph = int(asce_705_buff) 
-            asce_710_RCiii_mph = int(asce_710_RCiii_buff)    
-            break  # Terminate the for loop ==> stop reading lines            
-    f.close()
-    return (asce_705_mph, asce_710_RCiii_mph)
-
-
-# TEST IF A POINT IS INSIDE A POLYGON
-# Source http://geospatialpython.com/2011/08/point-in-polygon-2-on-line.html
-def point_in_poly(x,y,poly):   
-   if (x,y) in poly: return "IN"  # check if point is a vertex   
-   for i in range(len(poly)):   # check if point is on a boundary
-      p1 = None
-      p2 = None
-      if i==0:
-         p1 = poly[0]
-         p2 = poly[1]
-      else:
-         p1 = poly[i-1]
-         p2 = poly[i]
-      if p1[1] == p2[1] and p1[1] == y and x > min(p1[0], p2[0]) and x < max(p1[0], p2[0]):
-         return "IN"      
-   n = len(poly)
-   inside = False
-   p1x,p1y = poly[0]
-   for i in range(n+1):
-      p2x,p2y = poly[i % n]
-      if y > min(p1y,p2y):
-         if y <= max(p1y,p2y):
-            if x <= max(p1x,p2x):
-               if p1y != p2y:
-                  xints = (y-p1y)*(p2x-p1x)/(p2y-p1y)+p1x
-               if p1x == p2x or x <= xints:
-                  inside = not inside
-      p1x,p1y = p2x,p2y
-   if inside: return "IN"
-   else: return "OUT"
+    if want_ASCE7grids == 1:
+        return loadASCE7grids(ASCE7_grid_files).lookupOne(ilon,ilat)  # NaN over water, in Special Wind Regions, or outside the grids
+    return loadASCE7table(which_ASCE7_file).lookupOne(ilon,ilat)  # (asce_705_mph, asce_710_RCiii_mph), NaN if the site is not in the file
+
+
+# READ THE ASCE7 WINDGUST LOADS FOR ARRAYS OF LOCATIONS
+def readASCE7windsArrays(which_ASCE7_file,lons,lats):
+    if want_ASCE7grids == 1:
+        return loadASCE7grids(ASCE7_grid_files).lookup(lons,lats)
+    return loadASCE7table(which_ASCE7_file).lookup(lons,lats)  # (asce_705_mph, asce_710_RCiii_mph) arrays, NaN where the site is not in the file
+
+
+# FIND HURRICANE SUSTAINED WINDS GIVEN ARRAYS OF LOCATIONS
+# All the locations are tested against each swath polygon at once (see Geometry.pointsInPolygon), 
+# which is much faster than testing one asset at a time
+# GIShierarchy is an optional Geometry.PolygonHierarchy built from GISshapes and GISrecords. Because the wind polygons are nested
+# (a site inside the 90 kt polygon is also inside the 60 kt one), a site is only tested against the polygons nested in those it is inside
+def findHurricaneWinds(GISshapes,GISrecords,lons,lats,GIShierarchy=None):
+    if GIShierarchy != None:
+        return GIShierarchy.maxValue(lons,lats,default=0.0)  # in the units of the GISshapes and GISrecords
+    # The points attribute contains a list of tuples containing an (x,y) coordinate for each point in the shape. 
+    polygons = [shape.points for shape in GISshapes]
+    winds = [float(record[0]) for record in GISrecords]  # If fields_tc[last shape] [0] equals 'ID', then records_tc[-1] [0] = wind speed every 2 mhp
+    return maxValueInPolygons(lons,lats,polygons,winds,default=0.0)  # in the units of the GISshapes and GISrecords
 
 
 # FIND HURRICANE SUSTAINED WINDS GIVEN A PARTICULAR LOCATION
-def findHurricaneWind(GISshapes,GISrecords,ilon,ilat):
-# Find the wind speed at the bus site
-    buswind = 0.0 # Default value for wind speed at the bus site, in kt
-    ##failure = False  # Default value for wind at the bus site, in miles per hour, corresponding to 1-min max. sustained wind at 10m agl. 
-    # Find the Tropical Cyclone polygons corresponding to the hurricane wind
-    # The points attribute contains a list of tuples containing an (x,y) coordinate for each point in the shape. 
-    for jj in xrange(len(GISshapes)): 
-        #radii = float(GISrecords[jj][1])  #Wind speed in knots
-        ##tc_lon,tc_lat = GISshapes[jj].points     
-        if point_in_poly(ilon,ilat,GISshapes[jj].points) == "IN":
-            # Find the wind corresponding to the bus longitude,latutude
-            #buswind_kt =  max( buswind_kt, float(GISrecords[jj][1]) )  # radii = float(records[ii][1]) = Wind speed in knots
-            buswind =  max( buswind, float(GISrecords[jj][0]) ) # If fields_tc[last shape] [0] equals 'ID', then records_tc[-1] [0] = wind speed every 2 mhp
-            #print ii,buswind
-    return buswind  # in the units of the GISshapes and GISrecords
+def findHurricaneWind(GISshapes,GISrecords,ilon,ilat,GIShierarchy=None):
+    # Find the wind speed at the bus site, Default value is 0.0
+    return float( findHurricaneWinds(GISshapes,GISrecords,[ilon],[ilat],GIShierarchy)[0] )  # in the units of the GISshapes and GISrecords
+
+
+# Longitudes and latitudes of the shapes of a layer, NaN where the shape is not a single point, and the layer's DBFTable.
+# POINT layers are memory-mapped (see PointShapefile): the coordinates are a view into the .shp file, without a Shape object
+# per record. Other layers are read through the pyshp Reader GISreader; their .dbf is read as a DBFTable all the same.
+def readPointCoordinates(shapefilename,GISreader):
+    try:
+        layer = PointShapefile(shapefilename)
+        return layer.coords, layer.dbf
+    except ValueError:
+        lonlat = np.array([shape.points[0] if len(shape.points) == 1 else [np.nan,np.nan] for shape in GISreader.shapes()]).reshape(-1,2)
+        return lonlat, DBFTable(shapefileName(shapefilename,'.dbf'))
+
+
+# Outage status of each shape of a layer, as a boolean array: the text of its 'outage' field (the last one) when it already has one
+# ('true' or 'True'; the IFFpackage layers hold 'false'). The status is written back as 'True'/'False' text.
+def readOutages(dbf,NeedNewOutageField):
+    if NeedNewOutageField == 1:
+        return np.zeros(len(dbf), dtype=bool)
+    return np.char.lower(dbf.column(len(dbf.fields)-1)) == u'true'
+
+
+# Records of a layer for a full rewrite of its output layer, with the outage status as 'True'/'False' text in the last field
+# (appended when the layer had no 'outage' field). Only this full rewrite decodes a record object per shape.
+def outageRecords(GISreader,outages,NeedNewOutageField):
+    records = [list(record) for record in GISreader.records()]
+    for record, outage in zip(records, outages):
+        if NeedNewOutageField == 1:
+            record.append(str(bool(outage)))
+        else:
+            record[-1] = str(bool(outage))
+    return records
 
 
 ##### INGEST SHAPE FILES ##########################################################################################
@@ -157,15 +158,16 @@ def findHurricaneWind(GISshapes,GISrecords,ilon,ilat):
 # Read shape files for NATURAL GAS Buses (for now the only assets are Processing Plants)
 myshp_ngbuses = ng_datadir+'/'+ng_namehint # 
 sf_ngbu = shapefile.Reader(myshp_ngbuses)
-shapes_ngbuses = sf_ngbu.shapes()  # Geometry: shp file with geometries # Every geometry/shape must have a corresponding record
+lonlat_ngbuses, dbf_ngbuses = readPointCoordinates(myshp_ngbuses,sf_ngbu)  # Geometry: shp file with geometries # Every geometry/shape must have a corresponding record
 fields_ngbuses = sf_ngbu.fields    # Atributes: shx file with headers  # fields[ #ofrecords[:,i]+1, 4]
-records_ngbuses= sf_ngbu.records() # Records: dbf file with contents # records[ #ofshapes, #offields[:,i] -1]   # This particular Natural Gas Processing Plant *.dbf file have the records as a LIST
+# Records: dbf file with contents, read one typed column at a time from dbf_ngbuses (see PointShapefile.DBFTable)
 # Verify if the 'outage' field already exists
 if ('OUTAGE' in fields_ngbuses[-1]) or ('Outage' in fields_ngbuses[-1]) or ('outage' in fields_ngbuses[-1]): 
     NeedNewOutageField_ngbuses = 0    # This code does NOT NEED to create a new Outage field and record
 else:
     NeedNewOutageField_ngbuses = 1    # This code NEEDS to create a new Outage field and record
-numberof_ngbuses = len(shapes_ngbuses)
+numberof_ngbuses = len(lonlat_ngbuses)
+outage_ngbuses = readOutages(dbf_ngbuses,NeedNewOutageField_ngbuses)  # bus 'outage', True or False
 #print(fields_ngbuses)
 #[('DeletionFlag', 'C', 1, 0), ['OBJECTID', 'N', 9, 0], ['PROCID', 'C', 15, 0], ['NAME', 'C', 120, 0], ['COMPNAME', 'C', 80, 0], ['TYPE', 'C', 125, 0], ['FACADDR', 'C', 180, 0], ['CITY', 'C', 75, 0], ['COUNTY', 'C', 50, 0], ['COUNTYFIPS', 'C', 5, 0], ['STATE', 'C', 2, 0], ['ZIP', 'C', 7, 0], ['ZIP4', 'C', 4, 0], ['COUNTRY', 'C', 15, 0], ['LATITUDE', 'F', 19, 11], ['LONGITUDE', 'F', 19, 11], ['SOURCE', 'C', 254, 0], ['SOURCE_DAT', 'D', 8, 0], ['VAL_METHOD', 'C', 150, 0], ['VAL_DATE', 'D', 8, 0], 
 #['POSREL', 'C', 50, 0], ['NAICS_CODE', 'C', 15, 0], ['NAICS_DESC', 'C', 150, 0], ['WEBSITE', 'C', 100, 0], ['STATUS', 'C', 12, 0], ['TELEPHONE', 'C', 15, 0], ['FAC_EMAIL', 'C', 50, 0], ['CONTACT', 'C', 50, 0], ['CONTITLE', 'C', 50, 0], ['CONEMAIL', 'C', 50, 0], ['OPERATOR', 'C', 80, 0], ['OPERADDR', 'C', 60, 0], ['OPERCITY', 'C', 20, 0], ['OPERSTATE', 'C', 4, 0], ['OPERZIP', 'C', 20, 0], ['OPERPHONE', 'C', 15, 0], ['OPERURL', 'C', 100, 0], ['GASCAP', 'F', 19, 11], ['PROCAMTLBS', 'F', 19, 11], 
@@ -175,15 +177,16 @@ numberof_ngbuses = len(shapes_ngbuses)
 # Read shape files for ELECTRIC POWER BUSES
 myshp_epbuses = ep_datadir+'/'+ep_namehint[0] # Recall that ep_namehint = ['buses', 'lines'] 
 sf_epbu = shapefile.Reader(myshp_epbuses)
-shapes_epbuses = sf_epbu.shapes()  # Geometry: shp file with geometries # Every geometry/shape must have a corresponding record
+lonlat_epbuses, dbf_epbuses = readPointCoordinates(myshp_epbuses,sf_epbu)  # Geometry: shp file with geometries # Every geometry/shape must have a corresponding record
 fields_epbuses = sf_epbu.fields    # Atributes: shx file with headers  # fields[ #ofrecords[:,i]+1, 4]
-records_epbuses= sf_epbu.records() # Records: dbf file with contents # records[ #ofshapes, #offields[:,i] -1]
+# Records: dbf file with contents, read one typed column at a time from dbf_epbuses (see PointShapefile.DBFTable)
 # Verify if the 'outage' field already exists
 if ('OUTAGE' in fields_epbuses[-1]) or ('Outage' in fields_epbuses[-1]) or ('outage' in fields_epbuses[-1]): 
     NeedNewOutageField_epbuses = 0    # This code does NOT NEED to create a new Outage field and record
 else:
     NeedNewOutageField_epbuses = 1    # This code NEEDS to create a new Outage field and record
-numberof_epbuses = len(shapes_epbuses)
+numberof_epbuses = len(lonlat_epbuses)
+outage_epbuses = readOutages(dbf_epbuses,NeedNewOutageField_epbuses)  # bus 'outage', True or False
 #print(fields_epbuses)
 #[('DeletionFlag', 'C', 1, 0), ['Class', 'C', 60, 0], ['Bus', 'C', 60, 0], ['Type', 'N', 11, 0], ['GenOutput', 'F', 19, 11], ['Load', 'F', 19, 11], ['VarLoad', 'F', 19, 11], ['GenRating', 'F', 19, 11], ['MinGen', 'F', 19, 11], ['Voltage', 'F', 19, 11], ['Angle', 'F', 19, 11], ['Latitude', 'F', 19, 11], ['Longitude', 'F', 19, 11], ['Name', 'C', 60, 0], ['Island', 'N', 11, 0], ['FinalGen', 'F', 19, 11], ['FinalLoad', 'F', 19, 11], ['Stable', 'C', 60, 0], ['Feasible', 'C', 60, 0], ['outage', 'C', 5, 0]]
 # In the field format 'C' is for strings, 'N' is for integers, and 'F' is for float numbers
@@ -195,13 +198,14 @@ myshp_eplines = ep_datadir+'/'+ep_namehint[1] # Recall that ep_namehint = ['buse
 sf_epli = shapefile.Reader(myshp_eplines)
 shapes_eplines = sf_epli.shapes()  # shp file contents
 fields_eplines = sf_epli.fields    # Headers
-records_eplines= sf_epli.records() #dbf file contents
+dbf_eplines = DBFTable(shapefileName(myshp_eplines,'.dbf'))  # dbf file contents, one typed column at a time
 # Verify if the 'outage' field already exists
 if ('OUTAGE' in fields_eplines[-1]) or ('Outage' in fields_eplines[-1]) or ('outage' in fields_eplines[-1]): 
     NeedNewOutageField_eplines = 0    # This code does NOT NEED to create a new Outage field and record
 else:
     NeedNewOutageField_eplines = 1    # This code NEEDS to create a new Outage field and record
 numberof_eplines = len(shapes_eplines)
+outage_eplines = readOutages(dbf_eplines,NeedNewOutageField_eplines)  # line 'outage', True or False
 #print(fields_eplines)
 #[('DeletionFlag', 'C', 1, 0), ['Class', 'C', 60, 0], ['FromBus', 'N', 11, 0], ['ToBus', 'N', 11, 0], ['Circuit', 'N', 11, 0], ['Resistance', 'F', 19, 11], ['Reactance', 'F', 19, 11], ['ChargingR', 'F', 19, 11], ['CapacityPU', 'F', 19, 11], ['Branch', 'N', 11, 0], ['FromIsland', 'N', 11, 0], ['ToIsland', 'N', 11, 0], ['FlowMW', 'F', 19, 11], ['PctLoading', 'F', 19, 11], ['Status', 'C', 60, 0], ['outage', 'C', 5, 0]]
 
@@ -212,6 +216,7 @@ sf = shapefile.Reader(myshp_tc)
 shapes_tc = sf.shapes()   # shp file contents
 fields_tc = sf.fields     # Headers
 records_tc= sf.records()  #dbf file contents
+hierarchy_tc = PolygonHierarchy([shape.points for shape in shapes_tc], [float(record[0]) for record in records_tc])  # Nested hurricane wind polygons, from the outermost to the strongest
 #print(fields_tc)
 #[('DeletionFlag', 'C', 1, 0), ['OBJECTID', 'N', 9, 0], ['RADII', 'F', 19, 11], ['STORMID', 'C', 20, 0], ['BASIN', 'C', 20, 0], ['STORMNUM', 'F', 19, 11], ['VALIDTIME', 'C', 20, 0], ['SYNOPTIME', 'C', 20, 0], ['TAU', 'F', 19, 11], ['NE', 'F', 19, 11], ['SE', 'F', 19, 11], ['SW', 'F', 19, 11], ['NW', 'F', 19, 11], ['Shape_Leng', 'F', 19, 11], ['Shape_Area', 'F', 19, 11], ['InPoly_FID', 'N', 9, 0], ['SmoPgnFlag', 'N', 9, 0]]
 ##synoptime = records[0][6]
@@ -222,26 +227,19 @@ records_tc= sf.records()  #dbf file contents
 
 ##### ADD OUTAGED FIELD IN INFRASTRUCTURE SHAPE FILES ##########################################################################################
 
-# Create a new field & record in the NATURAL GAS bus shapefiles: 'Outaged' = 'False'
+# Create a new field in the NATURAL GAS bus shapefiles: 'Outaged' = 'False' (outage_ngbuses starts all False, see readOutages)
 if NeedNewOutageField_ngbuses == 1:    
     fields_ngbuses.append(['outage', 'C', 5, 0])
-    ngitem2Bappended = 'False'
-    for nn in xrange(len(shapes_ngbuses)):
-        records_ngbuses[nn].append(ngitem2Bappended)  # This is appending an ITEM at the end of the LIST. Recall that the GIS shapefiles for Natural Gas have its records as a LIST.
 
 
-# Create a new field & record in the ELECTRIC POWER Bus shapefiles: 'Outaged' = 'False'
+# Create a new field in the ELECTRIC POWER Bus shapefiles: 'Outaged' = 'False'
 if NeedNewOutageField_epbuses == 1:    
     fields_epbuses.append(['outage', 'C', 5, 0])
-    eplist2Bappended = [['False']] * (len(shapes_epbuses))  # Important, use [[]] to make a column ARRAY
-    records_epbuses = np.hstack((records_epbuses,eplist2Bappended))  # This is appending/concatenating the new column ARRAY into the records ARRAY, as the last column. Recall that the GIS shapefiles for Electric Power have its records as an ARRAY.
 
 
-# Create a new field & record in the ELECTRIC POWER Lines shapefiles: 'Outaged' = 'False'
+# Create a new field in the ELECTRIC POWER Lines shapefiles: 'Outaged' = 'False'
 if NeedNewOutageField_eplines == 1:    
     fields_eplines.append(['outage', 'C', 5, 0])
-    eplist2Bappended = [['False']] * (len(shapes_eplines)) 
-    records_eplines = np.hstack((records_eplines,eplist2Bappended))  # This is appending/concatenating the new column ARRAY into the records ARRAY, as the last column. Recall that the GIS shapefiles for Electric Power have its records as an ARRAY.
 
 ''' TO BE DELETED
 if len(shapes_ngbuses) == 1:
@@ -262,34 +260,37 @@ else:
 # Loop through the Natural Gas assets
 if want2printFailures == 2:
     print '----------------------------------- ANALYZING '+str(numberof_ngbuses)+' NATURAL GAS BUSES -----------------------------------'
-for ii in xrange(len(shapes_ngbuses)):
-    shape = shapes_ngbuses[ii]
-    if len(shape.points) == 1:   # This is for cases where the shape correspond to a single lat,lon point
-        [[lons,lats]] = shape.points  # Define latitudes and longitudes for a given shape    
+# Obtain values of Hurricane sustained winds at all the asset sites at once
+winds_ngbuses = findHurricaneWinds(shapes_tc,records_tc,lonlat_ngbuses[:,0],lonlat_ngbuses[:,1],hierarchy_tc)
+asce_705_ngbuses, asce_710_RCiii_ngbuses = readASCE7windsArrays(ASCE7_ngpp_file,lonlat_ngbuses[:,0],lonlat_ngbuses[:,1])
+# Compute "floodlvl_m" here, and pass the values into IIFf.failureFunctions
+# Run failureFunctions to determine which buses will fail
+failure_ngbuses = IIFf.failureFunctions(asset='ngpp', wind_mph=winds_ngbuses, gust_threshold_mph=asce_705_ngbuses)
+busname_ngbuses = dbf_ngbuses.column(2)  # Plant name: the third field, ['NAME', 'C', 120, 0]
+for ii in xrange(numberof_ngbuses):
+    if np.isfinite(lonlat_ngbuses[ii]).all():   # This is for cases where the shape correspond to a single lat,lon point
+        [lons,lats] = lonlat_ngbuses[ii]  # Define latitudes and longitudes for a given shape    
         ilat = lats
         ilon = lons        
         # Read value of ASCE-7 windgust at asset site       
-        asce_705_mph, asce_710_RCiii_mph = readASCE7winds(ASCE7_ngpp_file,ilon,ilat)         
+        asce_705_mph, asce_710_RCiii_mph = asce_705_ngbuses[ii], asce_710_RCiii_ngbuses[ii]
         # Obtain value of Hurricane sustained winds at asset site
-        hazard_wind_mph = findHurricaneWind(shapes_tc,records_tc,ilon,ilat)   # Validation: For the Hurricane Ivan Adv.#53 and the Nat. Gas Processing Plant, hazard_wind_mph = 88.0
+        hazard_wind_mph = winds_ngbuses[ii]   # Validation: For the Hurricane Ivan Adv.#53 and the Nat. Gas Processing Plant, hazard_wind_mph = 88.0
         #hazard_wind_mph = 150.0  # This line would be used for TEST only
         
-        # Compute "floodlvl_m" here, and pass the value into IIFf.failureFunction   
-    
-        # Run failureFunction to determine if the bus will fail
-        failure = IIFf.failureFunction(asset='ngpp', wind_mph=hazard_wind_mph, gust_threshold_mph=asce_705_mph )
+        failure = failure_ngbuses[ii]
     
         if want2printFailures == 1:
             #Typically in a hurricane environment, the value of the maximum 3 second gust over a 1 minute period 
             # is on the order of 1.3 times (or 30% higher than) than the 1 min sustained wind. 
             # Source: http://www.aoml.noaa.gov/hrd/tcfaq/D4.html        
             hazard_gust_mph = 1.3 * hazard_wind_mph    # Recall that 1 mph wind = 1.3 mph gust
-            print ii+1,', hurricane gust(mph):', hazard_gust_mph,', ASCE7-05 gust(mph):', asce_705_mph, ', failure: ', failure,', ', records_ngbuses[ii][2]
+            print ii+1,', hurricane gust(mph):', hazard_gust_mph,', ASCE7-05 gust(mph):', asce_705_mph, ', failure: ', failure,', ', busname_ngbuses[ii]
     
         if failure:
-            records_ngbuses[ii][-1] = 'True' # Recall that records_epbuses[ii][-1] = 'False' # bus 'outage'
+            outage_ngbuses[ii] = True # bus 'outage'
             #break
-    #print ii+1,', hurricane gust(mph):', hazard_gust_mph,', ASCE7-05 gust(mph):', asce_705_mph, ', records_ngbuses[ii][-1]: ', records_ngbuses[ii][-1],', ', records_ngbuses[ii][2]
+    #print ii+1,', hurricane gust(mph):', hazard_gust_mph,', ASCE7-05 gust(mph):', asce_705_mph, ', outage_ngbuses[ii]: ', outage_ngbuses[ii],', ', busname_ngbuses[ii]
     #if failure: break            
 
 
@@ -298,20 +299,34 @@ if want2printFailures == 2:
     print '----------------------------------- ANALYZING '+str(numberof_epbuses)+' ELECTRIC POWER BUSES -----------------------------------'
 n_epp_generators = 0  # Number of Electric Power Plants (power generators)
 n_eps_loads = 0       # Number of Electric Power Substations (power loads)
-for ii in xrange(len(shapes_epbuses)):
-    busclas= records_epbuses[ii][0]  # Bus class, e.g., busclas= '                                                            '
-    busnum = float(records_epbuses[ii][1]) # Bus number, e.g., busnum = 1.0
-    bustype= int(records_epbuses[ii][2]) # Bus type, where 2=Generator, 3=Load, 1=SlackGenerator (Slack Generators are treated as Generators by EPfast)   As per Brian Craig email to Mark Hereld and Edwin Campos on 2015 Aug 19
-    busGenOut=float(records_epbuses[ii][3]) # Power Generation, for example busGenOut=296.152, in MW, as per Brian Craig's (Argonne-GSS) email to Edwin Campos on 2015 June 25
-    busLoad= float(records_epbuses[ii][4]) # Power load, for example busLoad=0.00000000000e+000, in MW, as per Brian Craig's (Argonne-GSS) email to Edwin Campos on 2015 June 25
-    busGnRt= float(records_epbuses[ii][6]) # Bus generation rating, in MegaWatts, also known as Name Plate Capacity (Brian Craig and Edgar Portante, Personnal Communication to Edwin Campos on 2015 July 15). For example, busGnRt = 600.0
-    busVolt= float(records_epbuses[ii][8]) # Bus voltage, in Kilovolts (Edgar Portante, Personal Communication to Edwin Campos on 2015 July 15)
-    #buslat = float(records_epbuses[ii][10]) # Bus latutude, in degrees from equator. It is best to read the latitudes from the *.shp file, such as [[lons,lats]] = shapepoints
-    #buslon = float(records_epbuses[ii][11]) # Bus longiture, in degrees from Greenwich. It is best to read the longitudes from the *.shp file, such as [[lons,lats]] = shapepoints
-    busname= records_epbuses[ii][12] # Bus site name, state
-    stable = records_epbuses[ii][-3] # bus stability, 'True' or 'False'
-    feasibl= records_epbuses[ii][-2] # bus feasibility, 'True' or 'False'    
-    outaged= records_epbuses[ii][-1] # bus feasibility, 'True' or 'False'
+# Obtain values of Hurricane sustained winds at all the asset sites at once
+winds_epbuses = findHurricaneWinds(shapes_tc,records_tc,lonlat_epbuses[:,0],lonlat_epbuses[:,1],hierarchy_tc)
+asce_705_epbuses, asce_710_RCiii_epbuses = readASCE7windsArrays(ASCE7_epbuses_file,lonlat_epbuses[:,0],lonlat_epbuses[:,1])
+# Power Plants have generation > load, Substations do not (see which_asset below)
+# Typed dbf columns, without a record per bus:
+busnum_epbuses = dbf_epbuses.column('Bus')          # Bus number, e.g., busnum = 1.0
+bustype_epbuses = dbf_epbuses.column('Type')        # Bus type, where 2=Generator, 3=Load, 1=SlackGenerator (Slack Generators are treated as Generators by EPfast)   As per Brian Craig email to Mark Hereld and Edwin Campos on 2015 Aug 19
+busGenOut_epbuses = dbf_epbuses.column('GenOutput') # Power Generation, for example busGenOut=296.152, in MW, as per Brian Craig's (Argonne-GSS) email to Edwin Campos on 2015 June 25
+busLoad_epbuses = dbf_epbuses.column('Load')        # Power load, for example busLoad=0.00000000000e+000, in MW, as per Brian Craig's (Argonne-GSS) email to Edwin Campos on 2015 June 25
+busname_epbuses = dbf_epbuses.column('Name')        # Bus site name, state
+surplus_epbuses = busGenOut_epbuses - busLoad_epbuses
+assets_epbuses = np.where(surplus_epbuses > 0, 'epp', 'eps')
+# Compute "floodlvl_m" here, and pass the values into IIFf.failureFunctions
+# Run failureFunctions to determine which buses will fail
+failure_epbuses = IIFf.failureFunctions(asset=assets_epbuses, wind_mph=winds_epbuses, gust_threshold_mph=asce_705_epbuses)
+for ii in xrange(numberof_epbuses):
+    busnum = float(busnum_epbuses[ii]) # Bus number, e.g., busnum = 1.0
+    bustype= int(bustype_epbuses[ii]) # Bus type, where 2=Generator, 3=Load, 1=SlackGenerator
+    busGenOut=busGenOut_epbuses[ii] # Power Generation, in MW
+    busLoad= busLoad_epbuses[ii] # Power load, in MW
+    #busGnRt= dbf_epbuses.column('GenRating')[ii] # Bus generation rating, in MegaWatts, also known as Name Plate Capacity (Brian Craig and Edgar Portante, Personnal Communication to Edwin Campos on 2015 July 15). For example, busGnRt = 600.0
+    #busVolt= dbf_epbuses.column('Voltage')[ii] # Bus voltage, in Kilovolts (Edgar Portante, Personal Communication to Edwin Campos on 2015 July 15)
+    #buslat = dbf_epbuses.column('Latitude')[ii] # Bus latutude, in degrees from equator. It is best to read the latitudes from the *.shp file, such as [[lons,lats]] = shapepoints
+    #buslon = dbf_epbuses.column('Longitude')[ii] # Bus longiture, in degrees from Greenwich. It is best to read the longitudes from the *.shp file, such as [[lons,lats]] = shapepoints
+    busname= busname_epbuses[ii] # Bus site name, state
+    #stable = dbf_epbuses.column('Stable')[ii] # bus stability, 'True' or 'False'
+    #feasibl= dbf_epbuses.column('Feasible')[ii] # bus feasibility, 'True' or 'False'    
+    outaged= outage_epbuses[ii] # bus outage, True or False
     # From Brian Craig's email (Argonne's GSS division) on 2015 June 25: 
     # The stable and feasible are parameters from the islanding analysis.
     # Feasible false means the linear solver could not converge, meaning you have bad data.  
@@ -359,21 +374,17 @@ for ii in xrange(len(shapes_epbuses)):
     # We may also use busGnRt and busVolt to determine if the bus is a Power Plant or Substation
     '''
     
-    shape = shapes_epbuses[ii]
-    if len(shape.points) == 1:   # Making sure that this is for cases where the shape correspond to a single lat,lon point
-        [[lons,lats]] = shape.points  # Define latitudes and longitudes for a given shape    
+    if np.isfinite(lonlat_epbuses[ii]).all():   # Making sure that this is for cases where the shape correspond to a single lat,lon point
+        [lons,lats] = lonlat_epbuses[ii]  # Define latitudes and longitudes for a given shape    
         ilat = lats
         ilon = lons        
         # Read value of ASCE-7 windgust at asset site       
-        asce_705_mph, asce_710_RCiii_mph = readASCE7winds(ASCE7_epbuses_file,ilon,ilat)         
+        asce_705_mph, asce_710_RCiii_mph = asce_705_epbuses[ii], asce_710_RCiii_epbuses[ii]
         # Obtain value of Hurricane sustained winds at asset site
-        hazard_wind_mph = findHurricaneWind(shapes_tc,records_tc,ilon,ilat)   # Validation: For the Hurricane Ivan Adv.#53 and the Nat. Gas Processing Plant, hazard_wind_mph = 88.0
+        hazard_wind_mph = winds_epbuses[ii]   # Validation: For the Hurricane Ivan Adv.#53 and the Nat. Gas Processing Plant, hazard_wind_mph = 88.0
         #hazard_wind_mph = 150.0  # This line would be used for TEST only
         
-        # Compute "floodlvl_m" here, and pass the value into IIFf.failureFunction    
-    
-        # Run failureFunction to determine if the bus will fail
-        failure = IIFf.failureFunction(asset=which_asset, wind_mph=hazard_wind_mph, gust_threshold_mph=asce_705_mph )
+        failure = failure_epbuses[ii]
     
         if want2printFailures == 1:
             #Typically in a hurricane environment, the value of the maximum 3 second gust over a 1 minute period 
@@ -383,9 +394,7 @@ for ii in xrange(len(shapes_epbuses)):
             print ii+1,', hurricane gust(mph):', hazard_gust_mph,', ASCE7-05 gust(mph):', asce_705_mph, ', failure: ', failure,', '+busname[0:25]
     
         if failure:
-            #records_epbuses[ii][-3] = 'False'  # Recall that records_epbuses[ii][-3] = 'False'  # bus 'Stable'
-            #records_epbuses[ii][-2] = 'False' # Recall that records_epbuses[ii][-2] = 'False' # bus 'Feasible'
-            records_epbuses[ii][-1] = 'True' # Recall that records_epbuses[ii][-1] = 'False' # bus 'outage'
+            outage_epbuses[ii] = True # bus 'outage'
 
 if want2printFailures == 2:
     print 'Number of Electric Power Plants (power generators) = '+ str(n_epp_generators)
@@ -394,43 +403,80 @@ if want2printFailures == 2:
 # Loop through the Electric Power Lines
 if want2printFailures == 2:
     print '----------------------------------- ANALYZING '+str(numberof_eplines)+' ELECTRIC POWER LINES -----------------------------------'
-for ii in xrange(len(shapes_eplines)):    #for shape,record in shapes,records:
-    shape = shapes_eplines[ii]    
-    failure = False    
-    if len(shape.points) != 1:  # This is for cases where the shape correspond to a line or a polygon
-        lons_lats_list = shape.points
-        lons_lats_array = np.array(lons_lats_list)
-        lons = lons_lats_array[:,0]
-        lats = lons_lats_array[:,1]
-        asset_name = 'Branch # '+str(records_eplines[ii] [8])  # Recall that records_eplines[ii] [8] corresponds to fields_eplines[ii] [8] = ['Branch', 'N', 11, 0], which is the branch number, given as an integer
-        for ilat in lats:
-            for ilon in lons:
-                #print(ilon,ilat,asset_name)
-                #f.write( str(ii)+'    '+str(ilat)+'    '+str(ilon)+'    '+asset_name+'\n')  # TEST: Write Data
-            
-                # Read value of ASCE-7 windgust at asset site       
-                asce_705_mph, asce_710_RCiii_mph = readASCE7winds(ASCE7_eplines_file,ilon,ilat)         
-                # Obtain value of Hurricane sustained winds at asset site
-                hazard_wind_mph = findHurricaneWind(shapes_tc,records_tc,ilon,ilat)   # Validation: For the Hurricane Ivan Adv.#53 and the Nat. Gas Processing Plant, hazard_wind_mph = 88.0
-                #hazard_wind_mph = 150.0  # This line would be used for TEST only
-            
-                # Compute "floodlvl_m" here, and pass the value into IIFf.failureFunction    
-    
-                # Run failureFunction to determine if the bus will fail
-                failure = IIFf.failureFunction(asset='eptl', wind_mph=hazard_wind_mph, gust_threshold_mph=asce_705_mph )
-    
-                if want2printFailures == 1:
-                    #Typically in a hurricane environment, the value of the maximum 3 second gust over a 1 minute period 
-                    # is on the order of 1.3 times (or 30% higher than) than the 1 min sustained wind. 
-                    # Source: http://www.aoml.noaa.gov/hrd/tcfaq/D4.html        
-                    hazard_gust_mph = 1.3 * hazard_wind_mph    # Recall that 1 mph wind = 1.3 mph gust  
-                    print ii+1,', hurricane gust(mph):', hazard_gust_mph,', ASCE7-05 gust(mph):', asce_705_mph, ', failure: ', failure,', '+asset_name
-    
-                if failure:  
-                    records_eplines[ii][-1] = 'True' # Recall that records_eplines[ii][-1] = 'False' # bus 'Outaged'
-                    break  # Terminate the "for ilon" loop 
-            if failure:
-                break  # Terminate the "for ilat" loop and start analysing the next shape (the next iteration in the for ii loop)
+# Gather the vertices of all the lines. Branches that meet share their end vertices, so each distinct vertex is evaluated only once:
+# the ASCE7 winds, the hurricane winds and the failure condition are obtained for all the distinct vertices at once
+lines_eplines = [ii for ii in xrange(len(shapes_eplines)) if len(shapes_eplines[ii].points) >= 2]  # Shapes that correspond to a line or a polygon (null shapes have no vertices, and keep outage 'False')
+vertices_eplines = [np.array(shapes_eplines[ii].points, dtype=float).reshape(-1,2) for ii in lines_eplines]
+offsets_eplines = np.cumsum([0] + [len(vertices) for vertices in vertices_eplines])  # Vertices of lines_eplines[jj] are offsets_eplines[jj]:offsets_eplines[jj+1]
+if len(vertices_eplines) > 0:
+    lonlat_eplines = np.vstack(vertices_eplines)
+else:
+    lonlat_eplines = np.zeros((0,2))
+ulons_eplines, ulats_eplines, vertex2unique_eplines = uniquePoints(lonlat_eplines[:,0], lonlat_eplines[:,1])
+# Read values of ASCE-7 windgust at the distinct vertices
+asce_705_eplines, asce_710_RCiii_eplines = readASCE7windsArrays(ASCE7_eplines_file,ulons_eplines,ulats_eplines)
+# Obtain values of Hurricane sustained winds at the distinct vertices
+winds_eplines = findHurricaneWinds(shapes_tc,records_tc,ulons_eplines,ulats_eplines,hierarchy_tc)
+# Compute "floodlvl_m" here, and pass the values into IIFf.failureFunctions
+# Run failureFunctions to determine which distinct vertices will fail
+failure_eplines = IIFf.failureFunctions(asset='eptl', wind_mph=winds_eplines, gust_threshold_mph=asce_705_eplines)
+if want_lineContours == 1:
+    # Strongest hurricane wind contour touched by each span between two consecutive vertices of a line part,
+    # and length (km) of each span in each wind band, by intersecting the spans with the contours
+    spanstarts_eplines = []  # Index in lonlat_eplines of the first vertex of each span
+    spanline_eplines = []    # Index jj of the line of each span
+    for jj in xrange(len(lines_eplines)):
+        starts = list(shapes_eplines[lines_eplines[jj]].parts) + [len(vertices_eplines[jj])]
+        for kk in xrange(len(starts)-1):
+            for vv in xrange(offsets_eplines[jj]+starts[kk], offsets_eplines[jj]+starts[kk+1]-1):
+                spanstarts_eplines.append(vv)
+                spanline_eplines.append(jj)
+    spanstarts_eplines = np.array(spanstarts_eplines, dtype=int)
+    spanline_eplines = np.array(spanline_eplines, dtype=int)
+    spanwinds_eplines, windbands_eplines, spanlengths_km_eplines = polylineExposure([lonlat_eplines[vv:vv+2] for vv in spanstarts_eplines],
+                                                                                    [shape.points for shape in shapes_tc],
+                                                                                    [float(record[0]) for record in records_tc],
+                                                                                    hierarchy=hierarchy_tc, geographic=True)
+    # Spans may cross stronger winds than their end vertices; compare them with the weaker ASCE-7 windgust of their two ends
+    # (np.fmin ignores NaN, unless both ends are NaN)
+    span_asce_705_eplines = np.fmin(asce_705_eplines[vertex2unique_eplines[spanstarts_eplines]], asce_705_eplines[vertex2unique_eplines[spanstarts_eplines+1]])
+    spanfailure_eplines = IIFf.failureFunctions(asset='eptl', wind_mph=spanwinds_eplines, gust_threshold_mph=span_asce_705_eplines)
+    # A line fails if any of its spans fails; it touches the strongest wind of its spans, and its length in a band is that of its spans
+    linefailure_eplines = np.zeros(len(lines_eplines), dtype=bool)
+    linefailure_eplines[spanline_eplines[spanfailure_eplines]] = True
+    linewinds_eplines = np.zeros(len(lines_eplines))
+    np.maximum.at(linewinds_eplines, spanline_eplines, spanwinds_eplines)
+    bandlengths_km_eplines = np.zeros((len(lines_eplines), len(windbands_eplines)))
+    np.add.at(bandlengths_km_eplines, spanline_eplines, spanlengths_km_eplines)
+
+lineoutage_eplines = np.zeros(len(lines_eplines), dtype=bool)  # Failure of each line, for the results_file
+branch_eplines = dbf_eplines.column('Branch')
+for jj in xrange(len(lines_eplines)):
+    ii = lines_eplines[jj]
+    asset_name = 'Branch # '+str(branch_eplines[ii])  # ['Branch', 'N', 11, 0] is the branch number, given as an integer
+    vertices = vertex2unique_eplines[offsets_eplines[jj]:offsets_eplines[jj+1]]
+    failure = bool(failure_eplines[vertices].any())  # The line fails if any of its vertices fails
+    if want_lineContours == 1:
+        failure = failure or bool(linefailure_eplines[jj])
+
+    if want2printFailures == 1:
+        # Print the vertices along the line, up to the first one that fails
+        if failure:
+            vertices = vertices[:np.argmax(failure_eplines[vertices])+1]
+        for kk in vertices:
+            #Typically in a hurricane environment, the value of the maximum 3 second gust over a 1 minute period 
+            # is on the order of 1.3 times (or 30% higher than) than the 1 min sustained wind. 
+            # Source: http://www.aoml.noaa.gov/hrd/tcfaq/D4.html        
+            hazard_gust_mph = 1.3 * winds_eplines[kk]    # Recall that 1 mph wind = 1.3 mph gust  
+            print ii+1,', hurricane gust(mph):', hazard_gust_mph,', ASCE7-05 gust(mph):', asce_705_eplines[kk], ', failure: ', failure_eplines[kk],', '+asset_name
+        if want_lineContours == 1:
+            exposed = np.flatnonzero(bandlengths_km_eplines[jj] > 0.0)
+            print ii+1,', strongest hurricane gust along the line(mph):', 1.3 * linewinds_eplines[jj], ', failure: ', failure,', '+asset_name
+            print ii+1,', km exposed to each hurricane gust(mph):', ', '.join(['%.1f: %.2f' % (1.3 * windbands_eplines[kk], bandlengths_km_eplines[jj,kk]) for kk in exposed])
+
+    lineoutage_eplines[jj] = failure
+    if failure:  
+        outage_eplines[ii] = True # line 'outage'
 
 
 ##### GENERATE OUTPUTS ##########################################################################################
@@ -440,43 +486,80 @@ Recall that the set of 3 GIS shapefiles is called a layer:
 .dbf – dbase III table containing attribute information for the shapes in the .shp file
 .shx – shape index file, contains the offset of the records in the .shp file (for random access reading)
 For details visit https://pypi.python.org/pypi/pyshp
+Each *_analyzed layer is written in full with the shape type of its input layer, and stamped with the sizes and modification
+times of the input files (see PointShapefile.stampAnalyzedLayer). While the stamp matches, later runs only rewrite the bytes of
+its 'outage' field (see PointShapefile.updateAnalyzedField), instead of copying every shape and record again.
 '''
 
 # Update/Re-write the Natural Gas Buses shapefiles with the new failure criteria
 # For details visit https://pypi.python.org/pypi/pyshp
-w = shapefile.Writer(shapeType=shapefile.POINT)  # Recall that sf_ngbu.shapeType = 1 ==> Point
-w.fields = list(fields_ngbuses)    # Atributes: shx file  #Do not use sf_ngbu.fields, because it does not have the new 'Outaged' atribute
-w._shapes = list(sf_ngbu.shapes()) # Geometry: shp file
-w.records = list(records_ngbuses)  # Records: dbf file
-if want2printFailures == 2: 
-    print 'Writing NGBuses output shapefiles at... '+myshp_ngbuses+'_analyzed.*'
-w.save(myshp_ngbuses+'_analyzed')
+if updateAnalyzedField(myshp_ngbuses+'_analyzed', myshp_ngbuses, 'outage', np.where(outage_ngbuses, 'True', 'False')):
+    if want2printFailures == 2: 
+        print 'Updating NGBuses outages at... '+myshp_ngbuses+'_analyzed.dbf'
+else:
+    w = shapefile.Writer(shapeType=sf_ngbu.shapeType)  # Recall that sf_ngbu.shapeType = 1 ==> Point
+    w.fields = list(fields_ngbuses)    # Atributes: shx file  #Do not use sf_ngbu.fields, because it does not have the new 'Outaged' atribute
+    w._shapes = list(sf_ngbu.shapes()) # Geometry: shp file
+    w.records = outageRecords(sf_ngbu, outage_ngbuses, NeedNewOutageField_ngbuses)  # Records: dbf file
+    if want2printFailures == 2: 
+        print 'Writing NGBuses output shapefiles at... '+myshp_ngbuses+'_analyzed.*'
+    w.save(myshp_ngbuses+'_analyzed')
+    stampAnalyzedLayer(myshp_ngbuses+'_analyzed', myshp_ngbuses)
 
 
 # Update/Re-write the Electric Power Buses shapefiles with the new failure criteria
-w = shapefile.Writer(shapeType=shapefile.POINT)  # Recall that sf_epbu.shapeType = 1 ==> Point
-w.fields = list(fields_epbuses)    # Atributes: shx file  #Do not use sf_epbu.fields, because it does not have the new 'Outaged' atribute
-w._shapes = list(sf_epbu.shapes()) # Geometry: shp file
-w.records = list(records_epbuses)  # Records: dbf file
-#w.point(sf_epbu.shapes()) #shapes_epbuses)    # Geometry: shp file
-#w.field(sf_epbu.fields)    # Atributes: shx file
-#w.record(records_epbuses)  #Records: dbf file
-if want2printFailures == 2: 
-    print 'Writing EPbuses output shapefiles at... '+myshp_epbuses+'_analyzed.*'
-w.save(myshp_epbuses+'_analyzed')
+if updateAnalyzedField(myshp_epbuses+'_analyzed', myshp_epbuses, 'outage', np.where(outage_epbuses, 'True', 'False')):
+    if want2printFailures == 2: 
+        print 'Updating EPbuses outages at... '+myshp_epbuses+'_analyzed.dbf'
+else:
+    w = shapefile.Writer(shapeType=sf_epbu.shapeType)  # Recall that sf_epbu.shapeType = 1 ==> Point
+    w.fields = list(fields_epbuses)    # Atributes: shx file  #Do not use sf_epbu.fields, because it does not have the new 'Outaged' atribute
+    w._shapes = list(sf_epbu.shapes()) # Geometry: shp file
+    w.records = outageRecords(sf_epbu, outage_epbuses, NeedNewOutageField_epbuses)  # Records: dbf file
+    #w.point(sf_epbu.shapes()) #shapes_epbuses)    # Geometry: shp file
+    #w.field(sf_epbu.fields)    # Atributes: shx file
+    #w.record(records_epbuses)  #Records: dbf file
+    if want2printFailures == 2: 
+        print 'Writing EPbuses output shapefiles at... '+myshp_epbuses+'_analyzed.*'
+    w.save(myshp_epbuses+'_analyzed')
+    stampAnalyzedLayer(myshp_epbuses+'_analyzed', myshp_epbuses)
 
 
 # Update/Re-write the Electric Power Lines shapefiles with the new failure criteria
-w = shapefile.Writer(shapeType=shapefile.POLYGON)  # Recall that sf_eplines.shapeType = 2 ==> Polygon
-w.fields = list(fields_eplines)    # Atributes: shx file  #Do not use sf_epbu.fields, because it does not have the new 'Outaged' atribute
-w._shapes = list(sf_epli.shapes()) # Geometry: shp file
-w.records = list(records_eplines)  # Records: dbf file
-#w.point(sf_epbu.shapes()) #shapes_epbuses)    # Geometry: shp file
-#w.field(sf_epbu.fields)    # Atributes: shx file
-#w.record(records_epbuses)  #Records: dbf file
-if want2printFailures == 2: 
-    print 'Writing EPlines output shapefiles at... '+myshp_eplines+'_analyzed.*'
-w.save(myshp_eplines+'_analyzed')
+if updateAnalyzedField(myshp_eplines+'_analyzed', myshp_eplines, 'outage', np.where(outage_eplines, 'True', 'False')):
+    if want2printFailures == 2: 
+        print 'Updating EPlines outages at... '+myshp_eplines+'_analyzed.dbf'
+else:
+    w = shapefile.Writer(shapeType=sf_epli.shapeType)  # Recall that sf_epli.shapeType = 3 ==> Polyline
+    w.fields = list(fields_eplines)    # Atributes: shx file  #Do not use sf_epbu.fields, because it does not have the new 'Outaged' atribute
+    w._shapes = list(sf_epli.shapes()) # Geometry: shp file
+    w.records = outageRecords(sf_epli, outage_eplines, NeedNewOutageField_eplines)  # Records: dbf file
+    #w.point(sf_epbu.shapes()) #shapes_epbuses)    # Geometry: shp file
+    #w.field(sf_epbu.fields)    # Atributes: shx file
+    #w.record(records_epbuses)  #Records: dbf file
+    if want2printFailures == 2: 
+        print 'Writing EPlines output shapefiles at... '+myshp_eplines+'_analyzed.*'
+    w.save(myshp_eplines+'_analyzed')
+    stampAnalyzedLayer(myshp_eplines+'_analyzed', myshp_eplines)
+
+# Columnar results of this run: one row per asset, keyed by its record number in the layer, with the hurricane gust (mph),
+# the gust threshold (mph) it was compared with, and the failure (see ScenarioResults.py)
+if results_file != None:
+    results = ScenarioResults()
+    results.append(ng_namehint, np.arange(numberof_ngbuses), 1.3 * winds_ngbuses,
+                   IIFf.windGustThresholds('ngpp', asce_705_ngbuses), failure_ngbuses & np.isfinite(lonlat_ngbuses).all(axis=1))
+    results.append(ep_namehint[0], np.arange(numberof_epbuses), 1.3 * winds_epbuses,
+                   IIFf.windGustThresholds(assets_epbuses, asce_705_epbuses), failure_epbuses & np.isfinite(lonlat_epbuses).all(axis=1))
+    if len(lines_eplines) > 0:
+        # Strongest gust and weakest threshold along each line (np.fmax and np.fmin ignore NaN)
+        gusts = 1.3 * np.fmax.reduceat(winds_eplines[vertex2unique_eplines], offsets_eplines[:-1])
+        if want_lineContours == 1:
+            gusts = np.fmax(gusts, 1.3 * np.asarray(linewinds_eplines, dtype=float))
+        thresholds = np.fmin.reduceat(IIFf.windGustThresholds('eptl', asce_705_eplines)[vertex2unique_eplines], offsets_eplines[:-1])
+        results.append(ep_namehint[1], lines_eplines, gusts, thresholds, lineoutage_eplines)
+    if want2printFailures == 2: 
+        print 'Writing results of '+str(len(results))+' assets at... '+results_file
+    results.save(results_file)  # uncompressed, so that loadScenarioResults memory-maps its columns
 
 elapsed_time = (time.time() - start_time)
 if (want2printFailures == 2) or (want2printFailures == 1):
@@ -0,0 +1,57 @@
+# Comparing IIF_failure.failureFunctions, for whole asset layers, with failureFunction, one asset at a time
+#   every combination of the hazards considered (None) or not, with NaN values and every asset code
+# Run from the repository directory: python FailureFunctionsTest.py
+
+import itertools
+import warnings
+import numpy as np
+
+from TestReport import check, report
+import IIF_failure as IIFf
+
+# One value per asset; NaN for some of them, as for sites over water or outside the hazard data
+def testValues(rng, n, low, high):
+    values = rng.uniform(low, high, n)
+    values[rng.uniform(size=n) < 0.1] = np.nan
+    return values
+
+def testFailureFunctions(n):
+    rng = np.random.RandomState(2015)
+    assets = rng.choice(['ngpp', 'npp', 'epp', 'eps', 'eptl'], n)
+    # the wind is always given with its gust threshold, as failureFunction needs both
+    hazards = [{'wind_mph': testValues(rng, n, 0.0, 160.0), 'gust_threshold_mph': testValues(rng, n, 90.0, 180.0)},
+               {'floodlvl_m': testValues(rng, n, 0.0, 3.0)},
+               {'human': testValues(rng, n, -1.0, 1.0)},
+               {'pga_g': testValues(rng, n, 0.0, 1.0)}]
+    for given in itertools.product([False, True], repeat=len(hazards)):
+        kwargs = {}
+        for hazard, use in zip(hazards, given):
+            if use:
+                kwargs.update(hazard)
+        legacy = []
+        for i in xrange(n):
+            # as Python floats, as the legacy code was called
+            legacy.append(IIFf.failureFunction(asset=str(assets[i]), **dict((name, float(values[i])) for name, values in kwargs.items())))
+        batch = IIFf.failureFunctions(asset=assets, **kwargs)
+        check('failureFunctions(%s)' % ', '.join(sorted(kwargs.keys()) or ['no hazard']), np.array_equal(np.array(legacy), batch),
+              '(%d assets, %d failed)' % (n, np.sum(legacy)))
+
+    # single values are broadcast over the asset codes
+    batch = IIFf.failureFunctions(asset=assets, wind_mph=100.0, gust_threshold_mph=120.0)
+    legacy = [IIFf.failureFunction(asset=str(asset), wind_mph=100.0, gust_threshold_mph=120.0) for asset in assets]
+    check('failureFunctions with single hazard values', np.array_equal(np.array(legacy), batch))
+
+# The thresholds compared with the gusts: the ASCE 7 gust, or the 50% loss of the Hazus curve for power plants if lower
+def testWindGustThresholds():
+    assets = np.array(['epp', 'eps', 'epp', 'eptl'])
+    asce_705_mph = np.array([200.0, 200.0, 90.0, np.nan])
+    thresholds = IIFf.windGustThresholds(assets, asce_705_mph)
+    expected = np.array([min(200.0, IIFf.eppThreshold(0.5)), 200.0, 90.0, np.nan])
+    check('windGustThresholds', np.allclose(thresholds, expected, equal_nan=True), str(thresholds))
+
+# Run tests
+warnings.simplefilter('ignore', RuntimeWarning)   # failureFunction takes the mean of all-NaN probabilities
+testFailureFunctions(300)
+testWindGustThresholds()
+
+report()
@@ -1,24 +1,54 @@
 # version Hereld 2015-08-19
 
+import os
+import numpy as np
+from TextDB import loadTextDB
+from scipy.special import ndtr, ndtri    # standard normal CDF and its inverse
+
 #   the basic Curve
 #   is used to represent each of the four curves typical in a fragility plot
 #   and is also used for interpolation calculations
-#   # POSSIBLE BUG: might not work for decreasing and/or non-monotonic functions
+
+#   CurveIndex -- monotonic-segment index of a digitized curve B(A), to invert it by binary search
+#   Digitized curves are not always monotonic (digitizing noise, or dips such as 0.003227 -> 0.000000).
+#   The index keeps the running maximum of B, which never decreases: the first point where the curve
+#   reaches Bval is found by binary search on it, and A is interpolated on the segment that crosses Bval.
+#   So the answer is always where the curve FIRST reaches Bval, whatever the curve does afterwards.
+#   Curves that decrease overall (last B below the first one) are indexed on -B: where they first fall to Bval.
+#   Below the start of the curve the first A is returned, beyond its largest value the last A.
+class CurveIndex(object):
+    def __init__(self, Avec, Bvec):
+        if ( len(Avec) != len(Bvec) ):
+            print ('B(A) must be represented by equal length vectors: proceeding anyway\n')
+        npoints = min(len(Avec), len(Bvec))
+        B = np.asarray(Bvec, dtype=float)[0:npoints]
+        self.sign = -1.0 if (npoints > 1 and B[-1] < B[0]) else 1.0
+        self.A = np.asarray(Avec, dtype=float)[0:npoints]
+        self.B = self.sign * B
+        self.envelope = np.maximum.accumulate(self.B)
+
+    def segments(self, Bval):
+        # for each query: index p of the segment [p-1, p] that first reaches it, fraction along it,
+        # and whether the query is below the start or beyond the largest value of the curve
+        b = self.sign * np.asarray(Bval, dtype=float)
+        p = np.clip(np.searchsorted(self.envelope, b, side='left'), 1, len(self.B) - 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frac = ( b - self.B[p-1] ) / ( self.B[p] - self.B[p-1] )
+        return p, frac, (b <= self.B[0]), (b > self.envelope[-1])
+
+    def lookup(self, Bval):                 # value(s) of A that map to Bval
+        if (len(self.B) < 2):
+            return (self.A[0] if len(self.B) == 1 else np.nan) + 0.0 * np.asarray(Bval, dtype=float)
+        p, frac, below, beyond = self.segments(Bval)
+        Aval = self.A[p-1] + frac*(self.A[p]-self.A[p-1])
+        Aval = np.where(below, self.A[0], np.where(beyond, self.A[-1], Aval))
+        if (np.ndim(Aval) == 0):
+            return float(Aval)
+        return Aval
+
                                         # AfromB -- helper function for interpolating curves.
-def AfromB(Avec,Bvec,Bval):             # given B(A) return value of A that maps to Bval
-#    # POSSIBLE BUG: might not work for decreasing and/or non-monotonic functions
-    if ( len(Avec) != len(Bvec) ):
-        print ('B(A) must be represented by equal length vectors: proceeding anyway\n')
-    if ( Bval <= Bvec[0] ):
-        return Avec[0]
-    if ( Bval > Bvec[-1] ):
-        return Avec[-1]
-    for pnum in range(1,len(Bvec)):
-        if ( Bval <= Bvec[pnum] ):      # is Bval between Bvec[pnum-1] and Bvec[pnum]?
-            frac = ( Bval - Bvec[pnum-1] ) / ( Bvec[pnum] - Bvec[pnum-1] )
-            Aval = Avec[pnum-1] + frac*(Avec[pnum]-Avec[pnum-1])
-            break
-    return Aval
+def AfromB(Avec,Bvec,Bval):             # given B(A) return value of A that maps to Bval (Bval may be an array)
+    return CurveIndex(Avec,Bvec).lookup(Bval)
 
 class Curve:
     def __init__(self):
@@ -27,17 +57,28 @@ class Curve:
         self.nPoints = 0
         self.x = []
         self.y = []
-    def XfromY(self,yval):      # return value of x that maps to yval
-        return AfromB(self.x,self.y,yval)
-    def YfromX(self,xval):      # return value of y that maps to xval
-        return AfromB(self.y,self.x,xval)
+        self.indexes = dict()   # CurveIndex of x(y) and y(x), built on first use (assign new x, y lists rather than editing them)
+                                # an index is never modified, only replaced whole, so threads may share the curve
+    def index(self, Avec, Bvec, key):
+        cached = self.indexes.get(key)
+        if (cached == None or cached[0] is not Avec or cached[1] is not Bvec or cached[2] != (len(Avec), len(Bvec))):
+            cached = (Avec, Bvec, (len(Avec), len(Bvec)), CurveIndex(Avec, Bvec))
+            self.indexes[key] = cached
+        return cached[3]
+    def XfromY(self,yval):      # return value(s) of x that maps to yval
+        return self.index(self.x,self.y,'XfromY').lookup(yval)
+    def YfromX(self,xval):      # return value(s) of y that maps to xval
+        return self.index(self.y,self.x,'YfromX').lookup(xval)
 
 #   Fragility classes
 #       Fragility           the root class -- don't instantiate, it's basically abstract
 #       FragilityCurve      *   represents any of several basic fragility types the are based on curves
 #       WindFragilityCurve  *   *   specific instance that knows about wind, mph, Zo, and Load Loss
+#       LognormalFragility  *   closed-form curves: lognormal CDF of (median, beta) for each Zo, see fitLognormalFragility
 #       FragilityThreshold  *   simple fragility type only understands a threshold -- not implemented
 #       FragilityList       contains potentially mixed list of any kind of Fragility
+#       FragilityRegistry   thresholds of every fragility class loaded so far, computed once (see fragilityRegistry)
+#       ThresholdCache      thresholds used by the assets of one scenario, with hit/miss counters
 class Fragility(object):
     def __init__(self):
         self.name = 'unique'
@@ -61,7 +102,6 @@ class FragilityCurve(Fragility):
         self.xUnit = 'Hectares'
         self.yUnit = 'Fortnights'
         self.curves = []
-        self.tempcurve = Curve()    # used for interpolation calculations
         self.versions = {'Hereld_2015-07-27'}
 
     def configure(self, lines, start, end):
@@ -115,13 +155,26 @@ class FragilityCurve(Fragility):
         # Z[i] is isovalue for curves[i]    len = 4 typically
         #
         # zchrones provides list of isovalues corresponding to each curve
-        # returns X value corresponding to (Y,Z)
-        self.tempcurve.x = zchrones                 # Z values for curves 0,1,2,3
-        self.tempcurve.y = [ self.curves[cnum].XfromY(y) for cnum in range(0,4) ]
-                                                    # tempcurve represents Z(X)
-        return self.tempcurve.YfromX(z)             # at what X do we reach Z?
+        # returns X value corresponding to (Y,Z); y and z may be arrays (broadcast against each other)
+        # nothing is stored on the object, so several threads may call it at once
+        ncurves = min(len(zchrones), len(self.curves))
+        y, z = np.broadcast_arrays(np.asarray(y, dtype=float), np.asarray(z, dtype=float))
+        xs = np.array([ self.curves[cnum].XfromY(y) for cnum in range(0,ncurves) ]).reshape((ncurves,) + y.shape)
+                                                    # xs[:,i] represents Z(X) for query i
+        if (ncurves == 1):
+            x = xs[0]
+        else:
+            p, frac, below, beyond = CurveIndex(range(0,ncurves), zchrones[0:ncurves]).segments(z)
+            columns = xs.reshape(ncurves, -1)
+            queries = np.arange(y.size).reshape(y.shape)
+            x = columns[p-1, queries] + frac*(columns[p, queries] - columns[p-1, queries])
+            x = np.where(below, xs[0], np.where(beyond, xs[-1], x))
+        if (np.ndim(x) == 0):
+            return float(x)                         # at what X do we reach Z?
+        return x
 
 class WindFragilityCurve(FragilityCurve):
+    ZoValues = [ 0.03, 0.35, 0.70, 1.00 ]   # terrain surface roughness (m) of curves[0], curves[1], ...
 
     def __init__(self):
         super(WindFragilityCurve, self).__init__()
@@ -130,7 +183,140 @@ class WindFragilityCurve(FragilityCurve):
     def MPHfromZoLossRatio(self,Zo,LossRatio):
         # the Wind subclass of FragilityCurve knows that its curves correspond to Zo values
         # other subclasses might not be about wind
-        return FragilityCurve.XfromYZ(self,[ 0.03, 0.35, 0.70, 1.00 ],LossRatio,Zo)
+        # Zo may be an array (one roughness per asset): all assets are interpolated across the curves at once
+        # Zo below 0.03 m or above 1.00 m gets the threshold of the nearest curve
+        return FragilityCurve.XfromYZ(self,WindFragilityCurve.ZoValues,LossRatio,Zo)
+
+#   fitLognormal -- closed-form fit of a lognormal CDF, y = Phi( ln(x/median) / beta ), to a digitized curve
+#   The points strictly between 0 and 1 are mapped by the inverse normal CDF to z = probit(y), and z is regressed
+#   on ln(x) by least squares along the line z = (ln(x) - ln(median)) / beta; each point is weighted by the normal
+#   density at z, so that the misfit is measured in y (loss ratio) rather than in z, where the tails would dominate.
+#   Returns median, beta, and the goodness of fit over all points: rms and largest |error| in y, and R^2.
+def fitLognormal(xvec, yvec):
+    x = np.asarray(xvec, dtype=float)
+    y = np.asarray(yvec, dtype=float)
+    npoints = min(len(x), len(y))
+    x = x[0:npoints]
+    y = y[0:npoints]
+    inside = (x > 0) & (y > 0) & (y < 1)
+    if (np.count_nonzero(inside) < 2):
+        return np.nan, np.nan, np.nan, np.nan, np.nan
+    z = ndtri(y[inside])
+    slope, intercept = np.polyfit(np.log(x[inside]), z, 1, w=np.exp(-0.5*z*z))
+    beta = 1.0 / slope
+    median = np.exp(-intercept * beta)
+    residual = ndtr(np.log(np.where(x > 0, x, np.nan) / median) / beta) - y
+    residual = np.where(x > 0, residual, -y)             # the CDF is 0 at x <= 0
+    rms = np.sqrt(np.mean(residual**2))
+    spread = np.sum((y - np.mean(y))**2)
+    r2 = 1.0 - np.sum(residual**2) / spread if (spread > 0) else np.nan
+    return median, beta, rms, np.max(np.abs(residual)), r2
+
+class LognormalFragility(Fragility):
+    def __init__(self):
+        super(LognormalFragility, self).__init__()
+        self.disasterType = 'Wind'
+        self.versions = {'Hereld_2015-07-27'}
+        self.xUnit = 'Peak Gust Wind Speed in Open Terrain (mph)'
+        self.yUnit = 'Building Loss Ratio'
+        self.zchrones = list(WindFragilityCurve.ZoValues)   # Zo (m) of each (median, beta)
+        self.medians = []
+        self.betas = []
+        self.fits = []              # (rms, max |error|, R^2) of each curve, when fitted by fitLognormalFragility
+
+    def configure(self, lines, start, end):
+        for lineNumber in range(start,end):
+            keyvalue = lines[lineNumber].split('=')
+            keyword = keyvalue[0].strip().lower()
+            if (len(keyvalue) > 1):
+                value = keyvalue[1].strip()
+            else:
+                value = ''
+
+            # select lines that describe next entry
+            if (keyword == 'version'):
+                self.version = value
+            if (keyword == 'date'):
+                self.date = value
+            if (keyword == 'description'):
+                self.description = value
+            if (keyword == 'fragility class'):
+                self.vulnerabilityClass = value.strip('\'')
+            if (keyword == 'x unit'):
+                self.xUnit = value.strip('\'')
+            if (keyword == 'y unit'):
+                self.yUnit = value.strip('\'')
+            if (keyword == 'zo'):                   # Zo1 Zo2 ...  (m)
+                self.zchrones = [float(s) for s in value.split()]
+            if (keyword == 'median'):               # median1 median2 ...  (x units)
+                self.medians = [float(s) for s in value.split()]
+            if (keyword == 'beta'):                 # beta1 beta2 ...  (standard deviation of ln x)
+                self.betas = [float(s) for s in value.split()]
+
+    def parameters(self, Zo):
+        # median and beta at Zo (may be an array): ln(median) and beta are interpolated between the curves,
+        # and Zo beyond the first or last curve gets the parameters of that curve
+        ncurves = min(len(self.zchrones), len(self.medians), len(self.betas))
+        Zo = np.asarray(Zo, dtype=float)
+        median = np.exp(np.interp(Zo, self.zchrones[0:ncurves], np.log(self.medians[0:ncurves])))
+        beta = np.interp(Zo, self.zchrones[0:ncurves], self.betas[0:ncurves])
+        return median, beta
+
+    def LossRatioFromMPHZo(self, mph, Zo):
+        # lognormal CDF; mph and Zo may be arrays (broadcast against each other)
+        median, beta = self.parameters(Zo)
+        mph = np.asarray(mph, dtype=float)
+        with np.errstate(divide='ignore'):
+            p = ndtr(np.log(mph / median) / beta)
+        if (np.ndim(p) == 0):
+            return float(p)
+        return p
+
+    def MPHfromZoLossRatio(self, Zo, LossRatio):
+        # inverse CDF: wind at which LossRatio is reached; Zo and LossRatio may be arrays
+        median, beta = self.parameters(Zo)
+        x = median * np.exp(beta * ndtri(np.asarray(LossRatio, dtype=float)))
+        if (np.ndim(x) == 0):
+            return float(x)
+        return x
+
+    def toTextLines(self):
+        # entry in the fragility DB format, read back by FragilityList with 'Fragility Type' = 'Lognormal'
+        lines = [ "Version = 'Hereld_2015-07-27'",
+                  'Date = %s' % self.date,
+                  'Description = %s' % self.description,
+                  "Fragility Class = '%s'" % self.vulnerabilityClass,
+                  "Fragility Type = 'Lognormal'",
+                  "X Unit = '%s'" % self.xUnit,
+                  "Y Unit = '%s'" % self.yUnit,
+                  'Zo = ' + ' '.join(['%f' % z for z in self.zchrones]),
+                  'Median = ' + ' '.join(['%f' % m for m in self.medians]),
+                  'Beta = ' + ' '.join(['%f' % b for b in self.betas]) ]
+        for i in range(0,len(self.fits)):
+            lines.append('# Zo %.2f m: rms error %.4f, max error %.4f, R^2 %.4f' % ((self.zchrones[i],) + tuple(self.fits[i])))
+        lines.append('End')
+        return lines
+
+#   fitLognormalFragility -- LognormalFragility with one (median, beta) fitted to each curve of a FragilityCurve
+#   (a WindFragilityCurve loaded from a DB, or registered from arrays as in IIF_failure)
+#   The fitted class is named after the digitized one plus suffix, so that both can be loaded side by side
+lognormalSuffix = '_LN'
+
+def fitLognormalFragility(fc, zchrones = WindFragilityCurve.ZoValues, suffix = lognormalSuffix):
+    lf = LognormalFragility()
+    lf.vulnerabilityClass = fc.vulnerabilityClass.strip('\'') + suffix
+    lf.description = getattr(fc, 'description', lf.description)
+    lf.date = getattr(fc, 'date', lf.date)
+    lf.xUnit = getattr(fc, 'xUnit', lf.xUnit)
+    lf.yUnit = getattr(fc, 'yUnit', lf.yUnit)
+    ncurves = min(len(zchrones), len(fc.curves))
+    lf.zchrones = list(zchrones[0:ncurves])
+    for cnum in range(0,ncurves):
+        median, beta, rms, maxerror, r2 = fitLognormal(fc.curves[cnum].x, fc.curves[cnum].y)
+        lf.medians.append(median)
+        lf.betas.append(beta)
+        lf.fits.append((rms, maxerror, r2))
+    return lf
 
 class FragilityThreshold(Fragility):
     def __init__(self):
@@ -174,17 +360,32 @@ class FragilityList:
             'Curves':FragilityCurve,
             'WindCurves':WindFragilityCurve,
             'Threshold':FragilityThreshold,
+            'Lognormal':LognormalFragility,
             }
 
-    def appendFragilityTypesFromFile(self,filename):
+    # defaultType is used for entries without a 'Fragility Type' line (e.g. 'WindCurves')
+    # the text is only parsed when it changed since the last run (see TextDB)
+    # Every entry is registered in fragilityRegistry under this file (see fragilitySource)
+    def appendFragilityTypesFromFile(self,filename,defaultType=''):
+        columns = loadTextDB(filename, 'fragilities ' + defaultType,
+                             lambda filename: fragilityColumns(self.readFragilityTypesFromFile(filename, defaultType),
+                                                               self.fragilityTypeMappings))
+        source = fragilitySource(filename)
+        for fclass, fragility in fragilitiesFromColumns(columns, self.fragilityTypeMappings):
+            self.entries[fclass] = fragility
+            fragilityRegistry.register(fclass, fragility, source)
+
+    # list of (fragility class, Fragility) described in a text DB
+    def readFragilityTypesFromFile(self,filename,defaultType=''):
         fragilityFile = open(filename,'r')
         linesoftext = fragilityFile.readlines()
+        entries = []
 
         startLine = -1
         endLine = -1
         lineNumber = 0
         createNewEntry = 0
-        ftype = ''  # Fragility Type
+        ftype = defaultType  # Fragility Type
         fclass = '' # Fragility Class
         while (lineNumber < len(linesoftext)):
             keyvalue = linesoftext[lineNumber].split('=')
@@ -211,10 +412,11 @@ class FragilityList:
                 # initialize new fragility entry
                 # IMPORTANT -- replace with factory that uses "VERSION" (rename this)
                 #   to decide which subclass of Fragility to instantiate here
-                self.entries[fclass] = self.fragilityTypeMappings[ftype]()
+                fragility = self.fragilityTypeMappings[ftype]()
                 ### self.entries.append(WindFragilityCurve())
                 # fill the object with the data
-                self.entries[fclass].configure(linesoftext,startLine,endLine)
+                fragility.configure(linesoftext,startLine,endLine)
+                entries.append((fclass, fragility))
                 # createNewEntry housekeeping
                 createNewEntry = 0
                 startLine = -1
@@ -223,6 +425,192 @@ class FragilityList:
             # while loop housekeeping
             lineNumber += 1
         fragilityFile.close()
+        return entries
+
+#   fragilityColumns -- the compiled form of a fragility DB (see TextDB): the entries of readFragilityTypesFromFile as arrays
+#   Every attribute that configure() reads is kept where it differs from that of a new fragility of the same type:
+#   text as one string per entry, lists of numbers as one flat array with the offset of each entry, and a flag
+#   per entry telling whether it was set. The curves of all entries are kept the same way, with their own offsets.
+fragilityTextAttributes = ('version', 'date', 'description', 'vulnerabilityClass', 'xUnit', 'yUnit', 'threshold', 'units')
+fragilityListAttributes = ('xRange', 'yRange', 'zchrones', 'medians', 'betas')
+curveTextAttributes = ('name', 'cnum', 'nPoints')
+curveListAttributes = ('x', 'y')
+
+def fragilityColumns(entries, typeMappings):
+    typeNames = dict([(ftype, name) for name, ftype in typeMappings.items()])
+    fragilities = [fragility for fclass, fragility in entries]
+    curves = [curve for fragility in fragilities for curve in getattr(fragility, 'curves', [])]
+    columns = {'fclass': np.array([fclass for fclass, fragility in entries], dtype=str),
+               'ftype': np.array([typeNames[type(fragility)] for fragility in fragilities], dtype=str),
+               'curveOffsets': np.cumsum([0] + [len(getattr(fragility, 'curves', [])) for fragility in fragilities])}
+    attributeColumns(columns, '', fragilities, [type(f)() for f in fragilities],
+                     fragilityTextAttributes, fragilityListAttributes)
+    attributeColumns(columns, 'curve.', curves, [Curve()] * len(curves), curveTextAttributes, curveListAttributes)
+    return columns
+
+def attributeColumns(columns, prefix, objects, defaults, textAttributes, listAttributes):
+    for a in textAttributes:
+        values = [getattr(o, a, None) for o in objects]
+        given = [isinstance(v, str) and v != getattr(d, a, None) for v, d in zip(values, defaults)]
+        columns[prefix + a] = np.array([v if g else '' for v, g in zip(values, given)], dtype=str)
+        columns[prefix + a + 'Set'] = np.array(given, dtype=bool)
+    for a in listAttributes:
+        values = [getattr(o, a, None) for o in objects]
+        given = [v != None and list(v) != getattr(d, a, None) for v, d in zip(values, defaults)]
+        values = [list(v) if g else [] for v, g in zip(values, given)]
+        columns[prefix + a] = np.array([x for v in values for x in v], dtype=float)
+        columns[prefix + a + 'Offsets'] = np.cumsum([0] + [len(v) for v in values])
+        columns[prefix + a + 'Set'] = np.array(given, dtype=bool)
+
+# list of (fragility class, Fragility) of fragilityColumns
+def fragilitiesFromColumns(columns, typeMappings):
+    fragilities = [typeMappings[ftype]() for ftype in columns['ftype'].tolist()]
+    curves = [Curve() for i in xrange(int(columns['curveOffsets'][-1]))]
+    setAttributes(columns, '', fragilities, fragilityTextAttributes, fragilityListAttributes)
+    setAttributes(columns, 'curve.', curves, curveTextAttributes, curveListAttributes)
+    offsets = columns['curveOffsets'].tolist()
+    for i, fragility in enumerate(fragilities):
+        if (hasattr(fragility, 'curves') or offsets[i+1] > offsets[i]):
+            fragility.curves = curves[offsets[i]:offsets[i+1]]
+    return zip(columns['fclass'].tolist(), fragilities)
+
+def setAttributes(columns, prefix, objects, textAttributes, listAttributes):
+    for a in textAttributes:
+        for o, v, g in zip(objects, columns[prefix + a].tolist(), columns[prefix + a + 'Set'].tolist()):
+            if (g):
+                setattr(o, a, v)
+    for a in listAttributes:
+        values = columns[prefix + a].tolist()
+        offsets = columns[prefix + a + 'Offsets'].tolist()
+        for i, (o, g) in enumerate(zip(objects, columns[prefix + a + 'Set'].tolist())):
+            if (g):
+                setattr(o, a, values[offsets[i]:offsets[i+1]])
+
+# registry source of the fragilities read from a file: its absolute path
+def fragilitySource(filename):
+    return os.path.abspath(filename)
+
+#   FragilityRegistry
+#   every fragility class loaded in this process (by any FragilityList, or registered from hard-coded curves
+#   such as those in IIF_failure), with the thresholds asked so far for each (class, Zo, loss ratio).
+#   The curves of a class are interpolated only the first time a threshold is asked.
+#   Classes are registered per source (a file, see fragilitySource, or a name such as IIF_failure's), so a file
+#   that reuses a class name only replaces the curves of that class loaded from the same file.
+class FragilityRegistry(object):
+    def __init__(self):
+        self.entries = dict()       # (source, fragility class) -> Fragility
+        self.thresholds = dict()    # (source, fragility class, Zo, loss ratio) -> threshold
+
+    def register(self, fclass, fragility, source = ''):
+        self.entries[(source, fclass)] = fragility
+        fragility.registryKey = (source, fclass)
+        self.invalidate(source, fclass)             # the new curves may give other thresholds
+
+    # forget the thresholds of a class of a source, of every class of a source, or all of them
+    def invalidate(self, source = None, fclass = None):
+        if (source == None):
+            self.thresholds.clear()
+            return
+        for key in [key for key in self.thresholds if key[0] == source and (fclass == None or key[1] == fclass)]:
+            del self.thresholds[key]
+
+    def registerCurves(self, fclass, xs, ys, ftype = WindFragilityCurve, source = ''):
+        # fragility from arrays (one x and one y list per curve, from the lowest Zo up)
+        fragility = ftype()
+        fragility.vulnerabilityClass = fclass
+        for cnum in range(0,len(xs)):
+            curve = Curve()
+            curve.cnum = cnum + 1
+            curve.x = [float(v) for v in xs[cnum]]
+            curve.y = [float(v) for v in ys[cnum]]
+            curve.nPoints = len(curve.x)
+            fragility.curves.append(curve)
+        self.register(fclass, fragility, source)
+        return fragility
+
+    def has(self, fclass, source = ''):
+        return ((source, fclass) in self.entries)
+
+    # is the threshold of (class, Zo, loss ratio) of a source already known?
+    def cached(self, fclass, Zo, lossRatio, source = ''):
+        return ((source, fclass, float(Zo), float(lossRatio)) in self.thresholds)
+
+    def threshold(self, fclass, Zo, lossRatio, source = ''):
+        fragility = self.entries[(source, fclass)]
+        if (np.ndim(Zo) > 0):                       # one threshold per asset: each distinct Zo is computed once
+            Zos, which = np.unique(np.asarray(Zo, dtype=float), return_inverse=True)
+            missing = [ z for z in Zos if (source, fclass, z, float(lossRatio)) not in self.thresholds ]
+            if (len(missing) > 0):                  # interpolated all together
+                values = np.atleast_1d(fragility.MPHfromZoLossRatio(np.array(missing), lossRatio))
+                for z, value in zip(missing, values):
+                    self.thresholds[(source, fclass, z, float(lossRatio))] = float(value)
+            thresholds = np.array([ self.thresholds[(source, fclass, z, float(lossRatio))] for z in Zos ])
+            return thresholds[which].reshape(np.shape(Zo))
+        key = (source, fclass, float(Zo), float(lossRatio))
+        if (key not in self.thresholds):
+            self.thresholds[key] = fragility.MPHfromZoLossRatio(Zo, lossRatio)
+        return self.thresholds[key]
+
+# the registry shared by every FragilityList and by IIF_failure
+fragilityRegistry = FragilityRegistry()
+
+#   ThresholdCache
+#   the 'simpleThreshold' of the fragilities met in one scenario, each (fragility, Zo, criteria) computed once and
+#   reused by every asset. Fragilities loaded from a file are computed through fragilityRegistry (so later scenarios
+#   reuse its interpolations); the others are computed directly, and the registry is never changed.
+#   It counts, per scenario, the thresholds already known (hits) and those computed (misses).
+#   CoupledContext fills it for all of its assets before looping over them.
+class ThresholdCache(object):
+    def __init__(self, registry = None):
+        self.registry = fragilityRegistry if (registry == None) else registry
+        self.thresholds = dict()    # (fragility key, Zo, criteria) -> threshold
+        self.hits = 0
+        self.misses = 0
+
+    # (source, class) of fragility f in the registry, or f itself if it was not registered
+    def keyOf(self, f):
+        key = getattr(f, 'registryKey', None)
+        if (key != None and self.registry.entries.get(key) is f):
+            return key
+        return f
+
+    # thresholds of fragility f at every Zo in Zos, those not known yet computed all together
+    def compute(self, f, key, Zos, criteria):
+        missing = [ z for z in Zos if (key, z, criteria) not in self.thresholds ]
+        self.misses += len(missing)
+        self.hits += len(Zos) - len(missing)
+        if (len(missing) > 0):
+            if (key is f):
+                values = f.MPHfromZoLossRatio(np.array(missing), criteria)
+            else:
+                values = self.registry.threshold(key[1], np.array(missing), criteria, key[0])
+            for z, value in zip(missing, np.atleast_1d(values)):
+                self.thresholds[(key, z, criteria)] = float(value)
+        return [ self.thresholds[(key, z, criteria)] for z in Zos ]
+
+    def checkType(self, f):
+        if (f.disasterType != 'Wind'):
+            raise ValueError('no threshold for disaster type %s (fragility class %s)' % (f.disasterType, f.vulnerabilityClass))
+
+    def threshold(self, f, Zo, criteria):
+        # TODO: Need generalized
+        if (f.disasterType == 'Flood'):
+            return 0.5
+        self.checkType(f)
+        return self.compute(f, self.keyOf(f), [float(Zo)], float(criteria))[0]
+
+    def fill(self, f, Zo, criteria):
+        # thresholds of fragility f at every Zo of an array, the missing ones interpolated all together
+        if (f.disasterType == 'Flood'):
+            return
+        self.checkType(f)
+        self.compute(f, self.keyOf(f), np.unique(np.asarray(Zo, dtype=float)).tolist(), float(criteria))
+
+    # forget the thresholds of this scenario (e.g. after reloading fragilities), and start counting again
+    def invalidate(self):
+        self.thresholds.clear()
+        self.hits = 0
+        self.misses = 0
 
 
 # usage
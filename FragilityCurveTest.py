@@ -0,0 +1,114 @@
+# Comparing the fragility interpolation (CurveIndex, FragilityCurve.XfromYZ) with the legacy AfromB,
+# on the digitized curves of HurricaneFragilityDB.txt, one Zo at a time and for arrays of Zo
+# Run from the repository directory: python FragilityCurveTest.py
+
+import numpy as np
+
+import TextDB
+from TestReport import check, report
+from Fragility import FragilityList, CurveIndex, AfromB, WindFragilityCurve, ThresholdCache, fragilityRegistry
+
+# Legacy AfromB of Fragility.py: linear scan for the first point at or above Bval
+def legacyAfromB(Avec,Bvec,Bval):
+    if ( Bval <= Bvec[0] ):
+        return Avec[0]
+    if ( Bval > Bvec[-1] ):
+        return Avec[-1]
+    for pnum in range(1,len(Bvec)):
+        if ( Bval <= Bvec[pnum] ):      # is Bval between Bvec[pnum-1] and Bvec[pnum]?
+            frac = ( Bval - Bvec[pnum-1] ) / ( Bvec[pnum] - Bvec[pnum-1] )
+            Aval = Avec[pnum-1] + frac*(Avec[pnum]-Avec[pnum-1])
+            break
+    return Aval
+
+# Legacy XfromYZ of FragilityCurve: the x of each curve at y, then interpolated across the curves at z
+def legacyXfromYZ(fragility,zchrones,y,z):
+    xs = [ legacyAfromB(fragility.curves[cnum].x, fragility.curves[cnum].y, y) for cnum in range(0,4) ]
+    return legacyAfromB(xs, zchrones, z)
+
+# On a curve that never decreases both give the same x; where the digitized curve dips, the new index
+# gives where the curve first reaches y (the legacy scan may stop on a later point of the dip)
+def testCurves(fragilities, lossRatios):
+    for fclass in sorted(fragilities.entries):
+        for curve in fragilities.entries[fclass].curves:
+            x = np.array(curve.x)
+            y = np.array(curve.y)
+            legacy = np.array([legacyAfromB(curve.x, curve.y, b) for b in lossRatios])
+            batch = AfromB(curve.x, curve.y, lossRatios)
+            rising = (np.diff(y) >= 0).all()
+            if (rising):
+                ok = np.allclose(legacy, batch, rtol=1e-12, atol=1e-9)
+            else:
+                first = np.array([x[np.flatnonzero(y >= b)[0]] if (b <= y.max()) else x[-1] for b in lossRatios])
+                ok = (batch <= first + 1e-9).all() and np.allclose(np.interp(batch, x, y)[lossRatios <= y.max()],
+                                                                  np.maximum(lossRatios, y[0])[lossRatios <= y.max()], atol=1e-9)
+            check('AfromB vs legacy, %s %s' % (fclass, curve.name.strip("'")), ok,
+                  '' if (rising) else '(not monotonic: first crossing, %d of %d differ from legacy)' %
+                  ((~np.isclose(legacy, batch)).sum(), len(lossRatios)))
+
+def testThresholds(fragilities, lossRatios):
+    Zo = np.linspace(0.0, 1.2, 25)
+    for fclass in sorted(fragilities.entries):
+        f = fragilities.entries[fclass]
+        rising = all([(np.diff(curve.y) >= 0).all() for curve in f.curves])
+        legacy = np.array([[legacyXfromYZ(f, WindFragilityCurve.ZoValues, y, z) for z in Zo] for y in lossRatios])
+        batch = f.MPHfromZoLossRatio(Zo[None, :], lossRatios[:, None])
+        scalar = np.array([[f.MPHfromZoLossRatio(z, y) for z in Zo] for y in lossRatios])
+        check('MPHfromZoLossRatio arrays vs one value at a time, ' + fclass, np.allclose(batch, scalar, rtol=1e-12))
+        if (rising):
+            check('MPHfromZoLossRatio vs legacy XfromYZ, ' + fclass, np.allclose(legacy, batch, rtol=1e-12, atol=1e-9),
+                  '(%d loss ratios x %d Zo)' % legacy.shape)
+        else:
+            differ = ~np.isclose(legacy, batch)
+            check('MPHfromZoLossRatio vs legacy XfromYZ, ' + fclass, (batch[differ] <= legacy[differ]).all(),
+                  '(dips in the curves: %d of %d thresholds lower, where the curve first reaches the loss ratio)' % (differ.sum(), differ.size))
+
+def testCurveIndex():
+    index = CurveIndex([0.0, 1.0, 2.0, 3.0, 4.0], [0.0, 0.5, 0.2, 0.8, 1.0])
+    check('CurveIndex first crossing of a curve with a dip', np.allclose(index.lookup([0.25, 0.5, 0.6, 2.0]), [0.5, 1.0, 8.0 / 3.0, 4.0]))
+    falling = CurveIndex([0.0, 1.0, 2.0], [1.0, 0.5, 0.0])
+    check('CurveIndex of a decreasing curve vs legacy', np.allclose(falling.lookup([1.0, 0.75, 0.25, -1.0]), [0.0, 0.5, 1.5, 2.0]))
+
+# Thresholds of a scenario, for the fragilities of the DB and for one built here (never registered)
+def testThresholdCache(fragilities):
+    Zo = np.array([0.03, 0.2, 0.2, 0.5, 1.0])
+    unregistered = WindFragilityCurve()
+    unregistered.vulnerabilityClass = 'Unregistered'
+    unregistered.curves = fragilities.entries[sorted(fragilities.entries)[0]].curves
+    entries = dict(fragilityRegistry.entries)
+
+    cache = ThresholdCache()
+    for f in fragilities.entries.values() + [unregistered]:
+        cache.fill(f, Zo, 0.5)
+    check('ThresholdCache.fill computes each distinct Zo once', cache.misses == 4 * (len(fragilities.entries) + 1) and cache.hits == 0)
+    ok = True
+    for f in fragilities.entries.values() + [unregistered]:
+        ok = ok and np.allclose([cache.threshold(f, z, 0.5) for z in Zo], f.MPHfromZoLossRatio(Zo, 0.5), rtol=1e-12)
+    check('ThresholdCache.threshold after fill', ok and cache.misses == 4 * (len(fragilities.entries) + 1),
+          '(%d computed, %d reused)' % (cache.misses, cache.hits))
+    check('ThresholdCache leaves the fragility registry as it is', fragilityRegistry.entries == entries and
+          not hasattr(unregistered, 'registryKey'))
+
+    # invalidate() forgets the thresholds of its own scenario only
+    other = ThresholdCache()
+    other.threshold(unregistered, 0.2, 0.5)
+    known = len(fragilityRegistry.thresholds)
+    cache.invalidate()
+    cache.threshold(unregistered, 0.2, 0.5)
+    other.threshold(unregistered, 0.2, 0.5)
+    check('ThresholdCache.invalidate forgets the thresholds of its scenario only',
+          (cache.misses, cache.hits, other.misses, other.hits) == (1, 0, 1, 1) and len(fragilityRegistry.thresholds) == known)
+
+# Test data files
+TextDB.cacheEnabled = False     # no cache left next to the DB of the repository
+fragilities = FragilityList()
+fragilities.appendFragilityTypesFromFile('HurricaneFragilityDB.txt', 'WindCurves')
+lossRatios = np.concatenate(([0.0, 0.001, 0.003227], np.linspace(0.01, 0.99, 50), [0.999, 1.0]))
+
+# Run tests
+testCurves(fragilities, lossRatios)
+testThresholds(fragilities, lossRatios[1:-1])
+testCurveIndex()
+testThresholdCache(fragilities)
+
+report()
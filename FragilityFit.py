@@ -0,0 +1,30 @@
+# Fit lognormal fragilities to the digitized curves of a fragility DB
+#   prints the (median, beta) fitted to each Zo curve with its goodness of fit,
+#   and writes them as a DB that FragilityList reads back ('Fragility Type' = 'Lognormal'),
+#   each class renamed with the '_LN' suffix (e.g. 'Hurricane_IndNoReinMEA_LN')
+#
+# usage: python FragilityFit.py HurricaneFragilityDB.txt [HurricaneFragilityDB_lognormal.txt]
+
+import sys
+from Fragility import FragilityList, fitLognormalFragility
+
+inputfile = 'HurricaneFragilityDB.txt'
+if (len(sys.argv) > 1):
+    inputfile = sys.argv[1]
+outputfile = inputfile.rsplit('.', 1)[0] + '_lognormal.txt'
+if (len(sys.argv) > 2):
+    outputfile = sys.argv[2]
+
+fragilities = FragilityList()
+fragilities.appendFragilityTypesFromFile(inputfile, 'WindCurves')
+
+f = open(outputfile, 'w')
+for fclass in sorted(fragilities.entries):
+    lf = fitLognormalFragility(fragilities.entries[fclass])
+    print fclass + ' -> ' + lf.vulnerabilityClass
+    for i in range(0,len(lf.medians)):
+        rms, maxerror, r2 = lf.fits[i]
+        print '    Zo %.2f m: median %7.2f  beta %.4f    rms error %.4f  max error %.4f  R^2 %.4f' % (lf.zchrones[i], lf.medians[i], lf.betas[i], rms, maxerror, r2)
+    f.write('\n'.join(lf.toTextLines()) + '\n\n')
+f.close()
+print 'Lognormal fragilities written to ' + outputfile
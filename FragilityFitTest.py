@@ -0,0 +1,54 @@
+# Checking the lognormal fits (fitLognormalFragility) against the digitized curves of HurricaneFragilityDB.txt,
+# and reading back the DB entries they are written as
+# Run from the repository directory: python FragilityFitTest.py
+
+import os
+import tempfile
+import numpy as np
+
+import TextDB
+from TestReport import check, report
+from Fragility import FragilityList, fitLognormal, fitLognormalFragility
+
+# The fits stay close to the digitized curves, and FragilityList reads back what toTextLines writes
+def testLognormal(fragilities, lossRatios):
+    for fclass in sorted(fragilities.entries):
+        fc = fragilities.entries[fclass]
+        lf = fitLognormalFragility(fc)
+        worst = max([maxerror for rms, maxerror, r2 in lf.fits])
+        check('lognormal fit of ' + fclass, worst < 0.1 and min([r2 for rms, maxerror, r2 in lf.fits]) > 0.98,
+              '(largest loss ratio error %.4f)' % worst)
+        errors = [np.abs(lf.LossRatioFromMPHZo(curve.x, lf.zchrones[cnum]) - curve.y).max() for cnum, curve in enumerate(fc.curves)]
+        check('lognormal fit errors vs the digitized points, ' + fclass,
+              np.allclose(errors, [maxerror for rms, maxerror, r2 in lf.fits]) and
+              np.allclose(lf.medians, [fitLognormal(curve.x, curve.y)[0] for curve in fc.curves]))
+
+        mph = lf.MPHfromZoLossRatio(np.array(lf.zchrones)[None, :], lossRatios[:, None])
+        check('lognormal thresholds invert the loss ratios, ' + lf.vulnerabilityClass,
+              np.allclose(lf.LossRatioFromMPHZo(mph, np.array(lf.zchrones)[None, :]), lossRatios[:, None]))
+
+        filename = textFile([line + '\n' for line in lf.toTextLines()])
+        back = dict(FragilityList().readFragilityTypesFromFile(filename))[lf.vulnerabilityClass]
+        os.remove(filename)
+        check('lognormal DB entry read back, ' + lf.vulnerabilityClass,       # written with 6 decimals
+              np.allclose(back.medians, lf.medians, rtol=0, atol=1e-6) and np.allclose(back.betas, lf.betas, rtol=0, atol=1e-6) and
+              np.allclose(back.zchrones, lf.zchrones))
+
+# A temporary text DB holding lines
+def textFile(lines):
+    handle, filename = tempfile.mkstemp(suffix='.txt')
+    f = os.fdopen(handle, 'w')
+    f.writelines(lines)
+    f.close()
+    return filename
+
+# Test data files
+TextDB.cacheEnabled = False     # no cache left next to the DB of the repository
+fragilities = FragilityList()
+fragilities.appendFragilityTypesFromFile('HurricaneFragilityDB.txt', 'WindCurves')
+lossRatios = np.linspace(0.01, 0.99, 50)
+
+# Run tests
+testLognormal(fragilities, lossRatios)
+
+report()
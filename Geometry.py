@@ -0,0 +1,730 @@
+# Geometric kernels shared by the disaster layers and the analysis scripts
+#
+#   pointsInPolygon()     crossing-number test of many points against one polygon
+#   maxValueInPolygons()  largest polygon value covering each of many points
+#   boundingBoxes()       [xmin, ymin, xmax, ymax] of each polygon
+#   uniquePoints()        distinct (x,y) points, and where each input point went
+#   BoundingBoxIndex      STR-packed R-tree over bounding boxes, to find candidate polygons
+#   PolygonRaster         maxValueInPolygons() precomputed on a regular grid
+#   polygonArea()         signed shoelace area of a polygon
+#   PolygonHierarchy      containment tree of nested polygons (e.g. isotachs), searched from the outside in
+#   segmentCrossings()    where many line segments cross the edges of one polygon
+#   polylineExposure()    largest polygon value along each polyline, and its length in each value band
+#   pointsWithinDistance() every pair of points from two sets that are closer than a distance (k-d tree)
+#   GeometryStore         all shapes and attributes of a shapefile, decoded once into flat typed arrays
+#
+# All functions take NumPy arrays of longitudes (x) and latitudes (y), so that a
+# whole asset layer can be evaluated in one call instead of one point at a time.
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Upper bound on the size of the (points x edges) work arrays built at once
+CHUNKSIZE = 1000000
+
+# Mean Earth radius, for distances and lengths in km
+EARTH_RADIUS_KM = 6371.0088
+
+# Test which points are inside a polygon
+#   x, y    arrays of point coordinates (longitude, latitude)
+#   poly    sequence of (x,y) vertices, e.g. shapefile shape.points
+#   returns a boolean array with the shape of x
+# Same rules as the point_in_poly() recipe from
+# http://geospatialpython.com/2011/08/point-in-polygon-2-on-line.html
+# (vertices and points on horizontal edges count as inside), applied to all points at once.
+def pointsInPolygon(x, y, poly):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    inside = np.zeros(x.shape, dtype=bool)
+    poly = np.asarray(poly, dtype=float).reshape(-1, 2)
+    if (x.size == 0 or len(poly) == 0):
+        return inside
+
+    # edges p1 -> p2 of the closed ring
+    p1x = poly[:, 0]
+    p1y = poly[:, 1]
+    p2x = np.roll(p1x, -1)
+    p2y = np.roll(p1y, -1)
+    ymin = np.minimum(p1y, p2y)
+    ymax = np.maximum(p1y, p2y)
+    xmax = np.maximum(p1x, p2x)
+    xmin = np.minimum(p1x, p2x)
+    dy = p2y - p1y
+    slope = np.where(dy != 0.0, (p2x - p1x) / np.where(dy != 0.0, dy, 1.0), 0.0)
+    # point_in_poly() checks horizontal boundaries on the open chain only
+    horizontal = (dy == 0.0)
+    horizontal[-1] = False
+
+    xflat = x.ravel()
+    yflat = y.ravel()
+    flat = inside.ravel()
+    step = max(1, CHUNKSIZE // len(poly))
+    for start in range(0, len(xflat), step):
+        xs = xflat[start:start + step, None]
+        ys = yflat[start:start + step, None]
+
+        # crossing number
+        spans = (ys > ymin) & (ys <= ymax) & (xs <= xmax)
+        xints = (ys - p1y) * slope + p1x
+        crossings = spans & ((p1x == p2x) | (xs <= xints))
+        odd = (np.count_nonzero(crossings, axis=1) % 2 == 1)
+
+        # points on a vertex or on a horizontal edge
+        vertex = ((xs == p1x) & (ys == p1y)).any(axis=1)
+        edge = (horizontal & (ys == p1y) & (xs > xmin) & (xs < xmax)).any(axis=1)
+
+        flat[start:start + step] = odd | vertex | edge
+
+    return inside
+
+# Find the largest value of the polygons that contain each point
+#   x, y        arrays of point coordinates (longitude, latitude)
+#   polygons    list of vertex sequences
+#   values      one value per polygon (e.g. wind speed of an isotach)
+#   default     value for points outside every polygon
+#   index       optional BoundingBoxIndex over polygons; only candidate pairs get the exact test
+def maxValueInPolygons(x, y, polygons, values, default=0.0, index=None):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    result = np.empty(x.shape, dtype=float)
+    result.fill(default)
+
+    if (index == None):
+        for poly, value in zip(polygons, values):
+            inside = pointsInPolygon(x, y, poly)
+            result[inside] = np.maximum(result[inside], value)
+        return result
+
+    xflat = x.ravel()
+    yflat = y.ravel()
+    flat = result.ravel()
+    points, ids = index.query(xflat, yflat)
+    order = np.argsort(ids, kind='mergesort')
+    points = points[order]
+    ids = ids[order]
+    bounds = np.flatnonzero(np.diff(ids)) + 1
+    for group in np.split(np.arange(len(ids)), bounds):
+        if (len(group) == 0):
+            continue
+        pid = ids[group[0]]
+        candidates = points[group]
+        inside = candidates[pointsInPolygon(xflat[candidates], yflat[candidates], polygons[pid])]
+        flat[inside] = np.maximum(flat[inside], values[pid])
+    return result
+
+# Bounding box [xmin, ymin, xmax, ymax] of each polygon, as an (n,4) array
+def boundingBoxes(polygons):
+    boxes = np.empty((len(polygons), 4), dtype=float)
+    for i, poly in enumerate(polygons):
+        poly = np.asarray(poly, dtype=float).reshape(-1, 2)
+        if (len(poly) == 0):
+            boxes[i] = [np.inf, np.inf, -np.inf, -np.inf]   # never matches
+        else:
+            boxes[i, 0:2] = poly.min(axis=0)
+            boxes[i, 2:4] = poly.max(axis=0)
+    return boxes
+
+# Distinct points among x, y (e.g. the vertices shared by several polylines)
+#   returns ux, uy, inverse, with x == ux[inverse] and y == uy[inverse]
+def uniquePoints(x, y):
+    x = np.asarray(x, dtype=float).ravel()
+    y = np.asarray(y, dtype=float).ravel()
+    inverse = np.zeros(len(x), dtype=int)
+    if (len(x) == 0):
+        return x, y, inverse
+    order = np.lexsort((y, x))
+    xs = x[order]
+    ys = y[order]
+    first = np.ones(len(x), dtype=bool)
+    first[1:] = (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1])
+    inverse[order] = np.cumsum(first) - 1
+    return xs[first], ys[first], inverse
+
+# R-tree over bounding boxes, bulk loaded with Sort-Tile-Recursive packing
+#   +query() returns the (point, box) pairs whose box contains the point
+# Every level is stored as flat arrays, so a query walks the tree for all points
+# at once, one level at a time, and never visits the subtrees a point is not in.
+class BoundingBoxIndex(object):
+
+    def __init__(self, boxes, nodeCapacity=8):
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        self.nodeCapacity = max(2, int(nodeCapacity))
+        self.levels = []    # (boxes, first child) per level, leaves first
+
+        # leaf entries in Sort-Tile-Recursive order
+        self.ids = self.pack(boxes)   # box number of each leaf entry
+        levelBoxes = boxes[self.ids]
+        self.levels.append((levelBoxes, np.arange(len(boxes) + 1)))
+
+        # upper levels, until a single root node is left
+        # (consecutive entries are neighbours in space, so they are grouped as they are)
+        while (len(levelBoxes) > 1):
+            firstChild = np.arange(0, len(levelBoxes), self.nodeCapacity)
+            parentBoxes = np.empty((len(firstChild), 4), dtype=float)
+            parentBoxes[:, 0:2] = np.minimum.reduceat(levelBoxes[:, 0:2], firstChild, axis=0)
+            parentBoxes[:, 2:4] = np.maximum.reduceat(levelBoxes[:, 2:4], firstChild, axis=0)
+            levelBoxes = parentBoxes
+            self.levels.append((levelBoxes, np.append(firstChild, len(self.levels[-1][0]))))
+
+    # Sort-Tile-Recursive order: slabs along x, then runs along y inside each slab
+    def pack(self, boxes):
+        n = len(boxes)
+        if (n == 0):
+            return np.arange(0)
+        cx = 0.5 * (boxes[:, 0] + boxes[:, 2])
+        cy = 0.5 * (boxes[:, 1] + boxes[:, 3])
+        cx = np.where(np.isfinite(cx), cx, np.inf)
+        cy = np.where(np.isfinite(cy), cy, np.inf)
+        nodes = int(np.ceil(n / float(self.nodeCapacity)))
+        slabSize = self.nodeCapacity * int(np.ceil(np.sqrt(nodes)))
+        byx = np.argsort(cx, kind='mergesort')
+        slabs = [byx[s:s + slabSize] for s in range(0, n, slabSize)]
+        return np.concatenate([slab[np.argsort(cy[slab], kind='mergesort')] for slab in slabs])
+
+    # Find the boxes containing each point
+    #   x, y    1-D arrays of point coordinates
+    #   returns (point, box) index arrays of the candidate pairs
+    def query(self, x, y):
+        x = np.asarray(x, dtype=float).ravel()
+        y = np.asarray(y, dtype=float).ravel()
+        if (len(self.ids) == 0 or len(x) == 0):
+            return np.arange(0), np.arange(0)
+
+        points = np.arange(len(x))
+        nodes = np.zeros(len(x), dtype=int)
+        for level in range(len(self.levels) - 1, -1, -1):
+            levelBoxes, firstChild = self.levels[level]
+            box = levelBoxes[nodes]
+            hit = ((x[points] >= box[:, 0]) & (x[points] <= box[:, 2]) &
+                   (y[points] >= box[:, 1]) & (y[points] <= box[:, 3]))
+            points = points[hit]
+            nodes = nodes[hit]
+            if (level == 0):
+                break
+            # descend into the children of every node that was hit
+            counts = firstChild[nodes + 1] - firstChild[nodes]
+            points = np.repeat(points, counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            nodes = np.repeat(firstChild[nodes], counts) + offsets
+
+        return points, self.ids[nodes]
+
+# Signed area of a polygon (shoelace formula), positive for counter-clockwise rings
+def polygonArea(poly):
+    poly = np.asarray(poly, dtype=float).reshape(-1, 2)
+    if (len(poly) < 3):
+        return 0.0
+    x = poly[:, 0]
+    y = poly[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+# Containment tree of nested polygons, such as the isotachs of a hurricane wind swath
+#   +maxValue() gives the same answer as maxValueInPolygons()
+# The parent of a polygon is the smallest larger polygon that holds all of its vertices, and whose edges
+# its own edges neither cross nor touch, so that it holds the whole polygon. Contours of one field never
+# cross; polygons that do (e.g. swaths of merged advisories) are kept as roots and tested on their own.
+# A lookup starts from the outermost polygons and only tests a point against the children
+# of the polygons it is inside, so points away from the core skip most of the tests.
+class PolygonHierarchy(object):
+
+    def __init__(self, polygons, values):
+        self.polygons = list(polygons)
+        self.values = np.asarray(values, dtype=float)
+        self.boxes = boundingBoxes(self.polygons)
+        n = len(self.polygons)
+        area = np.array([abs(polygonArea(p)) for p in self.polygons])
+        number = np.arange(n)
+
+        self.parents = -np.ones(n, dtype=int)   # -1 for the outermost polygons
+        for j in range(n):
+            vertices = np.asarray(self.polygons[j], dtype=float).reshape(-1, 2)
+            if (len(vertices) == 0):
+                continue
+            # larger polygons (ties broken by order, so there are no cycles) whose box holds this box
+            candidates = np.flatnonzero((self.boxes[:, 0] <= self.boxes[j, 0]) & (self.boxes[:, 1] <= self.boxes[j, 1]) &
+                                        (self.boxes[:, 2] >= self.boxes[j, 2]) & (self.boxes[:, 3] >= self.boxes[j, 3]) &
+                                        ((area > area[j]) | ((area == area[j]) & (number < j))))
+            ax = vertices[:, 0]
+            ay = vertices[:, 1]
+            bx = np.roll(ax, -1)
+            by = np.roll(ay, -1)
+            for i in candidates[np.argsort(area[candidates], kind='mergesort')]:   # smallest first
+                if (pointsInPolygon(ax, ay, self.polygons[i]).all() and
+                    len(segmentCrossings(ax, ay, bx, by, self.polygons[i])[0]) == 0):
+                    self.parents[j] = i
+                    break
+
+        # visit parents before their children
+        self.depth = np.zeros(n, dtype=int)
+        for j in range(n):
+            i = self.parents[j]
+            while (i >= 0):
+                self.depth[j] += 1
+                i = self.parents[i]
+        self.order = np.argsort(self.depth, kind='mergesort')
+        self.roots = np.flatnonzero(self.parents < 0)
+        self.rootIndex = BoundingBoxIndex(self.boxes[self.roots])
+
+    # Largest value of the polygons containing each point
+    def maxValue(self, x, y, default=0.0):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        result = np.empty(x.shape, dtype=float)
+        result.fill(default)
+        xflat = x.ravel()
+        yflat = y.ravel()
+        flat = result.ravel()
+
+        # candidates for the outermost polygons come from their own bounding-box index
+        points, roots = self.rootIndex.query(xflat, yflat)
+        order = np.lexsort((points, roots))
+        points = points[order]
+        roots = self.roots[roots[order]]
+        bounds = np.searchsorted(roots, np.arange(len(self.polygons) + 1))
+
+        inside = [None] * len(self.polygons)   # points inside each polygon visited so far
+        for node in self.order:
+            parent = self.parents[node]
+            if (parent < 0):
+                tested = points[bounds[node]:bounds[node + 1]]
+            else:
+                tested = inside[parent]
+                box = self.boxes[node]
+                tested = tested[(xflat[tested] >= box[0]) & (xflat[tested] <= box[2]) &
+                                (yflat[tested] >= box[1]) & (yflat[tested] <= box[3])]
+            if (len(tested) > 0):
+                tested = tested[pointsInPolygon(xflat[tested], yflat[tested], self.polygons[node])]
+                flat[tested] = np.maximum(flat[tested], self.values[node])
+            inside[node] = tested
+        return result
+
+# Intersections of line segments a -> b with the edges of a polygon
+#   ax, ay, bx, by  arrays with the end points of the segments
+#   poly            sequence of (x,y) vertices of the polygon ring
+#   returns (segment, t) arrays: segment index, and position a + t (b - a) of each intersection
+# Polygon vertices lying on a segment are returned too, so edges running along a segment
+# (which have no single intersection point) still split it where they begin and end.
+def segmentCrossings(ax, ay, bx, by, poly):
+    poly = np.asarray(poly, dtype=float).reshape(-1, 2)
+    segments = []
+    positions = []
+    if (len(ax) == 0 or len(poly) < 2):
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=float)
+
+    # edges p -> q of the closed ring
+    px = poly[:, 0]
+    py = poly[:, 1]
+    qx = np.roll(px, -1)
+    qy = np.roll(py, -1)
+    ex = qx - px
+    ey = qy - py
+
+    step = max(1, CHUNKSIZE // len(poly))
+    for start in range(0, len(ax), step):
+        sx = ax[start:start + step, None]
+        sy = ay[start:start + step, None]
+        dx = bx[start:start + step, None] - sx
+        dy = by[start:start + step, None] - sy
+        wx = px - sx
+        wy = py - sy
+
+        # proper crossings: a + t d = p + u e
+        denom = dx * ey - dy * ex
+        safe = np.where(denom != 0.0, denom, 1.0)
+        t = (wx * ey - wy * ex) / safe
+        u = (wx * dy - wy * dx) / safe
+        hits = (denom != 0.0) & (t >= 0.0) & (t <= 1.0) & (u >= 0.0) & (u <= 1.0)
+        seg, edge = np.nonzero(hits)
+        segments.append(seg + start)
+        positions.append(t[seg, edge])
+
+        # polygon vertices on the segment
+        length2 = dx * dx + dy * dy
+        along = (wx * dx + wy * dy) / np.where(length2 > 0.0, length2, 1.0)
+        scale = np.sqrt(length2) * (np.abs(wx) + np.abs(wy) + 1.0)
+        on = (np.abs(wx * dy - wy * dx) <= 1e-12 * scale) & (along >= 0.0) & (along <= 1.0) & (length2 > 0.0)
+        seg, vertex = np.nonzero(on)
+        segments.append(seg + start)
+        positions.append(along[seg, vertex])
+
+    return np.concatenate(segments), np.concatenate(positions)
+
+# Exposure of polylines (e.g. transmission lines) to a field given by polygons (e.g. hurricane isotachs)
+#   lines       sequence of (n,2) vertex arrays, one per polyline part
+#   polygons    sequence of polygons, values one value per polygon
+#   lineIds     optional line number of each part (parts of one line are combined), default one line per part
+#   hierarchy   optional PolygonHierarchy over polygons and values, to evaluate the pieces faster
+#   geographic  True for (longitude, latitude) vertices: lengths in km on a spherical Earth,
+#               False for lengths in the units of the coordinates
+#   returns maxValues (largest value touched by each line), bands (sorted distinct values, default included),
+#   and lengths[line, band] (length of each line where the field equals each band value)
+# Each segment is cut where it crosses a polygon edge, so every piece lies in a single band; the band of a piece
+# is the value at its midpoint. Contours crossed between two vertices are found without sampling the segment.
+def polylineExposure(lines, polygons, values, default=0.0, lineIds=None, hierarchy=None, geographic=False):
+    values = np.asarray(values, dtype=float)
+    if (lineIds is None):
+        lineIds = np.arange(len(lines))
+    lineIds = np.asarray(lineIds, dtype=int)
+    nlines = int(lineIds.max()) + 1 if len(lineIds) > 0 else 0
+    bands = np.unique(np.concatenate((values, [default])))
+
+    # segments of all the lines, as flat arrays
+    parts = [np.asarray(line, dtype=float).reshape(-1, 2) for line in lines]
+    ax = np.concatenate([part[:-1, 0] for part in parts] + [np.zeros(0)])
+    ay = np.concatenate([part[:-1, 1] for part in parts] + [np.zeros(0)])
+    bx = np.concatenate([part[1:, 0] for part in parts] + [np.zeros(0)])
+    by = np.concatenate([part[1:, 1] for part in parts] + [np.zeros(0)])
+    owner = np.concatenate([np.repeat(lineIds[i], max(len(part) - 1, 0)) for i, part in enumerate(parts)] + [np.zeros(0, dtype=int)])
+    vertices = np.vstack(parts + [np.zeros((0, 2))])
+    vertexOwner = np.concatenate([np.repeat(lineIds[i], len(part)) for i, part in enumerate(parts)] + [np.zeros(0, dtype=int)])
+
+    # cut the segments where they cross the edges of the polygons whose bounding box they overlap
+    cutSegments = [np.arange(len(ax)), np.arange(len(ax))]
+    cutPositions = [np.zeros(len(ax)), np.ones(len(ax))]
+    sxmin = np.minimum(ax, bx)
+    sxmax = np.maximum(ax, bx)
+    symin = np.minimum(ay, by)
+    symax = np.maximum(ay, by)
+    for poly, box in zip(polygons, boundingBoxes(polygons)):
+        near = np.flatnonzero((sxmax >= box[0]) & (sxmin <= box[2]) & (symax >= box[1]) & (symin <= box[3]))
+        if (len(near) == 0):
+            continue
+        seg, t = segmentCrossings(ax[near], ay[near], bx[near], by[near], poly)
+        cutSegments.append(near[seg])
+        cutPositions.append(t)
+    seg = np.concatenate(cutSegments)
+    t = np.clip(np.concatenate(cutPositions), 0.0, 1.0)
+    order = np.lexsort((t, seg))
+    seg = seg[order]
+    t = t[order]
+
+    # pieces between consecutive cuts of the same segment
+    piece = (seg[1:] == seg[:-1]) & (t[1:] > t[:-1])
+    pseg = seg[:-1][piece]
+    t0 = t[:-1][piece]
+    t1 = t[1:][piece]
+    tm = 0.5 * (t0 + t1)
+    mx = ax[pseg] + tm * (bx[pseg] - ax[pseg])
+    my = ay[pseg] + tm * (by[pseg] - ay[pseg])
+    if (hierarchy == None):
+        pieceValues = maxValueInPolygons(mx, my, polygons, values, default)
+        vertexValues = maxValueInPolygons(vertices[:, 0], vertices[:, 1], polygons, values, default)
+    else:
+        pieceValues = hierarchy.maxValue(mx, my, default)
+        vertexValues = hierarchy.maxValue(vertices[:, 0], vertices[:, 1], default)
+
+    dx = (bx[pseg] - ax[pseg]) * (t1 - t0)
+    dy = (by[pseg] - ay[pseg]) * (t1 - t0)
+    if (geographic):
+        # equirectangular approximation around each piece, exact enough for pieces of a few km
+        dx = np.radians(dx) * np.cos(np.radians(my)) * EARTH_RADIUS_KM
+        dy = np.radians(dy) * EARTH_RADIUS_KM
+    pieceLengths = np.sqrt(dx * dx + dy * dy)
+
+    # a line touches the largest value of its pieces and of its vertices (which may only touch a contour)
+    maxValues = np.empty(nlines)
+    maxValues.fill(default)
+    np.maximum.at(maxValues, owner[pseg], pieceValues)
+    np.maximum.at(maxValues, vertexOwner, vertexValues)
+    lengths = np.zeros((nlines, len(bands)))
+    np.add.at(lengths, (owner[pseg], np.searchsorted(bands, pieceValues)), pieceLengths)
+    return maxValues, bands, lengths
+
+# All pairs (i, j) of points a[i] = (xa[i], ya[i]) and b[j] = (xb[j], yb[j]) closer than distance
+#   geographic=False    Euclidean distance in the units of the coordinates (e.g. degrees)
+#   geographic=True     great-circle distance in km, with x and y the longitudes and latitudes
+#   returns arrays i and j, sorted by i then j
+# The points of b are put in a k-d tree, and every point of a is queried against it.
+# Great-circle distances are compared as chords between unit vectors on the sphere.
+def pointsWithinDistance(xa, ya, xb, yb, distance, geographic=False):
+    xa = np.asarray(xa, dtype=float).ravel()
+    ya = np.asarray(ya, dtype=float).ravel()
+    xb = np.asarray(xb, dtype=float).ravel()
+    yb = np.asarray(yb, dtype=float).ravel()
+    if (geographic):
+        a = sphereVectors(xa, ya)
+        b = sphereVectors(xb, yb)
+        distance = 2.0 * np.sin(min(0.5 * distance / EARTH_RADIUS_KM, 0.5 * np.pi))
+    else:
+        a = np.column_stack((xa, ya))
+        b = np.column_stack((xb, yb))
+    none = (np.zeros(0, dtype=int), np.zeros(0, dtype=int))
+    a_ok = np.nonzero(np.isfinite(a).all(axis=1))[0]
+    b_ok = np.nonzero(np.isfinite(b).all(axis=1))[0]
+    if (len(a_ok) == 0 or len(b_ok) == 0 or not distance > 0):
+        return none
+    a = a[a_ok]
+    b = b[b_ok]
+
+    neighbours = cKDTree(b).query_ball_point(a, distance)
+    counts = np.array([len(n) for n in neighbours], dtype=int)
+    if (counts.sum() == 0):
+        return none
+    i = np.repeat(np.arange(len(a)), counts)
+    j = np.concatenate([n for n in neighbours if len(n) > 0]).astype(int)
+    close = ((a[i] - b[j])**2).sum(axis=1) < distance * distance     # the tree also returns points at exactly distance
+    i = a_ok[i[close]]
+    j = b_ok[j[close]]
+    sort = np.lexsort((j, i))
+    return i[sort], j[sort]
+
+# Points on the unit sphere, as (x, y, z)
+def sphereVectors(lons, lats):
+    lon = np.radians(lons)
+    lat = np.radians(lats)
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+# Convert one attribute column of a shapefile into a typed NumPy array
+#   'N' fields without decimals become integers (floats if some entries are blank), 'N' and 'F' with
+#   decimals become floats (NaN where blank), 'L' becomes boolean, 'C' and 'D' become stripped unicode text
+#   (dates as YYYYMMDD), as PointShapefile.DBFTable.column reads them whichever pyshp decoded the records,
+#   and anything else stays as objects.
+def typedColumn(values, fieldType='C', decimals=0):
+    if (fieldType in ('C', 'D')):
+        return np.array([textValue(v) for v in values], dtype=np.unicode_)
+    if (fieldType in ('N', 'F')):
+        column = np.array([np.nan if (v == None or (isinstance(v, basestring) and v.strip() in ('', '*'))) else float(v)
+                           for v in values], dtype=float)
+        if (fieldType == 'N' and decimals == 0 and np.isfinite(column).all() and (column == np.round(column)).all()):
+            column = column.astype(np.int64)
+        return column
+    if (fieldType == 'L'):
+        return np.array([v in (True, 'T', 't', 'Y', 'y') for v in values], dtype=bool)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+# Text of a 'C' or 'D' field value: pyshp 1 gives bytes (and [year, month, day] for dates),
+# pyshp 2 unicode (and datetime.date), and None for missing values
+def textValue(value):
+    if (value == None):
+        return u''
+    if (hasattr(value, 'strftime')):
+        value = value.strftime('%Y%m%d')
+    elif (isinstance(value, (list, tuple)) and len(value) == 3):
+        value = '%04d%02d%02d' % tuple(value)
+    if (isinstance(value, str)):
+        value = value.decode('utf-8', 'replace')
+    return unicode(value).strip()
+
+# All the shapes and attributes of a shapefile, decoded once into flat arrays
+#   coords          (nVertices,2) array of (x,y) vertices of every shape, one after the other
+#   shapeOffsets    vertices of shape i are coords[shapeOffsets[i]:shapeOffsets[i+1]]
+#   partOffsets     vertices of part k are coords[partOffsets[k]:partOffsets[k+1]]
+#   shapeParts      parts of shape i are shapeParts[i] .. shapeParts[i+1]-1
+#   fields          attribute descriptors [name, type, size, decimals], in shapefile order (without the DeletionFlag)
+#   fieldNames      attribute names, in the same order
+#   columns         one typed array per attribute, see typedColumn() (None for attributes left out by load)
+# Queries and plots read from these arrays instead of asking the shapefile reader for each shape again.
+class GeometryStore(object):
+
+    def __init__(self):
+        self.coords = np.zeros((0, 2), dtype=float)
+        self.shapeOffsets = np.zeros(1, dtype=int)
+        self.partOffsets = np.zeros(1, dtype=int)
+        self.shapeParts = np.zeros(1, dtype=int)
+        self.fields = []
+        self.fieldNames = []
+        self.columns = []
+
+    # Decode a shapefile.Reader (pyshp)
+    #   fieldNames  attributes to decode (column projection), None for all of them
+    def load(self, reader, fieldNames=None):
+        shapes = reader.shapes()
+
+        points = [np.asarray(s.points, dtype=float).reshape(-1, 2) for s in shapes]
+        counts = np.array([len(p) for p in points], dtype=int)
+        self.coords = np.concatenate(points) if (len(points) > 0) else np.zeros((0, 2), dtype=float)
+        self.shapeOffsets = np.concatenate(([0], np.cumsum(counts)))
+
+        # parts: every shape has at least one part, starting at its first vertex
+        partStarts = []
+        partCounts = []
+        for i, s in enumerate(shapes):
+            parts = list(getattr(s, 'parts', [])) or [0]
+            partStarts.extend([self.shapeOffsets[i] + p for p in parts])
+            partCounts.append(len(parts))
+        self.partOffsets = np.append(np.array(partStarts, dtype=int), len(self.coords))
+        self.shapeParts = np.concatenate(([0], np.cumsum(partCounts))).astype(int)
+
+        self.fields = [list(f) for f in reader.fields if f[0] != 'DeletionFlag']
+        self.fieldNames = [f[0] for f in self.fields]
+        if (fieldNames == None):
+            keep = range(len(self.fields))
+            records = reader.records()
+        else:
+            keep = [k for k in range(len(self.fields)) if self.fieldNames[k] in fieldNames]
+            try:
+                records = reader.records([self.fieldNames[k] for k in keep])   # pyshp 2 decodes only these
+            except TypeError:
+                records = [[r[k] for k in keep] for r in reader.records()]
+        self.columns = [None] * len(self.fields)
+        for n, k in enumerate(keep):
+            self.columns[k] = typedColumn([r[n] for r in records], self.fields[k][1], self.fields[k][3])
+        return self
+
+    # Take the points and attributes of a PointShapefile (memory-mapped POINT layer)
+    # coords is then a view into the .shp file, unless the layer has null shapes (which get no vertex)
+    def loadPoints(self, layer, fieldNames=None):
+        counts = layer.isPoint.astype(int)
+        self.coords = layer.coords if (counts.all()) else layer.coords[layer.isPoint]
+        self.shapeOffsets = np.concatenate(([0], np.cumsum(counts)))
+        self.partOffsets = np.append(self.shapeOffsets[:-1], len(self.coords))
+        self.shapeParts = np.arange(len(counts) + 1)
+
+        self.fields = [list(f) for f in layer.dbf.fields] if (layer.dbf != None) else []
+        self.fieldNames = [f[0] for f in self.fields]
+        self.columns = [None] * len(self.fields)
+        for k in range(len(self.fields)):
+            if (fieldNames == None or self.fieldNames[k] in fieldNames):
+                self.columns[k] = layer.dbf.column(k)
+        return self
+
+    def __len__(self):
+        return len(self.shapeOffsets) - 1
+
+    # Vertices of shape i, as a view into coords
+    def points(self, i):
+        return self.coords[self.shapeOffsets[i]:self.shapeOffsets[i + 1]]
+
+    # Vertices of each part of shape i
+    def parts(self, i):
+        return [self.coords[self.partOffsets[k]:self.partOffsets[k + 1]] for k in range(self.shapeParts[i], self.shapeParts[i + 1])]
+
+    # First vertex of every shape (the location of point shapes), NaN for empty shapes
+    def firstPoints(self):
+        first = np.empty((len(self), 2), dtype=float)
+        first.fill(np.nan)
+        filled = np.diff(self.shapeOffsets) > 0
+        first[filled] = self.coords[self.shapeOffsets[:-1][filled]]
+        return first
+
+    # Attribute column, by name or by position in the record
+    def column(self, key):
+        if (isinstance(key, basestring)):
+            key = self.fieldNames.index(key)
+        if (self.columns[key] is None):
+            raise KeyError('attribute %s was not loaded' % self.fieldNames[key])
+        return self.columns[key]
+
+# Largest polygon value on a regular lon/lat grid, computed once
+#   +lookup() returns the values at arrays of points, and which points still need the exact test
+# Cells crossed by a polygon edge are flagged: the value at their center may differ from the
+# value elsewhere in the cell, so points falling in them are left to maxValueInPolygons().
+# Every other cell lies wholly inside or outside each polygon, and its value is exact.
+class PolygonRaster(object):
+
+    def __init__(self, polygons, values, resolution, default=0.0):
+        self.resolution = float(resolution)
+        self.default = default
+
+        # grid covering every polygon; points outside it are outside every polygon
+        boxes = boundingBoxes(polygons)
+        boxes = boxes[np.isfinite(boxes).all(axis=1)]
+        if (len(boxes) == 0):
+            boxes = np.zeros((1, 4))
+        self.x0 = boxes[:, 0].min()
+        self.y0 = boxes[:, 1].min()
+        self.x1 = boxes[:, 2].max()
+        self.y1 = boxes[:, 3].max()
+        self.nx = max(1, int(np.ceil((self.x1 - self.x0) / self.resolution)))
+        self.ny = max(1, int(np.ceil((self.y1 - self.y0) / self.resolution)))
+
+        # value at the center of each cell
+        self.values = np.empty((self.ny, self.nx), dtype=float)
+        self.values.fill(default)
+        for poly, value in zip(polygons, values):
+            inside = self.fill(poly)
+            self.values[inside] = np.maximum(self.values[inside], value)
+
+        # flag every cell an edge passes through
+        self.boundary = np.zeros((self.ny, self.nx), dtype=bool)
+        for poly in polygons:
+            poly = np.asarray(poly, dtype=float).reshape(-1, 2)
+            if (len(poly) == 0):
+                continue
+            ends = np.roll(poly, -1, axis=0)
+            self.flagEdges(poly[:, 0], poly[:, 1], ends[:, 0], ends[:, 1])
+            self.flagEdges(poly[:, 1], poly[:, 0], ends[:, 1], ends[:, 0], transposed=True)
+
+    # Scanline fill: which cell centers are inside the polygon
+    # A center is inside when an odd number of edge crossings of its row lie at or to its right,
+    # the same crossing rule as pointsInPolygon(); centers on an edge are in flagged cells anyway.
+    def fill(self, poly):
+        poly = np.asarray(poly, dtype=float).reshape(-1, 2)
+        if (len(poly) == 0):
+            return np.zeros((self.ny, self.nx), dtype=bool)
+        p1x = poly[:, 0]
+        p1y = poly[:, 1]
+        p2x = np.roll(p1x, -1)
+        p2y = np.roll(p1y, -1)
+        dy = p2y - p1y
+        slope = np.where(dy != 0.0, (p2x - p1x) / np.where(dy != 0.0, dy, 1.0), 0.0)
+
+        cy = self.y0 + (np.arange(self.ny) + 0.5) * self.resolution
+        rows, edges = np.nonzero((cy[:, None] > np.minimum(p1y, p2y)) & (cy[:, None] <= np.maximum(p1y, p2y)))
+        xints = (cy[rows] - p1y[edges]) * slope[edges] + p1x[edges]
+        # each crossing counts for the centers at or to its left: columns 0 .. last
+        last = np.floor((xints - self.x0) / self.resolution - 0.5)
+        last = np.clip(last, -1, self.nx - 1).astype(int)
+        counts = np.zeros((self.ny, self.nx + 1), dtype=int)
+        np.add.at(counts, (rows, last + 1), 1)
+        crossings = np.cumsum(counts[:, ::-1], axis=1)[:, ::-1]
+        return (crossings[:, 1:] % 2 == 1)
+
+    # Flag the cells on both sides of every vertical grid line crossed by the edges (xa,ya)-(xb,yb)
+    # (called again with x and y swapped for the horizontal lines), and the cells of the end points
+    def flagEdges(self, xa, ya, xb, yb, transposed=False):
+        if (transposed):
+            origin = self.y0
+            cells = lambda u, v: self.cells(v, u)[::-1]
+        else:
+            origin = self.x0
+            cells = self.cells
+        ia, ja = cells(xa, ya)
+        self.flag(ia, ja, transposed)
+        ilo = np.minimum(ia, cells(xb, yb)[0])
+        ihi = np.maximum(ia, cells(xb, yb)[0])
+
+        # grid lines ilo+1 .. ihi crossed by each edge
+        counts = ihi - ilo
+        k = np.repeat(ilo, counts) + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        xa = np.repeat(xa, counts)
+        ya = np.repeat(ya, counts)
+        xb = np.repeat(xb, counts)
+        yb = np.repeat(yb, counts)
+        line = origin + k * self.resolution
+        v = ya + (line - xa) * (yb - ya) / np.where(xb != xa, xb - xa, 1.0)
+        # a little slack, so rounding never moves a crossing into the wrong row
+        slack = 1e-9 * self.resolution
+        for vv in (v - slack, v + slack):
+            j = cells(line, vv)[1]
+            self.flag(k - 1, j, transposed)
+            self.flag(np.minimum(k, (self.ny if transposed else self.nx) - 1), j, transposed)
+
+    def flag(self, i, j, transposed):
+        if (transposed):
+            self.boundary[i, j] = True
+        else:
+            self.boundary[j, i] = True
+
+    # Cell (column, row) of each point, clamped to the grid
+    def cells(self, x, y):
+        i = np.floor((x - self.x0) / self.resolution)
+        j = np.floor((y - self.y0) / self.resolution)
+        i = np.clip(np.nan_to_num(i), 0, self.nx - 1).astype(int)
+        j = np.clip(np.nan_to_num(j), 0, self.ny - 1).astype(int)
+        return i, j
+
+    # Values at arrays of points, plus a mask of the points that fell in flagged cells
+    def lookup(self, x, y):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        result = np.empty(x.shape, dtype=float)
+        result.fill(self.default)
+        covered = (x >= self.x0) & (x <= self.x1) & (y >= self.y0) & (y <= self.y1)
+        i, j = self.cells(x[covered], y[covered])
+        result[covered] = self.values[j, i]
+        exact = np.zeros(x.shape, dtype=bool)
+        exact[covered] = self.boundary[j, i]
+        return result, exact
@@ -0,0 +1,221 @@
+# Comparing the Geometry kernels with the legacy per-point code, on the IFFpackage data
+#   (Hurricane Ivan wind swath, Florida electric power buses and lines, natural gas processing plant)
+# Every kernel must give what point_in_poly() gives, one point and one polygon at a time.
+# Run from the repository directory: python GeometryTest.py
+
+import time
+import numpy as np
+import shapefile
+
+from TestReport import check, report
+from Geometry import pointsInPolygon, maxValueInPolygons, boundingBoxes, BoundingBoxIndex, PolygonRaster, PolygonHierarchy, \
+    segmentCrossings, polylineExposure, pointsWithinDistance, EARTH_RADIUS_KM
+
+# Legacy point-in-polygon test of FailureAnalyses_20150706.py
+# Source http://geospatialpython.com/2011/08/point-in-polygon-2-on-line.html
+def point_in_poly(x,y,poly):
+   if (x,y) in poly: return "IN"  # check if point is a vertex
+   for i in range(len(poly)):   # check if point is on a boundary
+      p1 = None
+      p2 = None
+      if i==0:
+         p1 = poly[0]
+         p2 = poly[1]
+      else:
+         p1 = poly[i-1]
+         p2 = poly[i]
+      if p1[1] == p2[1] and p1[1] == y and x > min(p1[0], p2[0]) and x < max(p1[0], p2[0]):
+         return "IN"
+   n = len(poly)
+   inside = False
+   p1x,p1y = poly[0]
+   for i in range(n+1):
+      p2x,p2y = poly[i % n]
+      if y > min(p1y,p2y):
+         if y <= max(p1y,p2y):
+            if x <= max(p1x,p2x):
+               if p1y != p2y:
+                  xints = (y-p1y)*(p2x-p1x)/(p2y-p1y)+p1x
+               if p1x == p2x or x <= xints:
+                  inside = not inside
+      p1x,p1y = p2x,p2y
+   if inside: return "IN"
+   else: return "OUT"
+
+# Legacy wind lookup of FailureAnalyses.py: largest value of the polygons containing the site
+def findHurricaneWind(GISshapes,GISrecords,ilon,ilat):
+    buswind = 0.0
+    for jj in xrange(len(GISshapes)):
+        if point_in_poly(ilon,ilat,GISshapes[jj].points) == "IN":
+            buswind = max( buswind, float(GISrecords[jj][0]) )
+    return buswind
+
+# Sites to test: every asset site and line vertex, some swath vertices (on the edges), and random points over the swath
+def testSites(swath, layers):
+    x = []
+    y = []
+    for layer in layers:
+        for shape in layer.shapes():
+            for lon, lat in shape.points:
+                x.append(lon)
+                y.append(lat)
+    for shape in swath.shapes():
+        for lon, lat in shape.points[::25]:
+            x.append(lon)
+            y.append(lat)
+    xmin, ymin, xmax, ymax = swath.bbox
+    rng = np.random.RandomState(2015)
+    x.extend(rng.uniform(xmin, xmax, 1000))
+    y.extend(rng.uniform(ymin, ymax, 1000))
+    return np.array(x), np.array(y)
+
+def testPointsInPolygon(shapes, x, y):
+    start = time.time()
+    legacy = np.array([[point_in_poly(x[i], y[i], shape.points) == "IN" for i in xrange(len(x))] for shape in shapes])
+    legacy_s = time.time() - start
+    start = time.time()
+    batch = np.array([pointsInPolygon(x, y, shape.points) for shape in shapes])
+    check('pointsInPolygon vs point_in_poly', np.array_equal(legacy, batch),
+          '(%d points x %d polygons, %.2f s vs %.3f s)' % (len(x), len(shapes), legacy_s, time.time() - start))
+    return legacy
+
+def testWinds(shapes, records, x, y, inside):
+    polygons = [shape.points for shape in shapes]
+    values = [float(record[0]) for record in records]
+    legacy = np.array([findHurricaneWind(shapes, records, x[i], y[i]) for i in xrange(len(x))])
+    check('maxValueInPolygons vs findHurricaneWind', np.array_equal(legacy, maxValueInPolygons(x, y, polygons, values)))
+
+    index = BoundingBoxIndex(boundingBoxes(polygons))
+    points, boxes = index.query(x, y)
+    candidates = np.zeros(inside.shape, dtype=bool)
+    candidates[boxes, points] = True
+    check('BoundingBoxIndex candidates hold every containing polygon', not (inside & ~candidates).any(),
+          '(%d candidate pairs for %d containing ones)' % (candidates.sum(), inside.sum()))
+    check('maxValueInPolygons with a BoundingBoxIndex', np.array_equal(legacy, maxValueInPolygons(x, y, polygons, values, index=index)))
+
+    hierarchy = PolygonHierarchy(polygons, values)
+    check('PolygonHierarchy.maxValue vs findHurricaneWind', np.array_equal(legacy, hierarchy.maxValue(x, y)))
+
+    # the raster answers the points of cells that no contour crosses; the others need the exact test
+    for resolution in (0.25, 0.05):
+        raster = PolygonRaster(polygons, values, resolution)
+        result, needsExact = raster.lookup(x, y)
+        resolved = ~needsExact
+        check('PolygonRaster(%.2f deg) resolved cells vs findHurricaneWind' % resolution,
+              np.array_equal(legacy[resolved], result[resolved]), '(%d of %d points resolved by the raster)' % (resolved.sum(), len(x)))
+    return legacy
+
+# Polygons that are not nested: a U-shaped swath, a polygon with all its vertices in the two arms of the U
+# (so its edges cross the gap between them) and a smaller one inside it, and two overlapping squares
+def testCrossingPolygons():
+    polygons = [[(0, 0), (0, 10), (3, 10), (3, 2), (7, 2), (7, 10), (10, 10), (10, 0)],
+                [(1, 5), (1, 8), (9, 8), (9, 5)],
+                [(2, 6), (2, 7), (8, 7), (8, 6)],
+                [(20, 0), (20, 4), (24, 4), (24, 0)],
+                [(22, 2), (22, 6), (26, 6), (26, 2)]]
+    values = [10.0, 50.0, 70.0, 20.0, 30.0]
+    hierarchy = PolygonHierarchy(polygons, values)
+    check('PolygonHierarchy keeps the polygon crossing the U as a root', hierarchy.parents[1] < 0, str(hierarchy.parents))
+    rng = np.random.RandomState(4)
+    x = rng.uniform(-1, 27, 5000)
+    y = rng.uniform(-1, 11, 5000)
+    check('PolygonHierarchy.maxValue vs maxValueInPolygons, crossing polygons',
+          np.array_equal(maxValueInPolygons(x, y, polygons, values), hierarchy.maxValue(x, y)))
+
+# The inside/outside status of points sampled along each segment may only change across a crossing found by segmentCrossings
+def testSegmentCrossings(shapes, lines):
+    ax = []
+    ay = []
+    bx = []
+    by = []
+    for line in lines:
+        for k in xrange(len(line.points) - 1):
+            ax.append(line.points[k][0])
+            ay.append(line.points[k][1])
+            bx.append(line.points[k + 1][0])
+            by.append(line.points[k + 1][1])
+    ax, ay, bx, by = np.array(ax), np.array(ay), np.array(bx), np.array(by)
+    samples = np.linspace(0.0, 1.0, 201)
+    missed = 0
+    for shape in shapes:
+        segment, t = segmentCrossings(ax, ay, bx, by, shape.points)
+        for s in xrange(len(ax)):
+            status = pointsInPolygon(ax[s] + samples * (bx[s] - ax[s]), ay[s] + samples * (by[s] - ay[s]), shape.points)
+            for k in np.flatnonzero(status[1:] != status[:-1]):
+                found = t[segment == s]
+                if (not ((found >= samples[k]) & (found <= samples[k + 1])).any()):
+                    missed += 1
+    check('segmentCrossings finds every sampled contour crossing', missed == 0, '(%d segments x %d polygons)' % (len(ax), len(shapes)))
+
+# Lines touch at least the winds of their vertices and of densely sampled points, and their band lengths add up to their length
+def testPolylineExposure(shapes, records, lines):
+    polygons = [shape.points for shape in shapes]
+    values = [float(record[0]) for record in records]
+    parts = [np.array(line.points, dtype=float) for line in lines]
+    maxValues, bands, lengths = polylineExposure(parts, polygons, values, geographic=True)
+    hierarchical = polylineExposure(parts, polygons, values, hierarchy=PolygonHierarchy(polygons, values), geographic=True)
+    check('polylineExposure with and without a PolygonHierarchy', np.array_equal(maxValues, hierarchical[0]) and np.allclose(lengths, hierarchical[2]))
+
+    # each span as its own line, as FailureAnalyses.py evaluates them, then combined per line
+    spans = [part[k:k + 2] for part in parts for k in xrange(len(part) - 1)]
+    spanLine = np.array([n for n, part in enumerate(parts) for k in xrange(len(part) - 1)])
+    spanValues, spanBands, spanLengths = polylineExposure(spans, polygons, values, geographic=True)
+    combinedValues = np.zeros(len(parts))
+    np.maximum.at(combinedValues, spanLine, spanValues)
+    combinedLengths = np.zeros(lengths.shape)
+    np.add.at(combinedLengths, spanLine, spanLengths)
+    check('polylineExposure of the spans, combined per line', np.array_equal(maxValues, combinedValues) and np.allclose(lengths, combinedLengths))
+
+    vertexWinds = np.array([max([findHurricaneWind(shapes, records, lon, lat) for lon, lat in line.points]) for line in lines])
+    samples = np.linspace(0.0, 1.0, 101)
+    sampledWinds = np.zeros(len(parts))
+    lineLengths = np.zeros(len(parts))
+    for n, part in enumerate(parts):
+        for k in xrange(len(part) - 1):
+            x = part[k, 0] + samples * (part[k + 1, 0] - part[k, 0])
+            y = part[k, 1] + samples * (part[k + 1, 1] - part[k, 1])
+            sampledWinds[n] = max(sampledWinds[n], maxValueInPolygons(x, y, polygons, values).max())
+            # flat-earth length at the mid latitude of each segment; polylineExposure uses that of each piece
+            dx = np.radians(part[k + 1, 0] - part[k, 0]) * np.cos(np.radians(0.5 * (part[k, 1] + part[k + 1, 1])))
+            dy = np.radians(part[k + 1, 1] - part[k, 1])
+            lineLengths[n] += EARTH_RADIUS_KM * np.hypot(dx, dy)
+    check('polylineExposure >= legacy winds at the vertices', (maxValues >= vertexWinds).all(),
+          '(%d of %d lines cross stronger winds between vertices)' % ((maxValues > vertexWinds).sum(), len(parts)))
+    check('polylineExposure >= winds sampled along the lines', (maxValues >= sampledWinds).all())
+    check('polylineExposure band lengths add up to the line lengths', np.allclose(lengths.sum(axis=1), lineLengths, rtol=1e-3, atol=1e-9))
+
+# Against the full distance matrix, in degrees and in great-circle km
+def testPointsWithinDistance(buses, lines):
+    xa = np.array([shape.points[0][0] for shape in buses.shapes()])
+    ya = np.array([shape.points[0][1] for shape in buses.shapes()])
+    xb = np.array([lon for shape in lines.shapes() for lon, lat in shape.points])
+    yb = np.array([lat for shape in lines.shapes() for lon, lat in shape.points])
+    for distance, geographic in ((0.001, False), (0.1, False), (1.0, True), (25.0, True)):
+        if (geographic):
+            la, lb = np.radians(ya)[:, None], np.radians(yb)[None, :]
+            h = np.sin(0.5 * (lb - la))**2 + np.cos(la) * np.cos(lb) * np.sin(0.5 * np.radians(xb[None, :] - xa[:, None]))**2
+            full = 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(h))
+        else:
+            full = np.hypot(xa[:, None] - xb[None, :], ya[:, None] - yb[None, :])
+        i, j = np.nonzero(full < distance)
+        found = pointsWithinDistance(xa, ya, xb, yb, distance, geographic)
+        check('pointsWithinDistance(%g, geographic=%s) vs distance matrix' % (distance, geographic),
+              np.array_equal(i, found[0]) and np.array_equal(j, found[1]), '(%d pairs)' % len(i))
+
+# Test data files
+datadir = 'IFFpackage'
+swath = shapefile.Reader(datadir + '/IVAN_windswath_out')
+buses = shapefile.Reader(datadir + '/buses')
+lines = shapefile.Reader(datadir + '/lines')
+plants = shapefile.Reader(datadir + '/ngpp_draft_FL')
+
+# Run tests
+x, y = testSites(swath, [buses, lines, plants])
+inside = testPointsInPolygon(swath.shapes(), x, y)
+testWinds(swath.shapes(), swath.records(), x, y, inside)
+testCrossingPolygons()
+testSegmentCrossings(swath.shapes(), lines.shapes())
+testPolylineExposure(swath.shapes(), swath.records(), lines.shapes())
+testPointsWithinDistance(buses, lines)
+
+report()
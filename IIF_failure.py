@@ -6,10 +6,12 @@ such as a hurricane (flood and wind) or an earthquake, as well as a human threat
             
 Usage:
 failureFunction(parameters)
+failureFunctions(parameters)  # Same, for arrays of assets
 Examples:
 kk = failureFunction(pga_g=3.9,wind_mph=66.,floodlvl_m=4.2,human=0.4999)
 failureFunction(human=-0.5,wind_mph=80.,floodlvl_m=1.0,asset='ngpp')
 failure = IIFf.failureFunction(asset='ngpp', wind_mph=hazard_wind_mph, gust_threshold_mph=asce_705_mph )
+failures = IIFf.failureFunctions(asset=['epp','eps','eptl'], wind_mph=winds_mph, gust_threshold_mph=asce_705_mph )  # Boolean array
 
 Input parameters:
 - Natural Hazards & Human Threat:
@@ -57,15 +59,51 @@ EPPS Small Power Plants ( < 100 MW ) [different combinations for with or without
 Outputs:
 0 --> No, there was no failure, infrastructure is operating normally
 1 --> Yes, there is failure, infrastructure stops operations.
+failureFunctions returns these as a boolean array, one value per asset.
 
 Last modification 2015 Sep 1
 Author: Edwin Campos, ecampos@anl.gov, edwinfcampos@aol.com
 """
 import numpy as np
-from scipy import interpolate
 import math
+from Fragility import FragilityList, fragilityRegistry, fragilitySource
 
 want_fuzzylogic = 0  # 1 --> failureFunction will use sigmoid function with threshold specified by function inputs. else --> failureFunction will use hazard > threshold
+fragility_file = None  # e.g., 'HurricaneFragilityDB.txt' --> the fragility curves are read from this file; None --> the curves below are used
+epp_fragility_class = 'Hurricane_IndNoReinMEA'  # Fragility class of Electric Power Plants, Hazus Fig. N.2 (same name as in HurricaneFragilityDB.txt)
+epp_fragility_source = 'IIF_failure Hazus Fig. N.2'  # Registry source of the curve below: fragility files are registered under their own path, and cannot replace it
+
+# From Fig. N.2 in Hazus Hurricane Technical Manual, used as the fragility curve of Electric Power Plants ('epp')
+# Industrial Building Loss Function, Figure N.2, No Reduction in Metal Deck Capacity, Reinforced Masonry Walls, Missile Environment A
+Hazus_N2_winds_mph = [60.254547, 75.526592, 79.856128, 83.420452, 89.025146, 95.140327,   # Peak Gust Wind Speed in Open Terrain (mph), Zo = 0.03 m, digitized by Mark Hereld on 2015-07-27
+                      102.022465, 103.296689, 108.140341, 109.669321, 111.199316, 113.239135, 
+                      116.805777, 119.608319, 122.157629, 124.705668, 126.743806, 128.016060, 
+                      129.289602, 134.893402, 137.440477, 141.767996, 144.058656, 147.113580, 
+                      149.404425, 152.713734, 154.240786, 157.803469, 160.346892, 162.127828, 
+                      162.890355, 164.924839, 168.992669, 170.009487, 172.298091, 176.365879, 
+                      180.432806, 181.703853, 186.278227, 189.581873, 195.172266, 200.000000]
+Hazus_N2_loss = [0.000006, 0.000000, 0.007256, 0.010729, 0.034575, 0.068587,   # Building Loss Ratio, Zo = 0.03 m, digitized by Mark Hereld on 2015-07-27
+                 0.126311, 0.136496, 0.187386, 0.200959, 0.221302, 0.248424, 
+                 0.278956, 0.306084, 0.343359, 0.373861, 0.397582, 0.400985, 
+                 0.414540, 0.482293, 0.516160, 0.556808, 0.577131, 0.614372, 
+                 0.641453, 0.688833, 0.709138, 0.756508, 0.776813, 0.800493, 
+                 0.800497, 0.817413, 0.837716, 0.841101, 0.864774, 0.898591, 
+                 0.922260, 0.935782, 0.949307, 0.962828, 0.983106, 0.989865]
+
+# THRESHOLD (PEAK GUST, MPH) AT WHICH AN ELECTRIC POWER PLANT REACHES A GIVEN BUILDING LOSS RATIO
+# The fragility curve is compiled once into Fragility.fragilityRegistry (shared with Fragility.FragilityList),
+# and each (class, Zo, loss ratio) threshold is only interpolated the first time it is asked.
+def eppThreshold(loss_ratio=0.5, Zo_m=0.03):
+    if fragility_file != None:
+        source = fragilitySource(fragility_file)
+        if not fragilityRegistry.has(epp_fragility_class, source):
+            FragilityList().appendFragilityTypesFromFile(fragility_file, defaultType='WindCurves')  # Registers every class in the file
+    else:
+        source = epp_fragility_source
+        if not fragilityRegistry.has(epp_fragility_class, source):
+            fragilityRegistry.registerCurves(epp_fragility_class, [Hazus_N2_winds_mph], [Hazus_N2_loss], source=source)  # Zo = 0.03 m curve only
+    return fragilityRegistry.threshold(epp_fragility_class, Zo_m, loss_ratio, source)
+
 
 def failureFunction(asset='ngpp',wind_mph=None,gust_threshold_mph=None, floodlvl_m=None,human=None,pga_g=None):
     if wind_mph != None:  # Tropical Cyclone Winds Hazard
@@ -80,23 +118,8 @@ def failureFunction(asset='ngpp',wind_mph=None,gust_threshold_mph=None, floodlvl
         if asset == 'epp': 
             # From Fig. N.2 in Hazus Hurricane Technical Manual
             # Industrial Building Loss Function, Figure N.2, No Reduction in Metal Deck Capacity, Reinforced Masonry Walls, Missile Environment A
-            fragility_curve_winds = [60.254547, 75.526592, 79.856128, 83.420452, 89.025146, 95.140327,   # Peak Gust Wind Speed in Open Terrain (mph), Zo = 0.03 m, digitized by Mark Hereld on 2015-07-27
-                                     102.022465, 103.296689, 108.140341, 109.669321, 111.199316, 113.239135, 
-                                     116.805777, 119.608319, 122.157629, 124.705668, 126.743806, 128.016060, 
-                                     129.289602, 134.893402, 137.440477, 141.767996, 144.058656, 147.113580, 
-                                     149.404425, 152.713734, 154.240786, 157.803469, 160.346892, 162.127828, 
-                                     162.890355, 164.924839, 168.992669, 170.009487, 172.298091, 176.365879, 
-                                     180.432806, 181.703853, 186.278227, 189.581873, 195.172266, 200.000000]
-            fragility_curve_loss = [0.000006, 0.000000, 0.007256, 0.010729, 0.034575, 0.068587,   # Building Loss Ratio, Zo = 0.03 m, digitized by Mark Hereld on 2015-07-27
-                                    0.126311, 0.136496, 0.187386, 0.200959, 0.221302, 0.248424, 
-                                    0.278956, 0.306084, 0.343359, 0.373861, 0.397582, 0.400985, 
-                                    0.414540, 0.482293, 0.516160, 0.556808, 0.577131, 0.614372, 
-                                    0.641453, 0.688833, 0.709138, 0.756508, 0.776813, 0.800493, 
-                                    0.800497, 0.817413, 0.837716, 0.841101, 0.864774, 0.898591, 
-                                    0.922260, 0.935782, 0.949307, 0.962828, 0.983106, 0.989865]
-            interpolated_wind = interpolate.interp1d(fragility_curve_loss,fragility_curve_winds)  # Linear interpolation function for the fragility curve
             fragility_curve_threshold = 0.5   # Value of lost ratio to be used as the threshold between fail and nofail conditions
-            Hazus_threshold_mph = interpolated_wind(fragility_curve_threshold)   # Evaluate the interpolated fragility curve at the loss threshold point            
+            Hazus_threshold_mph = eppThreshold(fragility_curve_threshold)   # Evaluate the fragility curve at the loss threshold point
             gust_threshold_mph = min(gust_threshold_mph,Hazus_threshold_mph)   # miles per hour ; for example, gust_threshold_mph = 150.0
 
         if  math.isnan(gust_mph) or math.isnan(gust_threshold_mph):  # This 'else' includes cases where gust_mph and/or gust_threshold_mph are Not-a-Number
@@ -151,6 +174,71 @@ def failureFunction(asset='ngpp',wind_mph=None,gust_threshold_mph=None, floodlvl
     # 1 : Yes, if prob. of failure > 50%
     return failure
 
+# Stack masked arrays of the same shape, keeping their masks
+def stackMasked(arrays):
+    return np.ma.array([np.ma.getdata(a) for a in arrays], mask=[np.ma.getmaskarray(a) for a in arrays])
+
+
+# GUST THRESHOLDS (mph) ACTUALLY COMPARED WITH THE HURRICANE GUSTS BY failureFunctions, one per asset
+# As threshold for Electric Power Plants, use the lower of (local wind load in building code ASCE7-05 or 50% loss in Hazus Hurricane Fig. N.2 Fragility Curve)
+def windGustThresholds(asset='ngpp',gust_threshold_mph=None):
+    asset = np.asarray(asset)
+    if gust_threshold_mph is None:
+        gust_threshold_mph = float('nan')
+    shape = np.broadcast(asset, np.asarray(gust_threshold_mph, dtype=float)).shape
+    asset = np.broadcast_to(asset, shape)
+    threshold_mph = np.array(np.broadcast_to(np.asarray(gust_threshold_mph, dtype=float), shape))
+    is_epp = (asset == 'epp')
+    if is_epp.any():
+        Hazus_threshold_mph = eppThreshold(0.5)
+        threshold_mph[is_epp] = np.minimum(threshold_mph[is_epp], Hazus_threshold_mph)  # NaN stays NaN, as with min() in failureFunction
+    return threshold_mph
+
+
+# ARRAY VERSION OF failureFunction, FOR WHOLE ASSET LAYERS
+# Each input may be None (hazard not considered), a single value, or an array with one value per asset
+# (asset codes included, e.g., asset=['epp','eps','eptl','ngpp']); NaN values mask that hazard for that asset only.
+# The hazards are combined as in failureFunction: the human threat is averaged with the largest probability of the
+# natural hazards, ignoring the masked ones. As in failureFunction, an asset whose hazards are all masked is reported as failed
+# (its probability of failure is undefined), unless no hazard at all is considered.
+def failureFunctions(asset='ngpp',wind_mph=None,gust_threshold_mph=None, floodlvl_m=None,human=None,pga_g=None):
+    given = [np.asarray(value, dtype=float) for value in (wind_mph, gust_threshold_mph, floodlvl_m, human, pga_g) if value is not None]
+    asset = np.asarray(asset)
+    shape = np.broadcast(*(given + [asset])).shape if len(given) > 0 else asset.shape
+    asset = np.broadcast_to(asset, shape)
+    if len(given) == 0 or (wind_mph is None and pga_g is None and human is None and floodlvl_m is None):
+        return np.zeros(shape, dtype=bool)
+
+    natural = []  # Probabilities of failure from the natural hazards, masked where the hazard is not available
+    if wind_mph is not None:  # Tropical Cyclone Winds Hazard
+        gust_mph = 1.3 * np.broadcast_to(np.asarray(wind_mph, dtype=float), shape)    # Recall that 1 mph wind = 1.3 mph gust
+        threshold_mph = windGustThresholds(asset, gust_threshold_mph)
+        if want_fuzzylogic == 1:
+            probability_wind_failure = 1.0 / (1.0 + np.exp(-gust_mph+threshold_mph))
+        else:
+            probability_wind_failure = (gust_mph > threshold_mph).astype(float)
+        natural.append(np.ma.masked_where(np.isnan(gust_mph) | np.isnan(threshold_mph), probability_wind_failure))
+    if floodlvl_m is not None:  # Flood Hazard (damage functions)
+        functionality_threshold = 1.2192  # in meters, where 1.2192 m = 4 ft
+        flood = np.broadcast_to(np.asarray(floodlvl_m, dtype=float), shape)
+        natural.append(np.ma.masked_invalid(1.0 / ( 1.0 + np.exp(5.0*(-flood + functionality_threshold)) )))
+    if pga_g is not None:  # Earthquake Hazard (fragility curves)
+        pga_threshold = 0.4 # g units
+        pga = np.broadcast_to(np.asarray(pga_g, dtype=float), shape)
+        natural.append(np.ma.masked_invalid(1.0 / (1.0 + np.exp(10.0 * (-pga+pga_threshold) ))))
+
+    combined = []
+    if human is not None: # Human Threat
+        combined.append(np.ma.masked_invalid(np.broadcast_to(np.asarray(human, dtype=float), shape)))
+    if len(natural) > 0:
+        combined.append(np.ma.max(stackMasked(natural), axis=0))
+    probability_of_failure = np.ma.mean(stackMasked(combined), axis=0)
+
+    # Same as bool(round(probability_of_failure)) in failureFunction, which rounds halves away from zero
+    failure = np.ma.filled(np.abs(probability_of_failure) >= 0.5, True)
+    return np.asarray(failure, dtype=bool).reshape(shape)
+
+
 failureFunction() 
 
 '''
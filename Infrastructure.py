@@ -9,6 +9,8 @@ import shapefile
 import numpy as np
 import random
 from Asset import Asset, AssetList
+from Geometry import pointsWithinDistance, GeometryStore
+from PointShapefile import PointShapefile, updateAnalyzedField, stampAnalyzedLayer
 
 class InfrastructureElement(object):
 
@@ -18,14 +20,13 @@ class InfrastructureElement(object):
         self.assets = []          # list of assets located at this element
         self.removed = False      # Is this element removed?
 
-    def findAssets(self, assets):
-
-        for a in assets.entries.values():
-            dist = np.linalg.norm(np.array(self.location) - np.array(a.geometry))
-            # TODO: This is arbitrary choice.
-            maxdist = 0.1;
-            if (dist < maxdist):
-                self.assets.append(a)
+    # Assets closer than maxdist: degrees of latitude/longitude, or km along the Earth if geographic
+    # (InfrastructureLayer.linkAssets does the same for all elements of a layer at once)
+    # TODO: This is arbitrary choice.
+    def findAssets(self, assets, maxdist = 0.1, geographic = False):
+        lats, lons = assets.coordinates()
+        i, j = pointsWithinDistance([self.location[1]], [self.location[0]], lons, lats, maxdist, geographic)
+        self.assets.extend(assets.rowsAt(j))
 
 class InfrastructureLayer(object):
 #GENERIFY#     def load():
@@ -39,38 +40,47 @@ class InfrastructureLayer(object):
         self.sf = ''
         self.filename = ''
         self.elements = []
+        self.store = None                           # points and typed attribute columns (see Geometry.GeometryStore)
+        self.outaged = np.zeros(0, dtype=bool)      # outage status of each element, written as 'Outaged' text by save()
 
         # These would not need to be member variables. - Kim, 08272015
         # self.shapes = ''
         # self.fields = ''
         # self.records = ''
 
-    def load(self,shapefilename):
+    # fieldNames: attributes to decode into typed columns (e.g. ['GenOutput', 'Load']), None for all of them
+    def load(self,shapefilename,fieldNames=None):
 
         # Read shape files for Electric Power Buses
 
         self.filename = shapefilename
         self.sf = shapefile.Reader(shapefilename)
-        self.shapes = self.sf.shapes()  # Geometry: shp file with geometries # Every geometry/shape must have a corresponding record
-        self.fields = self.sf.fields    # Atributes: shx file with headers  # fields[ #ofrecords[:,i]+1, 4]
-        self.records= self.sf.records() # Records: dbf file with contents # records[ #ofshapes, #offields[:,i] -1]
-        #print(fields)
-        #[('DeletionFlag', 'C', 1, 0), ['Class', 'C', 60, 0], ['Bus', 'C', 60, 0], ['Type', 'N', 11, 0], ['GenOutput', 'F', 19, 11], ['Load', 'F', 19, 11], ['VarLoad', 'F', 19, 11], ['GenRating', 'F', 19, 11], ['MinGen', 'F', 19, 11], ['Voltage', 'F', 19, 11], ['Angle', 'F', 19, 11], ['Latitude', 'F', 19, 11], ['Longitude', 'F', 19, 11], ['Name', 'C', 60, 0], ['Island', 'N', 11, 0], ['FinalGen', 'F', 19, 11], ['FinalLoad', 'F', 19, 11], ['Stable', 'C', 60, 0], ['Feasible', 'C', 60, 0]]
-
-        #IF 'Outaged' does not exist then ...
-        # Create a new field & record in the bus shapefiles: 'Outaged' = 'False'
-        self.fields.append(['Outaged', 'C', 60, 0])
-
-        # No need to be a member
-        self.list2Bappended = [['False']] * (len(self.shapes))  # Important, use [[]] to make a column array
-        self.records = np.hstack((self.records,self.list2Bappended))  #Append/concatenate the new column array into the records list, as the last column
-
-        for i in xrange(self.sf.numRecords):
+        if (fieldNames != None):
+            fieldNames = list(fieldNames) + ['Outaged']
+        try:
+            # POINT layers are memory-mapped, without a Shape object per record
+            self.store = GeometryStore().loadPoints(PointShapefile(shapefilename), fieldNames)
+        except ValueError:
+            self.store = GeometryStore().load(self.sf, fieldNames)   # Geometry and the requested attributes, decoded once
+        #print(self.store.fields)
+        #[['Class', 'C', 60, 0], ['Bus', 'C', 60, 0], ['Type', 'N', 11, 0], ['GenOutput', 'F', 19, 11], ['Load', 'F', 19, 11], ['VarLoad', 'F', 19, 11], ['GenRating', 'F', 19, 11], ['MinGen', 'F', 19, 11], ['Voltage', 'F', 19, 11], ['Angle', 'F', 19, 11], ['Latitude', 'F', 19, 11], ['Longitude', 'F', 19, 11], ['Name', 'C', 60, 0], ['Island', 'N', 11, 0], ['FinalGen', 'F', 19, 11], ['FinalLoad', 'F', 19, 11], ['Stable', 'C', 60, 0], ['Feasible', 'C', 60, 0]]
+
+        # Outage status: 'Outaged' = 'False' for every element, unless the shapefile already has an 'Outaged' field
+        self.outaged = np.zeros(len(self.store), dtype=bool)
+        if ('Outaged' in self.store.fieldNames):
+            self.outaged = (self.store.column('Outaged') == u'True')   # stripped text, whichever way the layer was read
+
+        first = self.store.firstPoints()
+        for i in xrange(len(self.store)):
             element = InfrastructureElement()
-            element.location[0] = self.sf.shape(i).points[0][1]
-            element.location[1] = self.sf.shape(i).points[0][0]
+            element.location[0] = first[i, 1]
+            element.location[1] = first[i, 0]
             self.elements.append(element)
 
+    # Typed attribute column, by name (see load)
+    def column(self, fieldName):
+        return self.store.column(fieldName)
+
     def save(self,shapefilename):
 
         # Mark removed elements
@@ -84,15 +94,43 @@ class InfrastructureLayer(object):
         .dbf – dbase III table containing attribute information for the shapes in the .shp file
         .shx – shape index file, contains the offset of the records in the .shp file (for random access reading) '''
         # For details visit https://pypi.python.org/pypi/pyshp
-        w = shapefile.Writer(shapeType=shapefile.POINT)  # Recall that sf.shapeType = 1 ==> Point
-        w.fields = list(self.sf.fields)    # Atributes: shx file  #Do not use sf.fields, because it does not have the new 'Outaged' atribute
+        # The outage column becomes text only here: 'True'/'False' in the 'Outaged' field, added as the last field if new
+        outageText = np.where(self.outaged, 'True', 'False')
+        # Later runs against the same, unchanged layer rewrite only the outage bytes of the output .dbf written and stamped below
+        if (updateAnalyzedField(shapefilename+'_analyzed', self.filename, 'Outaged', outageText)):
+            return
+        fields = list(self.sf.fields)
+        records = [list(r) for r in self.sf.records()]
+        if ('Outaged' in self.store.fieldNames):
+            k = self.store.fieldNames.index('Outaged')
+            for record, text in zip(records, outageText):
+                record[k] = text
+        else:
+            fields.append(['Outaged', 'C', 60, 0])
+            for record, text in zip(records, outageText):
+                record.append(text)
+        w = shapefile.Writer(shapeType=self.sf.shapeType)  # Recall that sf.shapeType = 1 ==> Point
+        w.fields = fields                  # Atributes: shx file
         w._shapes = list(self.sf.shapes()) # Geometry: shp file
-        w.records = list(self.records)  # Records: dbf file
+        w.records = records             # Records: dbf file
         #w.point(sf.shapes()) #shapes)    # Geometry: shp file
         #w.field(sf.fields)    # Atributes: shx file
         #w.record(records)  #Records: dbf file
         #print 'Writing output shapefiles at... '+datadir+'/'+myshp+'_analyzed.*'
         w.save(shapefilename+'_analyzed')
+        stampAnalyzedLayer(shapefilename+'_analyzed', self.filename)
+
+    # Link every element to the assets closer than maxdist (see InfrastructureElement.findAssets),
+    # with one spatial join of all elements against all assets
+    def linkAssets(self, assets, maxdist = 0.1, geographic = False):
+        lats, lons = assets.coordinates()
+        elats = np.array([element.location[0] for element in self.elements], dtype=float)
+        elons = np.array([element.location[1] for element in self.elements], dtype=float)
+        i, j = pointsWithinDistance(elons, elats, lons, lats, maxdist, geographic)
+        rows = assets.rowsAt(j)
+        bounds = np.searchsorted(i, np.arange(len(self.elements) + 1))
+        for e in xrange(len(self.elements)):
+            self.elements[e].assets.extend(rows[bounds[e]:bounds[e+1]])
 
     # Wrapper for load
     def open(self,shapefilename):               # provide this alias for backward compatibility
@@ -103,11 +141,11 @@ class InfrastructureLayer(object):
         self.save(shapefilename)
 
     def disableElementByIndex(self,index):
-        self.records[index][-1] = 'True'           # Recall that records[ii][-1] = 'False' # bus 'Outaged'index):
+        self.outaged[index] = True                  # written as 'Outaged' = 'True' by save()
 
     # TODO: only for testing...
     def randomlyTrashThisNetwork(self):
-        for ii in xrange(len(self.shapes)):
+        for ii in xrange(len(self.elements)):
             failure = (random.random()>0.5)     # Need to find the random()
             
             if failure:
@@ -0,0 +1,139 @@
+# Comparing InfrastructureLayer (Infrastructure.py) with the legacy per-element code, on the IFFpackage data
+#   load: typed attribute columns against the records decoded by pyshp, for a POINT layer and a POLYLINE layer
+#   save: the 'Outaged' field written back and read again
+#   linkAssets and findAssets against the legacy distance loop of findAssets, in degrees and in km along the Earth
+# Run from the repository directory: python InfrastructureTest.py
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import shapefile
+
+from TestReport import check, report
+from Geometry import EARTH_RADIUS_KM, typedColumn
+from Asset import AssetTable
+from Infrastructure import InfrastructureLayer, InfrastructureElement
+from PointShapefile import stampAnalyzedLayer
+
+# Legacy findAssets of InfrastructureElement: every asset closer than 0.1 degree
+def legacyFindAssets(location, assets):
+    found = []
+    for a in assets:
+        dist = np.linalg.norm(np.array(location) - np.array(a.geometry))
+        if (dist < 0.1):
+            found.append(a.name)
+    return found
+
+# Great-circle distance (km) from location to each asset
+def distancesKm(location, lats, lons):
+    la, lb = np.radians(location[0]), np.radians(lats)
+    h = np.sin(0.5 * (lb - la))**2 + np.cos(la) * np.cos(lb) * np.sin(0.5 * np.radians(lons - location[1]))**2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(h))
+
+# Typed columns hold what pyshp decodes, and only the requested ones are decoded
+def testLoad(layername):
+    reader = shapefile.Reader(layername)
+    fields = [f for f in reader.fields if f[0] != 'DeletionFlag']
+    records = reader.records()
+    layer = InfrastructureLayer()
+    layer.load(layername)
+    ok = True
+    for k, field in enumerate(fields):
+        expected = typedColumn([r[k] for r in records], field[1], field[3])
+        column = layer.column(field[0])
+        ok = ok and column.dtype.kind == expected.dtype.kind and \
+            all([a == b or (a != a and b != b) for a, b in zip(column.tolist(), expected.tolist())])
+    first = np.array([shape.points[0] if (len(shape.points) > 0) else (np.nan, np.nan) for shape in reader.shapes()])
+    check('InfrastructureLayer.load columns vs pyshp, ' + os.path.basename(layername),
+          ok and np.allclose([e.location for e in layer.elements], first[:, ::-1], equal_nan=True),
+          '(%d elements, %d fields)' % (len(layer.elements), len(fields)))
+
+    some = [fields[0][0], fields[-1][0]]
+    layer = InfrastructureLayer()
+    layer.load(layername, some)
+    loaded = [f[0] for f, c in zip(fields, layer.store.columns) if c is not None]
+    check('InfrastructureLayer.load of some fields, ' + os.path.basename(layername), loaded == some and not layer.outaged.any())
+
+# A layer written with an 'Outaged' field is read back with its outages, and save() updates them in its output layer
+def testOutages(layername):
+    directory = tempfile.mkdtemp()
+    try:
+        reader = shapefile.Reader(layername)
+        outaged = np.arange(len(reader)) % 3 == 0
+        source = os.path.join(directory, 'layer')
+        writer = shapefile.Writer(source, shapeType=reader.shapeType)
+        writer.fields = [f for f in reader.fields if f[0] != 'DeletionFlag'] + [['Outaged', 'C', 60, 0]]
+        for shape, record, out in zip(reader.shapes(), reader.records(), outaged):
+            writer.shape(shape)
+            writer.record(*(list(record) + [str(out)]))
+        writer.close()
+        for extension in ('.shp', '.shx', '.dbf'):
+            shutil.copy(source + extension, source + '_analyzed' + extension)
+        stampAnalyzedLayer(source + '_analyzed', source)     # as save() does after writing its output in full
+
+        layer = InfrastructureLayer()
+        layer.load(source)
+        check('InfrastructureLayer.load of the Outaged field', np.array_equal(layer.outaged, outaged), '(%d outaged)' % outaged.sum())
+        removed = np.arange(len(reader)) % 5 == 0
+        for element, remove in zip(layer.elements, removed):
+            element.removed = remove
+        layer.save(source)
+        saved = [r[-1] for r in shapefile.Reader(source + '_analyzed').records()]
+        check('InfrastructureLayer.save of the Outaged field', saved == [str(out) for out in (outaged | removed)],
+              '(%d outaged)' % (outaged | removed).sum())
+    finally:
+        shutil.rmtree(directory)
+
+# Assets at the line vertices, and around the buses
+def testAssets(buses, lines):
+    points = [(lat, lon) for shape in lines.shapes() for lon, lat in shape.points]
+    rng = np.random.RandomState(2015)
+    for shape in buses.shapes():
+        lon, lat = shape.points[0]
+        points.extend(zip(lat + rng.uniform(-0.15, 0.15, 3), lon + rng.uniform(-0.15, 0.15, 3)))
+    assets = AssetTable()
+    assets.appendRecords([('asset%d' % n, ('Hereld_2015-07-27', '2015-08-24', 'asset%d' % n, '', 'Substation', (lat, lon), 0.03, ()))
+                          for n, (lat, lon) in enumerate(points)])
+    return assets
+
+def assetNames(element):
+    return sorted([a.name for a in element.assets])
+
+def testLinkAssets(layername, assets):
+    layer = InfrastructureLayer()
+    layer.load(layername)
+    layer.linkAssets(assets)
+    legacy = [sorted(legacyFindAssets(element.location, assets)) for element in layer.elements]
+    check('linkAssets vs legacy findAssets', [assetNames(element) for element in layer.elements] == legacy,
+          '(%d elements, %d assets, %d links)' % (len(layer.elements), len(assets), sum([len(names) for names in legacy])))
+
+    elements = []
+    for element in layer.elements:
+        single = InfrastructureElement()
+        single.location = element.location
+        single.findAssets(assets)
+        elements.append(assetNames(single))
+    check('findAssets vs legacy findAssets', elements == legacy)
+
+    for maxdist in (1.0, 10.0):
+        layer = InfrastructureLayer()
+        layer.load(layername)
+        layer.linkAssets(assets, maxdist, geographic=True)
+        expected = [sorted(assets.names[distancesKm(element.location, assets.lats, assets.lons) < maxdist].tolist())
+                    for element in layer.elements]
+        check('linkAssets within %g km vs great-circle distances' % maxdist, [assetNames(element) for element in layer.elements] == expected,
+              '(%d links)' % sum([len(names) for names in expected]))
+
+# Test data files
+datadir = 'IFFpackage'
+buses = shapefile.Reader(datadir + '/buses')
+lines = shapefile.Reader(datadir + '/lines')
+
+# Run tests
+testLoad(datadir + '/buses')
+testLoad(datadir + '/lines')
+testOutages(datadir + '/buses')
+testLinkAssets(datadir + '/buses', testAssets(buses, lines))
+
+report()
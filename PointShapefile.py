@@ -0,0 +1,229 @@
+# Memory-mapped reader for POINT shapefiles (e.g. the electric power buses and natural gas processing plants)
+#
+#   PointShapefile      the .shp/.shx point coordinates and the .dbf attributes of a layer
+#   DBFTable            the records of a .dbf file, one fixed-width field after the other
+#
+# A POINT .shp holds fixed-size records (8-byte record header, shape type, x, y), so once the .shx
+# confirms that the records follow each other, the coordinates are strided NumPy views into the mapped
+# file: no Shape object is built for any record. Layers with null shapes fall back to gathering the
+# records through the .shx offsets. A .dbf also holds fixed-width records, so each field is a view of
+# fixed-width text; numeric fields are converted into typed arrays in one pass, without a record object.
+# Layers that are not POINT shapefiles raise ValueError, and are left to pyshp.
+#   updateAnalyzedField() rewrites one text field of an existing output layer in place (see below), once
+#   stampAnalyzedLayer() has recorded which source layer it was written from
+#
+# Usage:
+# layer = PointShapefile('IFFpackage/buses')
+# lons, lats = layer.x, layer.y                    # NaN for null shapes
+# voltage = layer.dbf.column('Voltage')            # float array
+
+import os
+import datetime
+import numpy as np
+
+SHAPETYPE_NULL = 0
+SHAPETYPE_POINT = 1
+
+# .shp record of a point: big-endian record header, then little-endian shape type and coordinates
+POINT_RECORD = np.dtype([('number', '>i4'), ('length', '>i4'), ('shapeType', '<i4'), ('x', '<f8'), ('y', '<f8')])
+# .shx record: big-endian offset and content length, in 16-bit words
+INDEX_RECORD = np.dtype([('offset', '>i4'), ('length', '>i4')])
+
+def shapefileName(filename, extension):
+    base = filename[:-4] if (filename.lower().endswith(('.shp', '.shx', '.dbf'))) else filename
+    for ext in (extension, extension.upper()):
+        if (os.path.exists(base + ext)):
+            return base + ext
+    return base + extension
+
+class PointShapefile(object):
+
+    def __init__(self, filename):
+        self.filename = filename
+        shpname = shapefileName(filename, '.shp')
+        shxname = shapefileName(filename, '.shx')
+        header = np.memmap(shpname, dtype='<i4', mode='r', shape=(9,))
+        self.shapeType = int(header[8])
+        if (self.shapeType != SHAPETYPE_POINT):
+            raise ValueError('%s is not a POINT shapefile (shape type %d)' % (shpname, self.shapeType))
+        del header
+
+        index = np.memmap(shxname, dtype=INDEX_RECORD, mode='r', offset=100)
+        offsets = 2 * index['offset'].astype(np.int64)        # bytes
+        lengths = 2 * index['length'].astype(np.int64)
+        n = len(index)
+        del index
+        if (n == 0):
+            self.x = np.zeros(0)
+            self.y = np.zeros(0)
+            self.coords = np.zeros((0, 2))
+            self.isPoint = np.zeros(0, dtype=bool)
+        elif ((lengths == POINT_RECORD.itemsize - 8).all() and (offsets == 100 + POINT_RECORD.itemsize * np.arange(n)).all()):
+            # every record is a point, one after the other: strided views, nothing copied
+            self.shp = np.memmap(shpname, dtype=np.uint8, mode='r')
+            self.records = np.ndarray(shape=(n,), dtype=POINT_RECORD, buffer=self.shp, offset=100)
+            self.coords = np.ndarray(shape=(n, 2), dtype='<f8', buffer=self.shp, offset=100 + 12,
+                                     strides=(POINT_RECORD.itemsize, 8))
+            self.x = self.coords[:, 0]
+            self.y = self.coords[:, 1]
+            self.isPoint = np.ones(n, dtype=bool)
+        else:
+            # null shapes make the records of different sizes: gather the points through the .shx offsets
+            self.shp = np.memmap(shpname, dtype=np.uint8, mode='r')
+            point = (lengths >= POINT_RECORD.itemsize - 8)
+            shapeType = np.zeros(n, dtype=np.int32)
+            start = offsets[point] + 8
+            shapeType[point] = self.shp[start[:, None] + np.arange(4)].copy().view('<i4').ravel()
+            self.isPoint = point & (shapeType == SHAPETYPE_POINT)
+            self.coords = np.empty((n, 2))
+            self.coords.fill(np.nan)
+            start = offsets[self.isPoint] + 12
+            self.coords[self.isPoint] = self.shp[start[:, None] + np.arange(16)].copy().view('<f8').reshape(-1, 2)
+            self.x = self.coords[:, 0]
+            self.y = self.coords[:, 1]
+
+        dbfname = shapefileName(filename, '.dbf')
+        self.dbf = DBFTable(dbfname) if (os.path.exists(dbfname)) else None
+
+    def __len__(self):
+        return len(self.x)
+
+# The records of a dBase III file, as a structured array of fixed-width text fields
+#   fields      [name, type, size, decimals] of each field, as pyshp gives them (without the DeletionFlag)
+#   records     memory-mapped structured array, one 'S<size>' member per field
+#   deleted     True for the records flagged as deleted
+class DBFTable(object):
+
+    def __init__(self, filename, mode='r'):
+        self.filename = filename
+        header = np.memmap(filename, dtype=np.uint8, mode='r', shape=(32,))
+        self.numRecords = int(header[4:8].copy().view('<u4')[0])
+        self.headerLength = int(header[8:10].copy().view('<u2')[0])
+        self.recordLength = int(header[10:12].copy().view('<u2')[0])
+        del header
+
+        descriptors = np.memmap(filename, dtype=np.uint8, mode='r', shape=(self.headerLength,))
+        self.fields = []
+        position = 32
+        while (position + 32 <= self.headerLength and descriptors[position] != 0x0D):
+            descriptor = descriptors[position:position + 32].tostring()
+            name = descriptor[0:11].split(b'\0')[0].decode('latin-1')
+            self.fields.append([name, descriptor[11:12].decode('latin-1'), ord(descriptor[16:17]), ord(descriptor[17:18])])
+            position += 32
+        del descriptors
+        self.fieldNames = [f[0] for f in self.fields]
+
+        members = [('DeletionFlag', 'S1')] + [('f%d' % k, 'S%d' % f[2]) for k, f in enumerate(self.fields)]
+        layout = np.dtype(members)
+        padding = self.recordLength - layout.itemsize
+        if (padding < 0):
+            raise ValueError('%s: fields are wider than the records' % filename)
+        if (padding > 0):
+            layout = np.dtype(members + [('padding', 'V%d' % padding)])
+        if (self.numRecords == 0):
+            self.records = np.zeros(0, dtype=layout)
+        else:
+            self.records = np.memmap(filename, dtype=layout, mode=mode, offset=self.headerLength, shape=(self.numRecords,))
+        self.deleted = (self.records['DeletionFlag'] == b'*')
+
+    def __len__(self):
+        return self.numRecords
+
+    # Fixed-width text of a field, as a view of the file (by name or position)
+    def raw(self, key):
+        if (not isinstance(key, int)):
+            key = self.fieldNames.index(key)
+        return self.records['f%d' % key]
+
+    # Typed values of a field, as Geometry.typedColumn gives them for pyshp records:
+    # 'N' without decimals becomes integers (floats if some are blank), 'N' and 'F' become floats (NaN where blank),
+    # 'L' becomes boolean, and anything else becomes stripped unicode text ('D' dates stay as YYYYMMDD)
+    def column(self, key):
+        if (not isinstance(key, int)):
+            key = self.fieldNames.index(key)
+        name, fieldType, size, decimals = self.fields[key]
+        text = np.char.strip(self.raw(key))
+        if (fieldType in ('N', 'F')):
+            blank = (text == b'') | (text == b'*') | np.char.startswith(text, b'*')
+            values = np.empty(len(text))
+            values.fill(np.nan)
+            values[~blank] = text[~blank].astype(float)
+            if (fieldType == 'N' and decimals == 0 and not blank.any() and (values == np.round(values)).all()):
+                values = values.astype(np.int64)
+            return values
+        if (fieldType == 'L'):
+            return np.in1d(text, [b'T', b't', b'Y', b'y'])
+        return np.char.decode(text, 'utf-8', 'replace')
+
+    # Write text values into a field, left-justified and space-padded as dBase stores text.
+    # The table must have been opened with mode='r+'; the bytes of the other fields are not touched.
+    def setText(self, key, values):
+        if (not isinstance(key, int)):
+            key = self.fieldNames.index(key)
+        size = self.fields[key][2]
+        text = np.char.encode(np.asarray(values).astype(np.unicode_), 'utf-8')
+        if (len(text) != self.numRecords):
+            raise ValueError('%s: %d values for %d records' % (self.filename, len(text), self.numRecords))
+        if (len(text) > 0 and np.char.str_len(text).max() > size):
+            raise ValueError('%s: values wider than field %s' % (self.filename, self.fieldNames[key]))
+        self.raw(key)[:] = np.char.ljust(text, size)
+        header = np.memmap(self.filename, dtype=np.uint8, mode='r+', shape=(4,))
+        today = datetime.date.today()
+        header[1:4] = [today.year - 1900, today.month, today.day]    # date of last update
+        header.flush()
+        del header
+        if (isinstance(self.records, np.memmap)):
+            self.records.flush()
+
+# Sizes and modification times of the files an output layer was written from: the .shp/.shx/.dbf of the source layer,
+# and the .shp/.shx of the output itself (its .dbf changes with every update). None when one of them is missing.
+def layerStamp(filename, sourcename):
+    lines = []
+    for name, extensions in ((sourcename, ('.shp', '.shx', '.dbf')), (filename, ('.shp', '.shx'))):
+        for extension in extensions:
+            path = shapefileName(name, extension)
+            if (not os.path.exists(path)):
+                return None
+            status = os.stat(path)
+            lines.append('%s %d %r\n' % (os.path.basename(path), status.st_size, status.st_mtime))
+    return ''.join(lines)
+
+# Remember that the output layer filename was just written in full from the layer sourcename (see updateAnalyzedField):
+# a small text file filename.stamp, next to the output .shp/.shx/.dbf
+def stampAnalyzedLayer(filename, sourcename):
+    stamp = layerStamp(filename, sourcename)
+    if (stamp == None):
+        return False
+    f = open(shapefileName(filename, '.stamp'), 'w')
+    f.write(stamp)
+    f.close()
+    return True
+
+# Rewrite the text field fieldName of the output layer filename (e.g. 'buses_analyzed') in place, when it was written
+# in full from the layer sourcename, and neither has changed since: its .stamp (see stampAnalyzedLayer) still matches
+# the sizes and modification times of their files. Only the .dbf header is read to find the field, so that a run
+# changes only the bytes of fieldName, instead of writing a new .shp/.shx/.dbf triplet per scenario run.
+# Returns False, leaving the files untouched, when the output layer is missing, was not stamped or does not match,
+# so that the caller writes it in full (and stamps it).
+def updateAnalyzedField(filename, sourcename, fieldName, values):
+    stampname = shapefileName(filename, '.stamp')
+    if (not os.path.exists(stampname)):
+        return False
+    f = open(stampname)
+    stamp = f.read()
+    f.close()
+    if (stamp != layerStamp(filename, sourcename)):
+        return False
+    dbfname = shapefileName(filename, '.dbf')
+    if (not os.path.exists(dbfname)):
+        return False
+    table = DBFTable(dbfname, mode='r+')
+    if (fieldName not in table.fieldNames or len(values) != len(table)):
+        return False
+    if (table.fields[table.fieldNames.index(fieldName)][1] != 'C'):
+        return False
+    try:
+        table.setText(fieldName, values)
+    except ValueError:
+        return False
+    return True
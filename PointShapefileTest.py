@@ -0,0 +1,146 @@
+# Comparing the memory-mapped point shapefile reader (PointShapefile.py) with pyshp, on the IFFpackage data
+#   coordinates and typed .dbf columns of the buses and natural gas processing plants, as GeometryStore loads them
+#   a layer with null shapes, gathered through the .shx offsets
+#   the .dbf columns of a layer that is not a POINT layer (the lines), as FailureAnalyses.py reads them
+#   updateAnalyzedField(): rewrites only the outage field of a stamped output layer, and refuses layers that changed
+# Run from the repository directory: python PointShapefileTest.py
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import shapefile
+
+from TestReport import check, report
+from PointShapefile import PointShapefile, DBFTable, shapefileName, updateAnalyzedField, stampAnalyzedLayer
+from Geometry import GeometryStore, typedColumn
+
+def sameColumn(a, b):
+    if (a.dtype.kind == 'f' and b.dtype.kind == 'f'):
+        return a.shape == b.shape and bool(((a == b) | (np.isnan(a) & np.isnan(b))).all())
+    return a.dtype.kind == b.dtype.kind and np.array_equal(a, b)
+
+# A POINT layer with some null shapes (pyshp 1 and pyshp 2 writers)
+def writePoints(filename, points):
+    if (shapefile.__version__ >= '2'):
+        w = shapefile.Writer(filename, shapeType=shapefile.POINT)
+    else:
+        w = shapefile.Writer(shapeType=shapefile.POINT)
+    w.field('Name', 'C', 20, 0)
+    w.field('Value', 'N', 10, 2)
+    for n, point in enumerate(points):
+        if (point == None):
+            w.null()
+        else:
+            w.point(point[0], point[1])
+        w.record('site %d' % n, '' if (n % 5 == 0) else 1.25 * n)
+    if (shapefile.__version__ >= '2'):
+        w.close()
+    else:
+        w.save(filename)
+
+# Fields and typed columns of a .dbf, against typedColumn of the pyshp records
+def testTable(table, reader, name):
+    fields = [list(f) for f in reader.fields[1:]]
+    records = reader.records()
+    columns = [typedColumn([record[k] for record in records], f[1], f[3]) for k, f in enumerate(fields)]
+    check('DBFTable fields vs pyshp, ' + name, table.fields == fields)
+    check('DBFTable columns vs pyshp records, ' + name,
+          all([sameColumn(table.column(k), columns[k]) for k in range(len(fields))]) and
+          all([sameColumn(table.column(f[0]), columns[k]) for k, f in enumerate(fields)]),
+          '(%d fields, %d records)' % (len(fields), len(records)))
+
+def testLayer(filename):
+    reader = shapefile.Reader(filename)
+    layer = PointShapefile(filename)
+    shapes = reader.shapes()
+    isPoint = np.array([len(shape.points) > 0 for shape in shapes])
+    coords = np.array([shape.points[0] if (len(shape.points) > 0) else [np.nan, np.nan] for shape in shapes], dtype=float)
+    check('PointShapefile coordinates vs pyshp, ' + os.path.basename(filename),
+          len(layer) == len(shapes) and np.array_equal(layer.isPoint, isPoint) and sameColumn(layer.coords, coords),
+          '(%d points, %d null)' % (isPoint.sum(), (~isPoint).sum()))
+    testTable(layer.dbf, reader, os.path.basename(filename))
+
+    store = GeometryStore().loadPoints(layer)
+    reference = GeometryStore().load(reader)
+    check('GeometryStore.loadPoints vs GeometryStore.load, ' + os.path.basename(filename),
+          np.array_equal(store.coords, reference.coords) and np.array_equal(store.shapeOffsets, reference.shapeOffsets) and
+          store.fieldNames == reference.fieldNames and
+          all([sameColumn(a, b) for a, b in zip(store.columns, reference.columns)]))
+
+# Other shape types are left to pyshp, but their .dbf is read as a DBFTable all the same
+def testOtherLayer(filename):
+    try:
+        PointShapefile(filename)
+        refused = False
+    except ValueError:
+        refused = True
+    check('PointShapefile refuses a layer that is not POINT, ' + os.path.basename(filename), refused)
+    testTable(DBFTable(shapefileName(filename, '.dbf')), shapefile.Reader(filename), os.path.basename(filename))
+
+# Output layer of a source layer as FailureAnalyses.py writes it in full: same shape type, shapes and records, and stamped
+def writeAnalyzed(source, target):
+    reader = shapefile.Reader(source)
+    writer = shapefile.Writer(target, shapeType=reader.shapeType)
+    writer.fields = [f for f in reader.fields if f[0] != 'DeletionFlag']
+    for shape, record in zip(reader.shapes(), reader.records()):
+        writer.shape(shape)
+        writer.record(*record)
+    writer.close()
+    return stampAnalyzedLayer(target, source)
+
+def copyLayer(source, target):
+    for extension in ('.shp', '.shx', '.dbf'):
+        shutil.copyfile(source + extension, target + extension)
+
+def testUpdateAnalyzedField(directory, name):
+    source = os.path.join(directory, name)
+    target = source + '_analyzed'
+    copyLayer(datadir + '/' + name, source)
+    stamped = writeAnalyzed(source, target)
+    before = shapefile.Reader(target)
+    check('output layer written with the shape type of its source, ' + name, before.shapeType == shapefile.Reader(source).shapeType,
+          '(%d)' % before.shapeType)
+    records = before.records()
+    shp = open(target + '.shp', 'rb').read()
+    outage = ['True' if (n % 3 == 0) else 'False' for n in range(len(records))]
+    updated = stamped and updateAnalyzedField(target, source, 'outage', outage)
+    after = shapefile.Reader(target).records()
+    check('updateAnalyzedField rewrites the outage field, ' + name, updated and [record[-1] for record in after] == outage)
+    check('updateAnalyzedField leaves the other fields and the shapes as they were, ' + name,
+          [list(record[:-1]) for record in after] == [list(record[:-1]) for record in records] and
+          open(target + '.shp', 'rb').read() == shp)
+    check('updateAnalyzedField again, with the same stamp, ' + name, updateAnalyzedField(target, source, 'outage', outage[::-1]) and
+          [record[-1] for record in shapefile.Reader(target).records()] == outage[::-1])
+
+    dbf = open(target + '.dbf', 'rb').read()
+    refused = not updateAnalyzedField(target, source, 'outage', ['much too long'] * len(outage))
+    refused &= not updateAnalyzedField(target, source, 'outage', outage[:-1])
+    refused &= not updateAnalyzedField(target, source, 'Feasible2', outage)
+    refused &= not updateAnalyzedField(source + '_missing', source, 'outage', outage)
+    stamp = os.stat(source + '.dbf')
+    os.utime(source + '.dbf', (stamp.st_atime, stamp.st_mtime + 10.0))    # the source layer was edited since
+    refused &= not updateAnalyzedField(target, source, 'outage', outage)
+    stampAnalyzedLayer(target, source)
+    os.remove(shapefileName(target, '.stamp'))                               # an output layer written by something else
+    refused &= not updateAnalyzedField(target, source, 'outage', outage)
+    check('updateAnalyzedField refuses layers and values that do not match, ' + name, refused and
+          open(target + '.dbf', 'rb').read() == dbf)
+
+# Test data files
+datadir = 'IFFpackage'
+
+# Run tests
+testLayer(datadir + '/buses')
+testLayer(datadir + '/ngpp_draft_FL')
+testOtherLayer(datadir + '/lines')
+directory = tempfile.mkdtemp()
+try:
+    writePoints(directory + '/nullpoints', [(-85.0 + 0.1 * n, 30.0 + 0.05 * n) if (n % 4 != 1) else None for n in range(20)])
+    testLayer(directory + '/nullpoints')
+    testUpdateAnalyzedField(directory, 'buses')
+    testUpdateAnalyzedField(directory, 'lines')
+finally:
+    shutil.rmtree(directory)
+
+report()
@@ -0,0 +1,118 @@
+# Columnar results of a scenario run, one row per asset
+#   ScenarioResults         the rows of one run: layer, asset id, hazard intensity, failure threshold, failure flag
+#   loadScenarioResults()   the columns of a saved run, memory-mapped when the file was saved uncompressed
+#
+# A run is saved as a NumPy .npz archive, one .npy member per column, instead of a copy of every
+# input shapefile. Text columns are fixed-width bytes (UTF-8), so that no member needs pickle.
+# The members lie in the archive as plain .npy arrays, and loadScenarioResults maps them straight from the
+# file, without reading them in. save(compressed=True) writes a smaller archive, whose members are read in.
+#
+# Usage:
+# results = ScenarioResults()
+# results.append('epbuses', ids, gust_mph, threshold_mph, failed)
+# results.save('Ivan_adv53_results.npz')
+# columns = loadScenarioResults('Ivan_adv53_results.npz')
+# print columns['asset'][columns['failed']]
+
+import struct
+import zipfile
+import numpy as np
+
+RESULT_COLUMNS = ('layer', 'asset', 'intensity', 'threshold', 'failed')
+
+# Text as fixed-width UTF-8 bytes
+def textColumn(values):
+    values = np.asarray(values)
+    if (values.dtype.kind == 'S'):
+        return values
+    return np.char.encode(values.astype(np.unicode_), 'utf-8')
+
+class ScenarioResults(object):
+    def __init__(self):
+        self.layers = []        # one array per append, joined by columns()
+        self.assets = []
+        self.intensities = []
+        self.thresholds = []
+        self.failed = []
+        self.pending = []       # rows given one at a time by addRow, not yet appended
+
+    # Rows of the assets of one layer; intensity, threshold and failed may also be single values for all of them
+    def append(self, layer, assets, intensity, threshold, failed):
+        self.appendPending()
+        self.appendRows(layer, assets, intensity, threshold, failed)
+
+    # One row, as an asset is assessed
+    def addRow(self, layer, asset, intensity, threshold, failed):
+        self.pending.append((layer, asset, intensity, threshold, failed))
+
+    def appendPending(self):
+        if (len(self.pending) == 0):
+            return
+        layers, assets, intensities, thresholds, failed = zip(*self.pending)
+        self.pending = []
+        self.appendRows(layers, assets, intensities, thresholds, failed)
+
+    def appendRows(self, layer, assets, intensity, threshold, failed):
+        assets = textColumn(assets).reshape(-1)
+        n = len(assets)
+        self.layers.append(textColumn([layer] * n) if (np.ndim(layer) == 0) else textColumn(layer))
+        self.assets.append(assets)
+        self.intensities.append(np.array(np.broadcast_to(np.asarray(intensity, dtype=float), (n,))))
+        self.thresholds.append(np.array(np.broadcast_to(np.asarray(threshold, dtype=float), (n,))))
+        self.failed.append(np.array(np.broadcast_to(np.asarray(failed, dtype=bool), (n,))))
+
+    def __len__(self):
+        return sum([len(a) for a in self.assets]) + len(self.pending)
+
+    def columns(self):
+        self.appendPending()
+        if (len(self.assets) == 0):
+            return {'layer': np.zeros(0, dtype='S1'), 'asset': np.zeros(0, dtype='S1'),
+                    'intensity': np.zeros(0), 'threshold': np.zeros(0), 'failed': np.zeros(0, dtype=bool)}
+        return {'layer': np.concatenate(self.layers),
+                'asset': np.concatenate(self.assets),
+                'intensity': np.concatenate(self.intensities),
+                'threshold': np.concatenate(self.thresholds),
+                'failed': np.concatenate(self.failed)}
+
+    # The columns as they are, to be memory-mapped by loadScenarioResults; compressed=True to deflate them instead
+    def save(self, filename, compressed = False):
+        if (compressed):
+            np.savez_compressed(filename, **self.columns())
+        else:
+            np.savez(filename, **self.columns())
+
+# Columns of a run saved by ScenarioResults.save, by name.
+# With mmap, the columns stored uncompressed are read-only np.memmap views of the file; compressed ones are read in.
+def loadScenarioResults(filename, mmap = True):
+    columns = {}
+    archive = zipfile.ZipFile(filename)
+    for info in archive.infolist():
+        name = info.filename[:-4] if (info.filename.endswith('.npy')) else info.filename
+        if (mmap and info.compress_type == zipfile.ZIP_STORED):
+            columns[name] = memmapMember(filename, info)
+        else:
+            member = archive.open(info)
+            columns[name] = np.lib.format.read_array(member, allow_pickle=False)
+            member.close()
+    archive.close()
+    return columns
+
+# The .npy array of an uncompressed archive member, mapped where its data starts in the archive
+def memmapMember(filename, info):
+    archivefile = open(filename, 'rb')
+    archivefile.seek(info.header_offset)
+    localHeader = archivefile.read(30)         # zip local file header, followed by the name and extra fields
+    nameLength, extraLength = struct.unpack('<HH', localHeader[26:30])
+    archivefile.seek(info.header_offset + 30 + nameLength + extraLength)
+    version = np.lib.format.read_magic(archivefile)
+    if (version == (1, 0)):
+        shape, fortranOrder, dtype = np.lib.format.read_array_header_1_0(archivefile)
+    else:
+        shape, fortranOrder, dtype = np.lib.format.read_array_header_2_0(archivefile)
+    offset = archivefile.tell()
+    archivefile.close()
+    if (int(np.prod(shape)) == 0):
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape,
+                     order='F' if (fortranOrder) else 'C')
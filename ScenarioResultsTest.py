@@ -0,0 +1,84 @@
+# Saving and loading the columnar results of a scenario run (ScenarioResults.py)
+#   the outage of the IFFpackage buses and lines, as written to their *_analyzed shapefiles, saved as a results archive
+#   compressed archives are read in, uncompressed ones are memory-mapped; both give back the rows in the order given
+# Run from the repository directory: python ScenarioResultsTest.py
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import shapefile
+
+from TestReport import check, report
+from ScenarioResults import ScenarioResults, loadScenarioResults, RESULT_COLUMNS
+
+def sameColumns(a, b):
+    return sorted(a) == sorted(b) and all([a[name].dtype == b[name].dtype and np.array_equal(a[name], b[name]) for name in a])
+
+# Rows of the analyzed layers: the outage field is 'True' for the failed assets
+def analyzedRows(layers):
+    rows = []
+    for layer in layers:
+        reader = shapefile.Reader(datadir + '/' + layer + '_analyzed')
+        outage = [str(record[-1]).strip() == 'True' for record in reader.records()]
+        for n, failed in enumerate(outage):
+            rows.append((layer, u'%s %d' % (layer, n), 100.0 + n, 120.0 + 0.5 * n, failed))
+    return rows
+
+def testRoundTrip(directory, rows):
+    results = ScenarioResults()
+    layers = sorted(set([row[0] for row in rows]))
+    for layer in layers:                # one append per layer, as FailureAnalyses does
+        layerRows = [row for row in rows if row[0] == layer]
+        results.append(layer, [row[1] for row in layerRows], [row[2] for row in layerRows],
+                       [row[3] for row in layerRows], [row[4] for row in layerRows])
+    columns = results.columns()
+    check('ScenarioResults columns hold every row', len(results) == len(rows) and
+          columns['failed'].sum() == sum([row[4] for row in rows]),
+          '(%d rows, %d failed)' % (len(rows), columns['failed'].sum()))
+
+    rowByRow = ScenarioResults()
+    for row in rows:                    # one addRow per asset, as CoupledContext does
+        rowByRow.addRow(*row)
+    check('addRow gives the same columns as append', sameColumns(columns, rowByRow.columns()))
+
+    mixed = ScenarioResults()
+    mixed.addRow(*rows[0])
+    mixed.append(rows[1][0], [rows[1][1]], rows[1][2], rows[1][3], rows[1][4])
+    mixed.addRow(*rows[2])
+    check('addRow and append keep the order of the rows', mixed.columns()['asset'].tolist() == [row[1].encode('utf-8') for row in rows[:3]])
+
+    compressedname = os.path.join(directory, 'Ivan_results.npz')
+    results.save(compressedname, compressed=True)
+    loaded = loadScenarioResults(compressedname)
+    check('compressed archive read back', sameColumns(columns, loaded) and
+          not any([isinstance(loaded[name], np.memmap) for name in loaded]), '(%d bytes)' % os.path.getsize(compressedname))
+
+    plainname = os.path.join(directory, 'Ivan_results_plain.npz')
+    results.save(plainname)
+    mapped = loadScenarioResults(plainname)
+    check('uncompressed archive memory-mapped', sameColumns(columns, dict([(name, np.array(mapped[name])) for name in mapped])) and
+          all([isinstance(mapped[name], np.memmap) for name in RESULT_COLUMNS]), '(%d bytes)' % os.path.getsize(plainname))
+    readIn = loadScenarioResults(plainname, mmap=False)
+    check('uncompressed archive read in without mmap', sameColumns(columns, readIn))
+    check('np.load reads the archives without pickle',
+          sameColumns(columns, dict(np.load(compressedname, allow_pickle=False))) and
+          sameColumns(columns, dict(np.load(plainname, allow_pickle=False))))
+    del mapped
+
+    emptyname = os.path.join(directory, 'empty_results.npz')
+    ScenarioResults().save(emptyname)
+    empty = loadScenarioResults(emptyname)
+    check('empty results saved and loaded', sorted(empty) == sorted(RESULT_COLUMNS) and all([len(empty[name]) == 0 for name in empty]))
+
+# Test data files
+datadir = 'IFFpackage'
+
+# Run tests
+directory = tempfile.mkdtemp()
+try:
+    testRoundTrip(directory, analyzedRows(['buses', 'lines', 'ngpp_draft_FL']))
+finally:
+    shutil.rmtree(directory)
+
+report()
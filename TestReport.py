@@ -0,0 +1,21 @@
+# Checks of the *Test.py scripts that compare the fast kernels with the legacy code
+#   check()     prints one line per check, and remembers the checks that failed
+#   report()    prints the number of mismatches, and exits with status 1 if there was any
+#
+# Usage:
+# from TestReport import check, report
+# check('pointsInPolygon vs point_in_poly', np.array_equal(legacy, batch), '(%d points)' % len(x))
+# report()
+
+import sys
+
+failures = []
+
+def check(name, ok, detail=''):
+    print '%-60s %s %s' % (name, 'ok' if ok else 'MISMATCH', detail)
+    if (not ok):
+        failures.append(name)
+
+def report():
+    print '%d mismatches' % len(failures)
+    sys.exit(1 if failures else 0)
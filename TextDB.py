@@ -0,0 +1,94 @@
+# Compiled cache of the text databases (fragilities, assets, disasters)
+#   +loadTextDB() returns the arrays a parse function builds from a text DB, parsing the text only when it changed
+# The arrays are saved next to the text file (<filename>.cache, a NumPy .npz archive read without pickle),
+# together with the modification time, size and sha1 hash of the text, and a format key: the kind of parse
+# and the hash of the source of the module that defines the parse function. A later load with the same format,
+# mtime and size, or with the same hash (the file was only touched or copied), reads the arrays back without
+# parsing. Any other change of the text, or of the parser, compiles the file again.
+#   +collectorPaused() pauses garbage collection while the caller turns the arrays into many objects
+
+import os
+import gc
+import sys
+import inspect
+import hashlib
+import zipfile
+import numpy as np
+
+cacheEnabled = True     # set to False to always parse the text
+
+def fileDigest(filename):
+    sha = hashlib.sha1()
+    textfile = open(filename, 'rb')
+    for chunk in iter(lambda: textfile.read(1 << 20), b''):
+        sha.update(chunk)
+    textfile.close()
+    return sha.hexdigest()
+
+# The collector is paused while many objects are created at once: none of them is garbage yet,
+# and the full collections it would run again and again can take longer than the load itself
+class collectorPaused(object):
+    def __enter__(self):
+        self.enabled = gc.isenabled()
+        gc.disable()
+    def __exit__(self, *exc):
+        if (self.enabled):
+            gc.enable()
+
+# Format key of the caches written for kind by parse: any edit of the module of the parser rebuilds them
+parserDigests = dict()      # sha1 of the source of each parser module, by file name
+
+def parserFormat(kind, parse):
+    try:
+        sourcename = inspect.getsourcefile(parse)
+    except TypeError:
+        sourcename = None
+    if (sourcename == None):
+        return '%s %s.%s' % (kind, parse.__module__, parse.__name__)
+    if (sourcename not in parserDigests):
+        parserDigests[sourcename] = fileDigest(sourcename)
+    return '%s %s.%s %s' % (kind, parse.__module__, parse.__name__, parserDigests[sourcename])
+
+# kind names what parse builds (e.g. 'assets'); parse(filename) returns a dict of NumPy arrays (no object arrays)
+def loadTextDB(filename, kind, parse):
+    if (not cacheEnabled):
+        return parse(filename)
+
+    cachename = filename + '.cache'
+    cacheformat = parserFormat(kind, parse)
+    stat = os.stat(filename)
+    if (os.path.exists(cachename)):
+        try:
+            with np.load(cachename, allow_pickle=False) as cache:
+                if (str(cache['__format__']) == cacheformat):
+                    fresh = (float(cache['__mtime__']) == stat.st_mtime and int(cache['__size__']) == stat.st_size)
+                    digest = None
+                    if (not fresh):
+                        digest = fileDigest(filename)
+                    if (fresh or str(cache['__digest__']) == digest):
+                        arrays = dict([(name, cache[name]) for name in cache.files if not name.startswith('__')])
+                        if (not fresh):
+                            saveTextDB(cachename, cacheformat, stat, digest, arrays)    # remember the new mtime
+                        return arrays
+        except (IOError, OSError, EOFError, ValueError, KeyError, zipfile.BadZipfile) as error:
+            sys.stderr.write('Ignoring unreadable cache %s: %s\n' % (cachename, error))
+
+    digest = fileDigest(filename)
+    arrays = parse(filename)
+    saveTextDB(cachename, cacheformat, stat, digest, arrays)
+    return arrays
+
+# written to a temporary file first, so that a reader never sees half a cache
+def saveTextDB(cachename, cacheformat, stat, digest, arrays):
+    header = {'__format__': np.array(cacheformat), '__digest__': np.array(digest),
+              '__mtime__': np.array(stat.st_mtime, dtype=float), '__size__': np.array(stat.st_size, dtype=np.int64)}
+    header.update(arrays)
+    tempname = cachename + '.tmp'
+    try:
+        with open(tempname, 'wb') as cachefile:
+            np.savez(cachefile, **header)
+        os.rename(tempname, cachename)
+    except (IOError, OSError, ValueError) as error:
+        sys.stderr.write('Could not write cache %s: %s\n' % (cachename, error))
+        if (os.path.exists(tempname)):
+            os.remove(tempname)
@@ -0,0 +1,216 @@
+# Comparing the compiled text DB cache (TextDB.py) with the legacy line-by-line parsers
+#   fragilities: HurricaneFragilityDB.txt, plus Lognormal and Threshold entries, read with and without the cache
+#   assets: a DB written from the IFFpackage buses, read by the legacy AssetList loop, by AssetList and by AssetTable
+#   the cache: reused while the text is the same, rebuilt when the text changes, ignored when it is unreadable
+# Run from the repository directory: python TextDBTest.py
+
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+import shapefile
+
+import TextDB
+from TextDB import loadTextDB
+from Fragility import FragilityList, fitLognormalFragility
+from TestReport import check, report
+from Asset import Asset, AssetList, AssetTable
+
+# Legacy loop of AssetList.appendAssetTypesFromFile: one Asset per entry, configured from its lines
+def legacyAssets(filename):
+    entries = dict()
+    assetFile = open(filename,'r')
+    linesoftext = assetFile.readlines()
+    assetFile.close()
+    startLine = -1
+    for lineNumber in range(len(linesoftext)):
+        keyvalue = linesoftext[lineNumber].split('=')
+        keyword = keyvalue[0].strip().lower()
+        if (keyword == 'version'):              # begins entry configuration section
+            startLine = lineNumber
+        elif (keyword == 'name'):
+            name = keyvalue[1].strip().strip("'")  # key for asset dict
+        elif (keyword == 'end'):                # ends entry configuration section
+            entries[name] = Asset()
+            entries[name].configureFromTextLines(linesoftext,startLine,lineNumber)
+    return entries
+
+# What configure() read into a fragility and its curves
+def fragilityState(fragility):
+    state = dict([(a, v) for a, v in vars(fragility).items() if a not in ('curves', 'tempcurve', 'disasterObj')])
+    state['type'] = type(fragility).__name__
+    state['curves'] = [(c.name, c.cnum, c.nPoints, list(c.x), list(c.y)) for c in getattr(fragility, 'curves', [])]
+    return state
+
+def sameFragilities(a, b):
+    return sorted(a.entries) == sorted(b.entries) and \
+        all([fragilityState(a.entries[fclass]) == fragilityState(b.entries[fclass]) for fclass in a.entries])
+
+def assetRecord(asset):
+    record = asset.toRecord()
+    return record[:7] + (tuple(sorted(record[7])),)
+
+def writeFragilityDB(filename):
+    text = open('HurricaneFragilityDB.txt', 'rb').read()
+    TextDB.cacheEnabled = False         # no cache left next to the DB of the repository
+    fragilities = FragilityList()
+    fragilities.appendFragilityTypesFromFile('HurricaneFragilityDB.txt', 'WindCurves')
+    TextDB.cacheEnabled = True
+    lognormal = [fitLognormalFragility(fragilities.entries[fclass]).toTextLines() for fclass in sorted(fragilities.entries)]
+    f = open(filename, 'wb')
+    f.write(text.replace(b"Version = 'Hereld_2015-07-27'", b"Version = 'Hereld_2015-07-27'\r\nFragility Type = 'WindCurves'"))
+    f.write('\n'.join(['\n'.join(lines) for lines in lognormal]) + '\n\n')
+    f.write("Version = 'Hereld_2015-07-27'\nDate = '2015-08-24'\nFragility Class = 'Flood_Substation'\n"
+            "Fragility Type = 'Threshold'\nThreshold = 4.5\nUnits = 'ft'\nEnd\n")
+    f.close()
+
+def writeAssetDB(filename, buses):
+    f = open(filename, 'w')
+    for n, shape in enumerate(buses.shapes()):
+        lon, lat = shape.points[0]
+        f.write("Version = 'Hereld_2015-07-27'\nDate = '2015-08-24'\nName = 'bus%d'\nDescription = 'substation'\n"
+                "Asset Class = 'Substation'\n" % (n % 50))     # names bus0..bus13 are given twice: the last one wins
+        if (n % 3 == 0):
+            f.write('Latitude = %f\nLongitude = %f\n' % (lat, lon))
+        else:
+            f.write('LatLong = %f %f\n' % (lat, lon))
+        f.write('Roughness = %.2f\n' % (0.03 + 0.01 * (n % 7)))
+        f.write('Fragility Class = Wind:WindCurves' + (', Flood:Threshold\n' if (n % 4 == 0) else '\n'))
+        f.write('End\n\n')
+    f.close()
+
+def testFragilities(filename):
+    TextDB.cacheEnabled = False
+    direct = FragilityList()
+    direct.appendFragilityTypesFromFile(filename, 'WindCurves')
+    TextDB.cacheEnabled = True
+    compiled = FragilityList()
+    compiled.appendFragilityTypesFromFile(filename, 'WindCurves')
+    check('fragility cache written', os.path.exists(filename + '.cache'))
+    cached = FragilityList()
+    cached.appendFragilityTypesFromFile(filename, 'WindCurves')
+    types = sorted(set([type(f).__name__ for f in direct.entries.values()]))
+    check('fragilities parsed vs compiled', sameFragilities(direct, compiled), '(%d classes: %s)' % (len(direct.entries), ', '.join(types)))
+    check('fragilities parsed vs read from the cache', sameFragilities(direct, cached))
+    for fclass in sorted(direct.entries):
+        if (hasattr(direct.entries[fclass], 'MPHfromZoLossRatio')):
+            Zo = np.array([0.03, 0.2, 0.35, 0.7, 1.0])
+            check('thresholds of %s from the cache' % fclass,
+                  np.array_equal(direct.entries[fclass].MPHfromZoLossRatio(Zo, 0.5), cached.entries[fclass].MPHfromZoLossRatio(Zo, 0.5)))
+
+def testAssets(filename):
+    legacy = legacyAssets(filename)
+    TextDB.cacheEnabled = True
+    assets = AssetList()
+    assets.appendAssetTypesFromFile(filename)
+    cached = AssetList()
+    cached.appendAssetTypesFromFile(filename)
+    check('AssetList vs the legacy parser', sorted(legacy) == sorted(assets.entries) and
+          all([assetRecord(legacy[name]) == assetRecord(assets.entries[name]) for name in legacy]), '(%d assets)' % len(legacy))
+    check('AssetList read from the cache vs the legacy parser', sorted(legacy) == sorted(cached.entries) and
+          all([assetRecord(legacy[name]) == assetRecord(cached.entries[name]) for name in legacy]))
+
+    table = AssetTable()
+    table.appendAssetTypesFromFile(filename)
+    names = sorted(legacy)
+    rows = [table.rowOfName[name] for name in names]
+    check('AssetTable vs the legacy parser', sorted(table.names.tolist()) == names and
+          np.array_equal(table.lats[rows], [legacy[name].geometry[0] for name in names]) and
+          np.array_equal(table.lons[rows], [legacy[name].geometry[1] for name in names]) and
+          np.array_equal(table.Zo[rows], [legacy[name].Zo for name in names]) and
+          all([table.classNames[table.classCodes[r]] == legacy[name].assetClassName for r, name in zip(rows, names)]) and
+          all([tuple(sorted(table.fragilityClasses[table.fragilityCodes[r]])) == assetRecord(legacy[name])[7]
+               for r, name in zip(rows, names)]))
+
+# The fragilities an AssetTable row is assessed with, for each kind of Fragility Class line
+def testFragilitiesOf(filename):
+    fragilities = FragilityList()
+    fragilities.appendFragilityTypesFromFile(filename, 'WindCurves')
+    table = AssetTable()
+    table.appendRecords([(name, ('Hereld_2015-07-27', '2015-08-24', name, '', 'Substation', (30.0, -85.0), 0.03, pairs))
+                         for name, pairs in (('none', ()),
+                                             ('type', (('Wind', 'WindCurves'),)),
+                                             ('class', (('Wind', 'Hurricane_IndNoReinMEA'),)),
+                                             ('flood', (('Flood', 'WindCurves'),)),
+                                             ('unknown', (('Wind', 'Hurricane_NoSuchClass'),)))])
+    table.fragilities = fragilities
+    curves = sorted([fclass for fclass, f in fragilities.entries.items() if type(f).__name__ == 'WindFragilityCurve'])
+    check('fragilitiesOf an asset without a Fragility Class line: all of them',
+          sorted(table.row('none').fragilities.entries) == sorted(fragilities.entries))
+    check('fragilitiesOf a fragility type', sorted(table.row('type').fragilities.entries) == curves, '(%d classes)' % len(curves))
+    check('fragilitiesOf a fragility class', sorted(table.row('class').fragilities.entries) == ['Hurricane_IndNoReinMEA'])
+    check('fragilitiesOf a fragility type of another disaster', len(table.row('flood').fragilities.entries) == 0)
+    try:
+        table.row('unknown').fragilities
+        check('fragilitiesOf an unknown name raises KeyError', False)
+    except KeyError:
+        check('fragilitiesOf an unknown name raises KeyError', True)
+
+# Reads the asset names only, and counts the parses, to tell a cache hit from a rebuild
+parses = []
+def countedParse(filename):
+    parses.append(filename)
+    textfile = open(filename, 'r')
+    names = [line.split('=')[1].strip().strip("'") for line in textfile if line.split('=')[0].strip().lower() == 'name']
+    textfile.close()
+    return {'key': np.array(names)}
+
+def testCache(filename):
+    TextDB.cacheEnabled = True
+    if (os.path.exists(filename + '.cache')):
+        os.remove(filename + '.cache')
+    first = loadTextDB(filename, 'assets test', countedParse)
+    second = loadTextDB(filename, 'assets test', countedParse)
+    check('cache reused while the text is unchanged', len(parses) == 1 and
+          all([np.array_equal(first[name], second[name]) for name in first]))
+
+    stat = os.stat(filename)
+    os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+    loadTextDB(filename, 'assets test', countedParse)
+    check('cache reused when the text is only touched', len(parses) == 1)
+
+    f = open(filename, 'a')
+    f.write("Version = 'Hereld_2015-07-27'\nName = 'extra'\nLatLong = 30.0 -85.0\nEnd\n")
+    f.close()
+    changed = loadTextDB(filename, 'assets test', countedParse)
+    check('cache rebuilt when the text changes', len(parses) == 2 and 'extra' in changed['key'].tolist())
+
+    f = open(filename + '.cache', 'wb')
+    f.write(b'not an npz archive')
+    f.close()
+    stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+    try:
+        corrupt = loadTextDB(filename, 'assets test', countedParse)
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+    check('unreadable cache ignored and rebuilt', len(parses) == 3 and
+          all([np.array_equal(changed[name], corrupt[name]) for name in changed]))
+
+    loadTextDB(filename, 'assets other', countedParse)
+    check('cache rebuilt for another kind of parse', len(parses) == 4)
+
+    TextDB.cacheEnabled = False
+    loadTextDB(filename, 'assets other', countedParse)
+    check('text parsed when the cache is disabled', len(parses) == 5)
+    TextDB.cacheEnabled = True
+
+# Test data files
+datadir = 'IFFpackage'
+buses = shapefile.Reader(datadir + '/buses')
+
+# Run tests
+directory = tempfile.mkdtemp()
+try:
+    writeFragilityDB(os.path.join(directory, 'FragilityDB.txt'))
+    writeAssetDB(os.path.join(directory, 'Assets.txt'), buses)
+    testFragilities(os.path.join(directory, 'FragilityDB.txt'))
+    testAssets(os.path.join(directory, 'Assets.txt'))
+    testFragilitiesOf(os.path.join(directory, 'FragilityDB.txt'))
+    testCache(os.path.join(directory, 'Assets.txt'))
+finally:
+    shutil.rmtree(directory)
+
+report()